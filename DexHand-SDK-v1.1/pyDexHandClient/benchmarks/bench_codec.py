@@ -0,0 +1,50 @@
+"""
+Encode/decode cost of DexHand messages in the JSON and the binary wire format.
+
+Usage:
+    python bench_codec.py [count]
+"""
+
+import json
+import os
+import sys
+import time
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from dexhand_client import ClientCodec
+from standin_server import HAND_DATA, encode_hand_json, encode_tac3d_json, make_tac3d_frame
+
+
+def timeit(func, count):
+    t0 = time.perf_counter()
+    for _ in range(count):
+        func()
+    return (time.perf_counter() - t0) / count * 1e6
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    frame = make_tac3d_frame()
+    messages = {
+        "hand": (
+            lambda: encode_hand_json(HAND_DATA, time.time()),
+            lambda: ClientCodec.encode_hand_data(HAND_DATA, time.time()),
+        ),
+        "tac3d": (
+            lambda: encode_tac3d_json("HDL1-0003", frame, time.time()),
+            lambda: ClientCodec.encode_tac3d_data("HDL1-0003", frame, time.time()),
+        ),
+        "command": (
+            lambda: json.dumps(
+                {"Time": time.time(), "Command": {"Device": "Hand", "Type": "PosServo", "args": {"goal_pos": 10.0, "max_f": 1.0}, "TaskID": 1}}
+            ).encode(),
+            lambda: ClientCodec.encode_command("Hand", "PosServo", 1, time.time(), goal_pos=10.0, max_f=1.0),
+        ),
+    }
+    print(f"{'message':8s} {'format':7s} {'size/B':>8s} {'encode/us':>10s} {'decode/us':>10s}")
+    for name, encoders in messages.items():
+        for wire_format, encode in zip(("json", "binary"), encoders):
+            raw = encode()
+            enc = timeit(encode, count)
+            dec = timeit(lambda: ClientCodec.decode_msg(raw), count)
+            print(f"{name:8s} {wire_format:7s} {len(raw):8d} {enc:10.1f} {dec:10.1f}")
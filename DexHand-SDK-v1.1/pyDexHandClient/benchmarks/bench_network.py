@@ -0,0 +1,108 @@
+"""
+Stress test of the client stack (task manager, heartbeat and telemetry path) under emulated network
+conditions. The stand-in server (standin_server.py) runs as a separate process and publishes 200 Hz
+telemetry on the multicast group, like the real server.
+
+For every case the command round trip, lost commands, the received telemetry rate (counted over a
+fixed window of RATE_WINDOW seconds) and the heartbeat metrics are reported.
+
+Usage:
+    python bench_network.py [count]
+"""
+
+import os
+import socket
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from dexhand_client import DexHandClient
+
+# (latency, jitter, loss)
+CASES = [
+    (0.0, 0.0, 0.0),
+    (0.002, 0.001, 0.0),
+    (0.0, 0.0, 0.01),
+    (0.005, 0.005, 0.02),
+]
+
+RATE_WINDOW = 1.0  # window over which the telemetry rate is counted (in s)
+
+
+def free_port():
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(("127.0.0.1", 0))
+    port = sock.getsockname()[1]
+    sock.close()
+    return port
+
+
+def run_case(latency, jitter, loss, count):
+    port = free_port()
+    server = subprocess.Popen(
+        [
+            sys.executable,
+            os.path.join(os.path.dirname(os.path.abspath(__file__)), "standin_server.py"),
+            "--port", str(port),
+            "--multicast",
+            "--latency", str(latency),
+            "--jitter", str(jitter),
+            "--loss", str(loss),
+        ],
+        stdout=subprocess.DEVNULL,
+    )
+    time.sleep(0.5)
+    client = DexHandClient(ip="127.0.0.1", port=port, ignore_myself=True)
+    client.logger.console_logger.setLevel(40)
+    # a lost reply would otherwise stall the benchmark for a full second
+    client.task_manager.SEND_TIMEOUT = 0.1
+    try:
+        client.start_server()
+        client.acquire_hand()
+        frames = client.hand_info._frame_cnt
+        t0 = time.perf_counter()
+        time.sleep(RATE_WINDOW)
+        data_rate = (client.hand_info._frame_cnt - frames) / (time.perf_counter() - t0)
+        latency_us = []
+        failed = 0
+        for _ in range(count):
+            t = time.perf_counter()
+            if client.pos_servo(10.0) == 1:
+                latency_us.append((time.perf_counter() - t) * 1e6)
+            else:
+                failed += 1
+        heartbeat = client.heartbeat.stats()
+        tasks = client.task_manager.stats()
+    finally:
+        client.heartbeat.stop()
+        server.terminate()
+        server.wait()
+    latency_us = np.array(latency_us) if latency_us else np.array([np.nan])
+    return {
+        "p50": np.percentile(latency_us, 50),
+        "p99": np.percentile(latency_us, 99),
+        "failed": failed,
+        "data_rate": data_rate,
+        "hb_misses": heartbeat["misses"],
+        "hb_jitter_max": (heartbeat["jitter_max"] or 0.0) * 1e3,
+        "timeouts": heartbeat["timeouts"],
+        "late": tasks["late"],
+    }
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+    print(
+        f"{'latency/jitter/loss':22s} {'p50 (us)':>10s} {'p99 (us)':>10s} {'failed':>7s} {'data (Hz)':>10s} "
+        f"{'hb miss':>8s} {'hb jit (ms)':>12s} {'timeouts':>9s} {'late':>5s}"
+    )
+    for latency, jitter, loss in CASES:
+        r = run_case(latency, jitter, loss, count)
+        name = f"{latency * 1e3:.0f}ms/{jitter * 1e3:.0f}ms/{loss * 100:.0f}%"
+        print(
+            f"{name:22s} {r['p50']:10.1f} {r['p99']:10.1f} {r['failed']:7d} {r['data_rate']:10.1f} "
+            f"{r['hb_misses']:8d} {r['hb_jitter_max']:12.2f} {r['timeouts']:9d} {r['late']:5d}"
+        )
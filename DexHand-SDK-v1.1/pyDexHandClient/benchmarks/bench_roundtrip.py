@@ -0,0 +1,61 @@
+"""
+Command round-trip latency of DexHandClient against a local stand-in server.
+
+The stand-in server (standin_server.py) answers every command with TASK_START
+and, for blocking commands, TASK_SUCCEED. It also sends hand data frames so
+that the client's heartbeat watchdog stays quiet.
+
+Usage:
+    python bench_roundtrip.py [count] [json|binary]
+"""
+
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from dexhand_client import DexHandClient
+from standin_server import StandInServer
+
+
+def measure(func, count):
+    latency = []
+    failed = 0
+    for i in range(count):
+        t0 = time.perf_counter()
+        ret = func()
+        if ret == 1:
+            latency.append(time.perf_counter() - t0)
+        else:
+            failed += 1
+    return np.array(latency) * 1e6, failed
+
+
+def report(name, result):
+    latency, failed = result
+    print(
+        f"{name:12s} p50 {np.percentile(latency, 50):8.1f} us   p99 {np.percentile(latency, 99):8.1f} us   "
+        f"max {latency.max():8.1f} us   failed/lost {failed}"
+    )
+
+
+if __name__ == "__main__":
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    wire_format = sys.argv[2] if len(sys.argv) > 2 else "json"
+    server = StandInServer()
+    client = DexHandClient(ip=server.addr[0], port=server.addr[1], ignore_myself=True, wire_format=wire_format)
+    client.logger.console_logger.setLevel(30)
+
+    # warm up and let the stand-in server learn the client address
+    client.start_server()
+    time.sleep(0.1)
+    # a lost reply would otherwise stall the benchmark for a full second
+    client.task_manager.SEND_TIMEOUT = 0.05
+
+    report("pos_goto", measure(lambda: client.pos_goto(10.0), count))
+    report("pos_servo", measure(lambda: client.pos_servo(10.0), count))
+    report("grasp", measure(lambda: client.grasp(1.0, 0.0), count))
+    print("task table:", client.task_manager.stats())
+    server.close()
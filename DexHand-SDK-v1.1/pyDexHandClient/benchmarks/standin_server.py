@@ -0,0 +1,384 @@
+"""
+Local stand-in for the DexHand server, for load and latency testing of dexhand_client on loopback.
+
+It speaks the JSON command protocol of the `Server` and `Hand` devices: every command is answered
+with TASK_START and, for blocking commands, TASK_UPDATE / TASK_SUCCEED (or TASK_FAILED when
+interrupted by `Halt`). Hand telemetry (and optionally relayed Tac3D frames) is published at
+`data_rate` Hz, either on a multicast group like the real server or by unicast to every client
+which has sent a command. A client asking for the binary wire format in `start_server()` gets
+replies and data in that format.
+
+Network conditions can be emulated: `latency` and `jitter` delay every packet sent by the server,
+and `loss` drops incoming and outgoing packets at random.
+
+Usage:
+    python standin_server.py [--port 60031] [--rate 200] [--multicast] [--latency 0.002]
+                             [--jitter 0.001] [--loss 0.01] [--task-time 0.5] [--tac3d SN ...]
+"""
+
+import argparse
+import copy
+import heapq
+import json
+import os
+import random
+import socket
+import sys
+import threading
+import time
+
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from dexhand_client import ClientCodec
+from dexhand_client.ClientService import ServiceTaskManager
+
+# commands answered with TASK_START only (the client only waits for the task copy)
+SERVO_COMMANDS = ["PosServo", "ForceServo", "Impedance", "SetSpeed", "SetPIDParam", "SwitchKMode", "ClearError"]
+# blocking commands which take `task_time` to finish; the others succeed at once
+MOTION_COMMANDS = ["SetHome", "CalibrateZero", "Contact", "Grasp", "Goto"]
+
+HAND_DATA = {
+    "now_pos": 0.0,
+    "goal_pos": 0.0,
+    "now_speed": 0.0,
+    "goal_speed": 0.0,
+    "now_current": 0.0,
+    "goal_current": 0.0,
+    "task_info": {"now_task": "Idle", "recent_task": "Idle", "recent_task_status": 0, "error_flag": 0},
+    "now_force": [0.0, 0.0],
+    "avg_force": 0.0,
+    "goal_force": 0.0,
+    "stiffness": 0.0,
+    "imu_acc": [0.0, 0.0, 0.0],
+    "imu_gyr": [0.0, 0.0, 0.0],
+    "is_contact": [False, False],
+}
+
+
+def make_tac3d_frame(n=400):
+    return {
+        "3D_Positions": np.random.rand(n, 3).astype(np.float32),
+        "3D_Displacements": np.random.rand(n, 3).astype(np.float32),
+        "3D_Forces": np.random.rand(n, 3).astype(np.float32),
+        "3D_ResultantForce": np.random.rand(1, 3).astype(np.float32),
+        "3D_ResultantMoment": np.random.rand(1, 3).astype(np.float32),
+    }
+
+
+def encode_hand_json(data, send_time):
+    return json.dumps({"Type": "Data", "Device": "Hand", "Time": send_time, "Data": data}).encode()
+
+
+def encode_tac3d_json(SN, frame, send_time):
+    frame = {name: np.round(value.astype(np.float64), 4).tolist() for name, value in frame.items()}
+    return json.dumps({"Type": "Data", "Device": "Tac3D", "Time": send_time, "SN": SN, "Data": frame}).encode()
+
+
+class StandInServer:
+    def __init__(
+        self,
+        ip="127.0.0.1",
+        port=0,
+        data_rate=200.0,
+        tac3d_SNs=(),
+        multicast=False,
+        group="224.0.2.100",
+        group_port=60031,
+        latency=0.0,
+        jitter=0.0,
+        loss=0.0,
+        task_time=0.0,
+        seed=None,
+    ):
+        """
+        Parameters:
+        ---
+            - ip, port: address to listen for commands on (port 0 picks a free port, see `self.addr`)
+            - data_rate: telemetry rate (in Hz)
+            - tac3d_SNs: SNs of the Tac3D sensors whose frames are relayed with the hand data
+            - multicast: publish telemetry on `group:group_port` instead of unicast to every client
+            - latency, jitter: every packet sent is delayed by `latency + uniform(0, jitter)` (in s)
+            - loss: probability that an incoming or outgoing packet is dropped
+            - task_time: running time of motion commands such as `Goto` or `Grasp` (in s)
+            - seed: seed of the random generator used for jitter and loss
+        """
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind((ip, port))
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 212992)
+        self.sock.settimeout(0.1)  # lets the serve thread notice close()
+        self.addr = self.sock.getsockname()
+        self.data_interval = 1.0 / data_rate
+        self.tac3d_SNs = list(tac3d_SNs)
+        self.tac3d_frame = make_tac3d_frame()
+        self.clients = {}  # address -> wire format
+        self.hand = copy.deepcopy(HAND_DATA)
+        self.latency = latency
+        self.jitter = jitter
+        self.loss = loss
+        self.task_time = task_time
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._tasks = {}  # (address, task ID) -> [device, finish time, update sent]
+        self.counters = {"commands": 0, "replies": 0, "data": 0, "dropped_in": 0, "dropped_out": 0, "delayed": 0}
+
+        self.group_addr = None
+        if multicast:
+            self.group_addr = (group, group_port)
+            self.mc_sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            self.mc_sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_TTL, 2)
+            self.mc_sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_LOOP, 1)
+            if ip not in ("", "0.0.0.0"):
+                self.mc_sock.setsockopt(socket.IPPROTO_IP, socket.IP_MULTICAST_IF, socket.inet_aton(ip))
+
+        self._delayed = []  # heap of (due time, sequence, socket, packet, address)
+        self._delay_seq = 0
+        self._delay_cond = threading.Condition(self._lock)
+
+        self.running = True
+        self.thread = threading.Thread(target=self._serve, daemon=True)
+        self.thread.start()
+        self.data_thread = threading.Thread(target=self._send_data, daemon=True)
+        self.data_thread.start()
+        self.delay_thread = threading.Thread(target=self._send_delayed, daemon=True)
+        self.delay_thread.start()
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self.counters)
+            stats["clients"] = len(self.clients)
+            stats["running_tasks"] = len(self._tasks)
+            return stats
+
+    def close(self):
+        self.running = False
+        with self._delay_cond:
+            self._delay_cond.notify_all()
+        for thread in (self.thread, self.data_thread, self.delay_thread):
+            if thread is not threading.current_thread():
+                thread.join()
+        self.sock.close()
+        if self.group_addr is not None:
+            self.mc_sock.close()
+
+    ####################################################################
+    #####                                                          #####
+    #####               Belows are private functions.              #####
+    #####                                                          #####
+    ####################################################################
+
+    def _count(self, name, n=1):
+        # the counters are updated from the serve, data and delay threads
+        with self._lock:
+            self.counters[name] += n
+
+    def _send(self, packet, addr, sock=None):
+        sock = self.sock if sock is None else sock
+        if self.loss and self._random.random() < self.loss:
+            self._count("dropped_out")
+            return
+        delay = self.latency + (self._random.uniform(0.0, self.jitter) if self.jitter else 0.0)
+        if delay <= 0.0:
+            try:
+                sock.sendto(packet, addr)
+            except OSError:
+                if self.running:
+                    raise
+            return
+        with self._delay_cond:
+            self._delay_seq += 1
+            heapq.heappush(self._delayed, (time.monotonic() + delay, self._delay_seq, sock, packet, addr))
+            self.counters["delayed"] += 1
+            self._delay_cond.notify()
+
+    def _send_delayed(self):
+        # packets leave in order of their due time, so jitter may reorder them like a real network
+        with self._delay_cond:
+            while self.running:
+                if not self._delayed:
+                    self._delay_cond.wait()
+                    continue
+                wait = self._delayed[0][0] - time.monotonic()
+                if wait > 0:
+                    self._delay_cond.wait(wait)
+                    continue
+                _, _, sock, packet, addr = heapq.heappop(self._delayed)
+                try:
+                    sock.sendto(packet, addr)
+                except OSError:
+                    if not self.running:
+                        break
+
+    def _reply(self, addr, device, task_id, state, **extra):
+        self._count("replies")
+        if self.clients.get(addr) == ClientCodec.WIRE_BINARY and not extra:
+            self._send(ClientCodec.encode_task(task_id, state, time.time(), device=device), addr)
+            return
+        msg = {
+            "Type": "Task",
+            "Device": device,
+            "TaskID": task_id,
+            "SubTask": False,
+            "TaskInfo": state,
+            "Msg": None,
+            "LogLevel": 20,
+        }
+        msg.update(extra)
+        self._send(json.dumps(msg).encode(), addr)
+
+    def _serve(self):
+        while self.running:
+            try:
+                data, addr = self.sock.recvfrom(65535)
+            except socket.timeout:
+                continue
+            except OSError:
+                break
+            if self.loss and self._random.random() < self.loss:
+                self._count("dropped_in")
+                continue
+            try:
+                command = ClientCodec.decode_msg(data)["Command"]
+            except (ValueError, KeyError, TypeError):
+                continue
+            self._count("commands")
+            self.clients.setdefault(addr, ClientCodec.WIRE_JSON)
+            self._execute(addr, command)
+
+    def _execute(self, addr, command):
+        device, cmd_type, task_id, args = command["Device"], command["Type"], command["TaskID"], command["args"]
+        extra = {}
+        if cmd_type == "Start" and device == "Server":
+            # accept the binary format if asked for, the negotiation reply itself is JSON
+            if args.get("wire_format") == ClientCodec.wire_format_name(ClientCodec.WIRE_BINARY):
+                extra["WireFormat"] = args["wire_format"]
+                self.clients[addr] = ClientCodec.WIRE_BINARY
+            else:
+                self.clients[addr] = ClientCodec.WIRE_JSON
+        elif cmd_type == "Halt":
+            self._halt()
+
+        self._update_hand(cmd_type, args)
+        self._reply(addr, device, task_id, ServiceTaskManager.TASK_START, **extra)
+        if cmd_type in SERVO_COMMANDS:
+            return
+        if cmd_type in MOTION_COMMANDS and self.task_time > 0:
+            with self._lock:
+                self._tasks[(addr, task_id)] = [device, time.monotonic() + self.task_time, False]
+            return
+        self._reply(addr, device, task_id, ServiceTaskManager.TASK_SUCCEED)
+
+    def _update_hand(self, cmd_type, args):
+        hand = self.hand
+        if cmd_type in ("Goto", "PosServo"):
+            hand["goal_pos"] = args.get("goal_pos", hand["goal_pos"])
+        elif cmd_type in ("Grasp", "ForceServo"):
+            hand["goal_force"] = args.get("goal_force", hand["goal_force"])
+        elif cmd_type == "SetSpeed":
+            hand["goal_speed"] = args.get("goal_speed", hand["goal_speed"])
+        elif cmd_type == "SetHome":
+            hand["goal_speed"] = args.get("goal_speed", hand["goal_speed"])
+            hand["goal_pos"] = 0.0
+        if cmd_type not in ("Acquire", "Start", "Stop"):
+            hand["task_info"]["now_task"] = cmd_type
+
+    def _halt(self):
+        with self._lock:
+            tasks = list(self._tasks.items())
+            self._tasks.clear()
+        for (addr, task_id), (device, _, _) in tasks:
+            self._reply(addr, device, task_id, ServiceTaskManager.TASK_FAILED)
+        self.hand["goal_pos"] = self.hand["now_pos"]
+
+    def _progress_tasks(self, now):
+        with self._lock:
+            tasks = list(self._tasks.items())
+        for key, task in tasks:
+            addr, task_id = key
+            device, finish_time, updated = task
+            if now >= finish_time:
+                with self._lock:
+                    if self._tasks.pop(key, None) is None:
+                        continue
+                self._reply(addr, device, task_id, ServiceTaskManager.TASK_SUCCEED)
+            elif not updated and now >= finish_time - self.task_time / 2:
+                task[2] = True
+                self._reply(addr, device, task_id, ServiceTaskManager.TASK_UPDATE)
+
+    def _step_hand(self):
+        # move the fingers towards the goal position at goal_speed
+        hand = self.hand
+        step = (hand["goal_speed"] or 4.0) * self.data_interval
+        error = hand["goal_pos"] - hand["now_pos"]
+        hand["now_speed"] = 0.0 if error == 0 else min(abs(error), step) / self.data_interval
+        hand["now_pos"] += max(-step, min(step, error))
+        hand["avg_force"] = hand["goal_force"]
+        hand["now_force"] = [hand["goal_force"]] * len(hand["now_force"])
+
+    def _send_data(self):
+        next_time = time.monotonic()
+        while self.running:
+            now = time.time()
+            self._step_hand()
+            self._progress_tasks(time.monotonic())
+            try:
+                if self.group_addr is not None:
+                    # one stream for every client; clients tell the JSON and the binary format apart
+                    binary = ClientCodec.WIRE_BINARY in self.clients.values()
+                    self._publish(self.mc_sock, self.group_addr, binary, now)
+                else:
+                    for addr, wire_format in list(self.clients.items()):
+                        self._publish(self.sock, addr, wire_format == ClientCodec.WIRE_BINARY, now)
+            except OSError:
+                break
+            next_time = max(next_time + self.data_interval, time.monotonic())
+            time.sleep(max(0.0, next_time - time.monotonic()))
+
+    def _publish(self, sock, addr, binary, now):
+        if binary:
+            self._send(ClientCodec.encode_hand_data(self.hand, now), addr, sock)
+            for SN in self.tac3d_SNs:
+                self._send(ClientCodec.encode_tac3d_data(SN, self.tac3d_frame, now), addr, sock)
+        else:
+            self._send(encode_hand_json(self.hand, now), addr, sock)
+            for SN in self.tac3d_SNs:
+                self._send(encode_tac3d_json(SN, self.tac3d_frame, now), addr, sock)
+        self._count("data", 1 + len(self.tac3d_SNs))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Local stand-in for the DexHand server.")
+    parser.add_argument("--ip", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=60031)
+    parser.add_argument("--rate", type=float, default=200.0, help="telemetry rate (Hz)")
+    parser.add_argument("--multicast", action="store_true", help="publish telemetry on the multicast group")
+    parser.add_argument("--group", default="224.0.2.100")
+    parser.add_argument("--group-port", type=int, default=60031)
+    parser.add_argument("--latency", type=float, default=0.0, help="delay of every packet sent (s)")
+    parser.add_argument("--jitter", type=float, default=0.0, help="extra random delay up to this (s)")
+    parser.add_argument("--loss", type=float, default=0.0, help="packet loss probability")
+    parser.add_argument("--task-time", type=float, default=0.0, help="running time of motion commands (s)")
+    parser.add_argument("--tac3d", nargs="*", default=[], help="SNs of relayed Tac3D sensors")
+    args = parser.parse_args()
+
+    server = StandInServer(
+        ip=args.ip,
+        port=args.port,
+        data_rate=args.rate,
+        tac3d_SNs=args.tac3d,
+        multicast=args.multicast,
+        group=args.group,
+        group_port=args.group_port,
+        latency=args.latency,
+        jitter=args.jitter,
+        loss=args.loss,
+        task_time=args.task_time,
+    )
+    print(f"DexHand stand-in server at {server.addr[0]}:{server.addr[1]}, Ctrl+C to stop.")
+    try:
+        while True:
+            time.sleep(5.0)
+            print(server.stats())
+    except KeyboardInterrupt:
+        pass
+    server.close()
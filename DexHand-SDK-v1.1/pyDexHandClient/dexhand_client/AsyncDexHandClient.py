@@ -0,0 +1,491 @@
+from .ClientCodec import WIRE_BINARY, WIRE_JSON, MessageDecoder, encode_command, wire_format_name
+from .ClientCodec import KIND_HAND_DATA, KIND_MESSAGE, KIND_TAC3D_DATA, KIND_TASK
+from .ClientData import DataManager
+from .ClientHeartbeat import HeartbeatScheduler
+from .ClientLogger import ClientLogger
+from .ClientService import ServiceTaskManager, TASKRET
+from .UDPMCManager import UDP_MC_Manager
+
+import asyncio
+import json
+import logging
+import socket
+import time
+import numpy as np
+import pkg_resources
+
+
+class _AsyncTaskInfo:
+    def __init__(self, task_id: int, loop: asyncio.AbstractEventLoop):
+        self.id = task_id
+        self.state = ServiceTaskManager.TASK_UNKNOWN
+        self.sent = loop.create_future()
+        self.started = loop.create_future()
+        self.stopped = loop.create_future()
+
+
+class _ClientProtocol(asyncio.DatagramProtocol):
+    def __init__(self, client):
+        self.client = client
+
+    def datagram_received(self, data, addr):
+        self.client._datagram_received(data, addr)
+
+    def error_received(self, exc):
+        self.client.logger.push_log(ClientLogger.WARNING, f"Client: socket error ({exc}).")
+
+
+class AsyncDexHandClient:
+    """
+    asyncio version of `DexHandClient`.
+
+    The command socket and the multicast data socket are both served by the running event loop,
+    so any number of commands and hand info consumers can run concurrently without extra threads.
+    All commands are coroutines returning the same values as their `DexHandClient` counterparts.
+
+    Usage:
+    ---
+        async with AsyncDexHandClient(ip="192.168.2.100", port=60031) as client:
+            await client.start_server()
+            await client.acquire_hand()
+            async for info in client.hand_updates():
+                ...
+
+    Heartbeats and the link watchdog follow `HeartbeatScheduler`: ticks are kept on monotonic
+    deadlines, and the watchdog is armed by the first hand data, so a slow telemetry start does not
+    release DexHand.
+    """
+
+    HB_PERIOD = 0.1  # heartbeat period (in s)
+    DATA_TIMEOUT = 1.0  # the link is considered lost after this long without hand data (in s)
+    MAX_HB_AGE = 0.5  # commands wait until the latest heartbeat is younger than this (in s)
+
+    def __init__(
+        self,
+        ip: str,
+        port: int,
+        ignore_myself=False,
+        group: str = "224.0.2.100",
+        data_port: int = 60031,
+        wire_format=WIRE_JSON,
+    ):
+        self.server_ip = ip
+        self.server_port = port
+        self.goal_addr = (self.server_ip, self.server_port)
+        self.group = group
+        self.data_port = data_port
+        self.acquired_hand = False
+        self.wire_format = wire_format
+        self._wire_format = WIRE_JSON
+
+        config_path = pkg_resources.resource_filename("dexhand_client", "config/DexHandConfig.json")
+        with open(config_path, "r") as f:
+            self.config = json.load(f)
+            self.components = self.config["DexHandComponents"]
+
+        self.logger = ClientLogger(ignore_myself=ignore_myself)
+        self.data_manager = DataManager(self.config, self.logger, client_ptr=self)
+        self.decoder = MessageDecoder()
+        if self.data_manager.tac3d_data is None:
+            self.decoder.subscribe(KIND_TAC3D_DATA, False)
+
+        self.task_id = np.random.randint(0, 65536)
+        self._tasks = {}
+        self._subscribers = []
+        self._loop = None
+        self._cmd_transport = None
+        self._data_transport = None
+        self._hb_task = None
+        self.hb_time = None  # time.monotonic() of the latest heartbeat
+        self.link_state = HeartbeatScheduler.STATE_WAITING
+
+    async def __aenter__(self):
+        await self.connect()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    ####################################################################
+    #####                                                          #####
+    #####              Belows are shortcut properties.             #####
+    #####                                                          #####
+    ####################################################################
+
+    @property
+    def tac_info(self):
+        return self.data_manager.tac3d_data.tac_info
+
+    @property
+    def hand_info(self):
+        return self.data_manager.hand_data
+
+    ####################################################################
+    #####                                                          #####
+    #####                Belows are public coroutines.             #####
+    #####                                                          #####
+    ####################################################################
+
+    async def connect(self):
+        """
+        Open the command socket and join the multicast group of hand data.
+        Must be called (or use `async with`) before any command.
+
+        Parameters:
+        ---
+            - None
+        """
+        self._loop = asyncio.get_running_loop()
+        self._cmd_transport, _ = await self._loop.create_datagram_endpoint(
+            lambda: _ClientProtocol(self), local_addr=("0.0.0.0", 0)
+        )
+        self._cmd_transport.get_extra_info("socket").setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 212992)
+        mc_manager = UDP_MC_Manager(callback=None, isSender=False, ip=self.server_ip, group=self.group, port=self.data_port)
+        mc_manager.start()
+        self._data_transport, _ = await self._loop.create_datagram_endpoint(
+            lambda: _ClientProtocol(self), sock=mc_manager.sockUDP
+        )
+        self._hb_task = self._loop.create_task(self._hb_sender())
+        self.logger.push_log(logging.INFO, "Client: Start async DexHand client.")
+
+    async def close(self):
+        """
+        Halt and release DexHand if it is controlled by this client, then close all sockets.
+        Pending commands are cancelled.
+
+        Parameters:
+        ---
+            - None
+        """
+        if self._cmd_transport is None:
+            return
+        if self.acquired_hand:
+            await self.halt()
+            await self.release_hand()
+        self._hb_task.cancel()
+        for now_task in list(self._tasks.values()):
+            for fut in (now_task.sent, now_task.started, now_task.stopped):
+                fut.cancel()
+        self._tasks.clear()
+        self._publish(None)
+        self._cmd_transport.close()
+        self._data_transport.close()
+        self._cmd_transport = None
+        self.logger.push_log(logging.INFO, "Client: Close async DexHand client.")
+
+    async def hand_updates(self, maxsize: int = 1):
+        """
+        Asynchronous iterator over hand info updates. Every update yields `hand_info.snapshot()`, a
+        `HandState` copy which later frames do not change.
+        A slow consumer only sees the latest `maxsize` updates, older ones are skipped.
+        The iteration ends when the client is closed.
+
+        Parameters:
+        ---
+            - maxsize: number of updates buffered for this consumer
+        """
+        queue = asyncio.Queue(maxsize)
+        self._subscribers.append(queue)
+        try:
+            while True:
+                info = await queue.get()
+                if info is None:
+                    return
+                yield info
+        finally:
+            self._subscribers.remove(queue)
+
+    async def start_server(self):
+        """
+        Start DexHand server. See `DexHandClient.start_server`.
+        """
+        self.logger.push_log(logging.INFO, "Client: Try to start DexHand server.")
+        if self.wire_format == WIRE_BINARY:
+            return await self._run_task("Server", "Start", wire_format=wire_format_name(WIRE_BINARY))
+        return await self._run_task("Server", "Start")
+
+    async def acquire_hand(self):
+        """
+        Obtain the control access of DexHand hardware. See `DexHandClient.acquire_hand`.
+        """
+        self.logger.push_log(logging.INFO, "Client: Acquire DexHand control.")
+        self.hb_time = time.monotonic()
+        ret = await self._run_task("Hand", "Acquire")
+        self.acquired_hand = self.acquired_hand or ret == TASKRET.succeeded.value
+        return ret
+
+    async def set_home(self, goal_speed: float = 4.0):
+        """
+        Find DexHand's gripper zero point. See `DexHandClient.set_home`.
+        """
+        await self._wait_heartbeat()
+        self.logger.push_log(logging.INFO, "Client: Set DexHand's position zeropoint.")
+        return await self._run_task("Hand", "SetHome", goal_speed=goal_speed)
+
+    async def calibrate_force_zero(self):
+        """
+        Calibrate DexHand's 1D force sensors' zero points. See `DexHandClient.calibrate_force_zero`.
+        """
+        await self._wait_heartbeat()
+        self.logger.push_log(logging.INFO, "Client: Calibrate DexHand force zeropoints.")
+        return await self._run_task("Hand", "CalibrateZero")
+
+    async def contact(self, contact_speed=8.0, preload_force=1.0, quick_move_speed=None, quick_move_pos=None):
+        """
+        Close DexHand's fingers until they contact an object. See `DexHandClient.contact`.
+        """
+        await self._wait_heartbeat()
+        return await self._run_task(
+            "Hand",
+            "Contact",
+            contact_speed=contact_speed,
+            preload_force=preload_force,
+            quick_move_speed=quick_move_speed,
+            quick_move_pos=quick_move_pos,
+        )
+
+    async def grasp(self, goal_force: float = 5.0, load_time: float = 1.0):
+        """
+        Control the grasping force of DexHand. See `DexHandClient.grasp`.
+        """
+        await self._wait_heartbeat()
+        return await self._run_task("Hand", "Grasp", goal_force=goal_force, load_time=load_time)
+
+    async def force_servo(self, goal_force):
+        """
+        Send a force setpoint. Returns once the server has started the task. See `DexHandClient.force_servo`.
+        """
+        await self._wait_heartbeat()
+        return await self._run_task("Hand", "ForceServo", wait_stop=False, goal_force=goal_force)
+
+    async def pos_goto(self, goal_pos: float, max_speed: float = 16.0, max_acc: float = 20.0, max_f: float = 1.0):
+        """
+        Move DexHand's gripper to appointed position. See `DexHandClient.pos_goto`.
+        """
+        await self._wait_heartbeat()
+        return await self._run_task(
+            "Hand", "Goto", goal_pos=goal_pos, max_speed=max_speed, max_acc=max_acc, max_f=max_f
+        )
+
+    async def pos_servo(self, goal_pos: float, max_f: float = 1.0):
+        """
+        Send a position setpoint. Returns once the server has started the task. See `DexHandClient.pos_servo`.
+        """
+        await self._wait_heartbeat()
+        return await self._run_task("Hand", "PosServo", wait_stop=False, goal_pos=goal_pos, max_f=max_f)
+
+    async def impedance(self, M: float = 1.0, B: float = 0.001, K: float = 0.06, x0: float = 10.0):
+        """
+        Simulate the Dexhand as an impedance system. See `DexHandClient.impedance`.
+        """
+        await self._wait_heartbeat()
+        return await self._run_task("Hand", "Impedance", wait_stop=False, M=M, B=B, K=K, x0=x0)
+
+    async def set_speed(self, goal_speed: float):
+        """
+        Move DexHand in the assigned speed. See `DexHandClient.set_speed`.
+        """
+        await self._wait_heartbeat()
+        return await self._run_task("Hand", "SetSpeed", wait_stop=False, goal_speed=goal_speed)
+
+    async def set_weight_param(self, weightgain1, weightgain2=None):
+        """
+        See `DexHandClient.set_weight_param`.
+        """
+        await self._wait_heartbeat()
+        if weightgain2 is None:
+            weightgain2 = weightgain1
+        return await self._run_task("Hand", "SetWeightParam", weightgain1=weightgain1, weightgain2=weightgain2)
+
+    async def set_pid_param(self, Kp=1, Ki=0.0016, maxi=60):
+        """
+        See `DexHandClient.set_pid_param`.
+        """
+        await self._wait_heartbeat()
+        self.logger.push_log(logging.INFO, "Client: Setting DexHand force PID parameters.")
+        return await self._run_task("Hand", "SetPIDParam", wait_stop=False, Kp=Kp, Ki=Ki, maxi=maxi)
+
+    async def switch_k_mode(self, use_estimator: bool, default_k: float = 0.04):
+        """
+        See `DexHandClient.switch_k_mode`.
+        """
+        await self._wait_heartbeat()
+        self.logger.push_log(logging.INFO, "Client: Switch stiffness estimation mode.")
+        return await self._run_task(
+            "Hand", "SwitchKMode", wait_stop=False, use_estimator=use_estimator, default_k=default_k
+        )
+
+    async def halt(self):
+        """
+        Stop the gripper. See `DexHandClient.halt`.
+        """
+        self.logger.push_log(logging.INFO, "Client: Halt DexHand.")
+        return await self._run_task("Hand", "Halt")
+
+    async def clear_hand_error(self):
+        """
+        Try to clear DexHand error. See `DexHandClient.clear_hand_error`.
+        """
+        await self._wait_heartbeat()
+        self.logger.push_log(logging.INFO, "Client: Clear Hand error signal.")
+        return await self._run_task("Hand", "ClearError", wait_stop=False)
+
+    async def release_hand(self):
+        """
+        Release the control of DexHand. See `DexHandClient.release_hand`.
+        """
+        if self.acquired_hand == False:
+            self.logger.push_log(logging.WARNING, "Client has not acquired DexHand control access.")
+            return
+        await self._wait_heartbeat()
+        self.logger.push_log(logging.WARNING, "Client: Release DexHand.")
+        ret = await self._run_task("Hand", "Release")
+        self.acquired_hand = ret != TASKRET.succeeded.value
+        return ret
+
+    async def stop_server(self):
+        """
+        Stop DexHand server. See `DexHandClient.stop_server`.
+        """
+        self.logger.push_log(logging.INFO, "Client: Stop DexHand and server.")
+        return await self._run_task("Server", "Stop")
+
+    ####################################################################
+    #####                                                          #####
+    #####               Belows are private functions.              #####
+    #####                                                          #####
+    ####################################################################
+
+    def _get_task_id(self):
+        # after the 16-bit counter wraps around, skip IDs which are still pending
+        while self.task_id in self._tasks:
+            self.task_id = (self.task_id + 1) % 65536
+        assigned_task_id = self.task_id
+        self.task_id = (self.task_id + 1) % 65536
+        return assigned_task_id
+
+    def _send_command(self, device, cmd_type, task_id, **kwargs):
+        if self._wire_format == WIRE_BINARY:
+            self._cmd_transport.sendto(encode_command(device, cmd_type, task_id, time.time(), **kwargs), self.goal_addr)
+            return
+        command = {
+            "Time": time.time(),
+            "Command": {
+                "Device": device,
+                "Type": cmd_type,
+                "args": kwargs,
+                "TaskID": task_id,
+            },
+        }
+        self._cmd_transport.sendto(json.dumps(command).encode(), self.goal_addr)
+
+    async def _run_task(self, device, cmd_type, wait_stop=True, **kwargs):
+        task_id = self._get_task_id()
+        now_task = _AsyncTaskInfo(task_id, self._loop)
+        # register before sending so that an early reply is not missed
+        self._tasks[task_id] = now_task
+        try:
+            self._send_command(device, cmd_type, task_id, **kwargs)
+            try:
+                await asyncio.wait_for(asyncio.shield(now_task.sent), ServiceTaskManager.SEND_TIMEOUT)
+            except asyncio.TimeoutError:
+                self.logger.push_log(ClientLogger.WARN, "Client: Timeout. The package may be lost.")
+                return TASKRET.lost.value
+
+            # check arg error
+            if now_task.state == ServiceTaskManager.TASK_ARG_ERROR:
+                return TASKRET.failed.value
+
+            if not wait_stop:
+                await now_task.started
+                return TASKRET.succeeded.value
+            await now_task.stopped
+            return TASKRET.succeeded.value if now_task.state == ServiceTaskManager.TASK_SUCCEED else TASKRET.failed.value
+        finally:
+            self._tasks.pop(task_id, None)
+
+    def _datagram_received(self, recvData, recvAddr):
+        try:
+            kind, data = self.decoder.decode(recvData)
+        except ValueError as e:
+            self.logger.push_log(ClientLogger.WARNING, f"Client: drop a malformed message ({e}).")
+            return
+        if data is None:
+            return
+        if kind == KIND_TASK:
+            if "WireFormat" in data:
+                accepted = data["WireFormat"] == wire_format_name(WIRE_BINARY) and self.wire_format == WIRE_BINARY
+                self._wire_format = WIRE_BINARY if accepted else WIRE_JSON
+            self._unpack_task(data)
+        elif kind == KIND_HAND_DATA:
+            self.data_manager.unpack_msg(data)
+            if self._subscribers:
+                self._publish(self.hand_info.snapshot())
+        elif kind == KIND_MESSAGE:
+            self.logger.unpack_msg(data)
+        elif data["Type"] == "Data":
+            self.data_manager.unpack_msg(data)
+
+    def _unpack_task(self, data):
+        now_task = self._tasks.get(data["TaskID"])
+        if now_task is None:
+            return
+        if data["SubTask"] == False:
+            now_task.state = data["TaskInfo"]
+            if now_task.state != ServiceTaskManager.TASK_UNKNOWN and not now_task.sent.done():
+                now_task.sent.set_result(True)
+            if (
+                now_task.state != ServiceTaskManager.TASK_UNKNOWN
+                and now_task.state != ServiceTaskManager.TASK_ARG_ERROR
+                and not now_task.started.done()
+            ):
+                now_task.started.set_result(True)
+            if (
+                now_task.state == ServiceTaskManager.TASK_FAILED or now_task.state == ServiceTaskManager.TASK_SUCCEED
+            ) and not now_task.stopped.done():
+                now_task.stopped.set_result(True)
+
+        if data["Msg"] is None:
+            return
+        msg = data["Msg"]
+        device = data["Device"]
+        self.logger.push_log(data["LogLevel"], f"{device}: {msg}", from_server=True)
+
+    def _publish(self, info):
+        for queue in self._subscribers:
+            if queue.full():
+                queue.get_nowait()
+            queue.put_nowait(info)
+
+    async def _hb_sender(self):
+        deadline = time.monotonic()
+        while True:
+            late = time.monotonic() - deadline
+            # deadlines which already passed are skipped, not caught up in a burst
+            deadline += ((int(late // self.HB_PERIOD) if late > 0 else 0) + 1) * self.HB_PERIOD
+            if self.acquired_hand:
+                self._send_command("Hand", "Acquire", self._get_task_id())
+                self.hb_time = time.monotonic()
+            self._check_link(time.monotonic())
+            await asyncio.sleep(max(0.0, deadline - time.monotonic()))
+
+    def _check_link(self, now):
+        # armed by the first hand data, like HeartbeatScheduler
+        hand_data = self.hand_info
+        if hand_data is None or hand_data._recv_monotonic is None:
+            return
+        age = now - hand_data._recv_monotonic
+        if self.link_state != HeartbeatScheduler.STATE_TIMEOUT and age > self.DATA_TIMEOUT:
+            self.logger.push_log(ClientLogger.ERROR, "Client: Timeout. DexHand Server may be not available.")
+            self.acquired_hand = False
+            self.link_state = HeartbeatScheduler.STATE_TIMEOUT
+        elif self.link_state != HeartbeatScheduler.STATE_ALIVE and age <= self.DATA_TIMEOUT:
+            if self.link_state == HeartbeatScheduler.STATE_TIMEOUT:
+                self.logger.push_log(ClientLogger.INFO, "Client: DexHand data received again.")
+            self.link_state = HeartbeatScheduler.STATE_ALIVE
+
+    async def _wait_heartbeat(self):
+        while self.acquired_hand:
+            if self.hb_time is not None and time.monotonic() - self.hb_time <= self.MAX_HB_AGE:
+                return
+            await asyncio.sleep(0.01)
@@ -0,0 +1,495 @@
+"""
+Binary wire format of DexHand messages (version 1).
+
+Every binary message starts with the header `<2sBBd`: magic b"DX", format version, message type and
+the send time. JSON messages always start with "{", so both formats can be received on the same
+socket and `decode_msg` picks the right decoder from the first byte.
+
+`MessageDecoder` adds a cheap type peek in front of the decoders, so messages nobody subscribes to
+can be dropped without being parsed, and keeps per-type decode timing.
+
+Decoded messages have the same dict layout as the JSON messages, so the rest of the client does not
+care which format was used. Tactile fields are decoded as float32 numpy arrays (read-only views over
+the datagram) instead of nested lists.
+"""
+
+import json
+import struct
+import time
+import numpy as np
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+WIRE_MAGIC = b"DX"
+WIRE_VERSION = 1
+WIRE_JSON = "json"
+WIRE_BINARY = "binary"
+
+MSG_COMMAND = 1
+MSG_TASK = 2
+MSG_MESSAGE = 3
+MSG_HAND_DATA = 4
+MSG_TAC3D_DATA = 5
+
+_HEADER = struct.Struct("<2sBBd")
+_U8 = struct.Struct("<B")
+_U16 = struct.Struct("<H")
+_F64 = struct.Struct("<d")
+_I64 = struct.Struct("<q")
+_COMMAND = struct.Struct("<HBB")  # task id, device, number of args
+_TASK = struct.Struct("<HBbBB")  # task id, sub task, task info, log level, device
+_MESSAGE = struct.Struct("<BB")  # log level, device
+# now_pos, goal_pos, now_speed, goal_speed, now_current, goal_current, then the length-prefixed
+# now_task and recent_task, then recent_task_status, error_flag, avg_force, goal_force, stiffness,
+# imu_acc[3], imu_gyr[3]
+_HAND_DATA = struct.Struct("<6d")
+_HAND_DATA_TAIL = struct.Struct("<ii3d6f")
+_TAC3D_FIELD = struct.Struct("<BHH")  # kind, rows, cols
+
+_DEVICES = ["", "Hand", "Tac3D", "Server"]
+_DEVICE_CODES = {name: code for code, name in enumerate(_DEVICES)}
+_NO_MSG = 0xFFFF
+
+_ARG_NONE = 0
+_ARG_FLOAT = 1
+_ARG_BOOL = 2
+_ARG_INT = 3
+_ARG_STR = 4
+
+_FIELD_MAT = 0
+_FIELD_SCALAR = 1
+
+
+def wire_format_name(wire_format=WIRE_BINARY, version=WIRE_VERSION):
+    return f"{wire_format}/{version}"
+
+
+####################################################################
+#####                                                          #####
+#####                     Belows are encoders.                 #####
+#####                                                          #####
+####################################################################
+
+
+def encode_command(device, cmd_type, task_id, send_time, **kwargs):
+    """
+    Encode a command sent from a client to the server.
+    """
+    parts = [
+        _HEADER.pack(WIRE_MAGIC, WIRE_VERSION, MSG_COMMAND, send_time),
+        _COMMAND.pack(task_id, _DEVICE_CODES[device], len(kwargs)),
+        _pack_str8(cmd_type),
+    ]
+    for name, value in kwargs.items():
+        parts.append(_pack_str8(name))
+        if value is None:
+            parts.append(_U8.pack(_ARG_NONE))
+        elif isinstance(value, (bool, np.bool_)):
+            parts.append(_U8.pack(_ARG_BOOL) + _U8.pack(bool(value)))
+        elif isinstance(value, (int, np.integer)):
+            parts.append(_U8.pack(_ARG_INT) + _I64.pack(value))
+        elif isinstance(value, (float, np.floating)):
+            parts.append(_U8.pack(_ARG_FLOAT) + _F64.pack(value))
+        elif isinstance(value, str):
+            parts.append(_U8.pack(_ARG_STR) + _pack_str16(value))
+        else:
+            raise TypeError(f"argument {name} of type {type(value).__name__} can not be encoded.")
+    return b"".join(parts)
+
+
+def encode_task(task_id, task_info, send_time, sub_task=False, msg=None, log_level=0, device="Server"):
+    """
+    Encode a task state reply sent from the server to a client.
+    """
+    return (
+        _HEADER.pack(WIRE_MAGIC, WIRE_VERSION, MSG_TASK, send_time)
+        + _TASK.pack(task_id, sub_task, task_info, log_level, _DEVICE_CODES[device])
+        + _pack_msg(msg)
+    )
+
+
+def encode_message(msg, send_time, log_level=20, device="Server"):
+    """
+    Encode a log message sent from the server to clients.
+    """
+    return (
+        _HEADER.pack(WIRE_MAGIC, WIRE_VERSION, MSG_MESSAGE, send_time)
+        + _MESSAGE.pack(log_level, _DEVICE_CODES[device])
+        + _pack_msg(msg)
+    )
+
+
+def encode_hand_data(data, send_time):
+    """
+    Encode DexHand state (the "Data" dict of a hand data message) with a fixed struct layout; the task
+    names are length-prefixed strings.
+    """
+    task_info = data["task_info"]
+    now_force = data["now_force"]
+    is_contact = data["is_contact"]
+    return b"".join(
+        [
+            _HEADER.pack(WIRE_MAGIC, WIRE_VERSION, MSG_HAND_DATA, send_time),
+            _HAND_DATA.pack(
+                data["now_pos"],
+                data["goal_pos"],
+                data["now_speed"],
+                data["goal_speed"],
+                data["now_current"],
+                data["goal_current"],
+            ),
+            _pack_str8(task_info["now_task"]),
+            _pack_str8(task_info["recent_task"]),
+            _HAND_DATA_TAIL.pack(
+                task_info["recent_task_status"],
+                task_info["error_flag"],
+                data["avg_force"],
+                data["goal_force"],
+                data["stiffness"],
+                *data["imu_acc"],
+                *data["imu_gyr"],
+            ),
+            _U8.pack(len(now_force)),
+            np.asarray(now_force, dtype="<f8").tobytes(),
+            _U8.pack(len(is_contact)),
+            bytes(bool(c) for c in is_contact),
+        ]
+    )
+
+
+def encode_tac3d_data(SN, frame, send_time):
+    """
+    Encode a relayed Tac3D frame. Array fields are sent as raw float32 matrices, numbers as float64.
+    """
+    parts = [_HEADER.pack(WIRE_MAGIC, WIRE_VERSION, MSG_TAC3D_DATA, send_time), _pack_str8(SN), _U8.pack(len(frame))]
+    for name, value in frame.items():
+        parts.append(_pack_str8(name))
+        if isinstance(value, (int, float, np.integer, np.floating)):
+            parts.append(_TAC3D_FIELD.pack(_FIELD_SCALAR, 0, 0) + _F64.pack(value))
+        else:
+            mat = np.asarray(value, dtype="<f4")
+            mat = mat.reshape(mat.shape[0] if mat.ndim else 1, -1)
+            parts.append(_TAC3D_FIELD.pack(_FIELD_MAT, mat.shape[0], mat.shape[1]) + mat.tobytes())
+    return b"".join(parts)
+
+
+####################################################################
+#####                                                          #####
+#####                     Belows are decoders.                 #####
+#####                                                          #####
+####################################################################
+
+
+def is_binary(raw):
+    return raw[:2] == WIRE_MAGIC
+
+
+def decode_msg(raw):
+    """
+    Decode a received datagram, either JSON or binary. Raise ValueError for malformed messages.
+    """
+    if not is_binary(raw):
+        return json.loads(raw)
+    try:
+        magic, version, msg_type, send_time = _HEADER.unpack_from(raw, 0)
+        if version != WIRE_VERSION:
+            raise ValueError(f"unsupported wire format version {version}.")
+        decoder = _DECODERS[msg_type]
+    except (struct.error, KeyError) as e:
+        raise ValueError(f"malformed binary message ({e}).")
+    try:
+        return decoder(raw, _HEADER.size, send_time)
+    except (struct.error, IndexError, UnicodeDecodeError) as e:
+        raise ValueError(f"malformed binary message ({e}).")
+
+
+def _decode_command(raw, offset, send_time):
+    task_id, device, n_args = _COMMAND.unpack_from(raw, offset)
+    cmd_type, offset = _unpack_str8(raw, offset + _COMMAND.size)
+    args = {}
+    for _ in range(n_args):
+        name, offset = _unpack_str8(raw, offset)
+        kind = raw[offset]
+        offset += 1
+        if kind == _ARG_NONE:
+            value = None
+        elif kind == _ARG_BOOL:
+            value = bool(raw[offset])
+            offset += 1
+        elif kind == _ARG_INT:
+            value = _I64.unpack_from(raw, offset)[0]
+            offset += _I64.size
+        elif kind == _ARG_FLOAT:
+            value = _F64.unpack_from(raw, offset)[0]
+            offset += _F64.size
+        elif kind == _ARG_STR:
+            value, offset = _unpack_str16(raw, offset)
+        else:
+            raise ValueError(f"unknown argument kind {kind}.")
+        args[name] = value
+    return {
+        "Time": send_time,
+        "Command": {"Device": _DEVICES[device], "Type": cmd_type, "args": args, "TaskID": task_id},
+    }
+
+
+def _decode_task(raw, offset, send_time):
+    task_id, sub_task, task_info, log_level, device = _TASK.unpack_from(raw, offset)
+    msg, _ = _unpack_msg(raw, offset + _TASK.size)
+    return {
+        "Type": "Task",
+        "Time": send_time,
+        "TaskID": task_id,
+        "SubTask": bool(sub_task),
+        "TaskInfo": task_info,
+        "LogLevel": log_level,
+        "Device": _DEVICES[device],
+        "Msg": msg,
+    }
+
+
+def _decode_message(raw, offset, send_time):
+    log_level, device = _MESSAGE.unpack_from(raw, offset)
+    msg, _ = _unpack_msg(raw, offset + _MESSAGE.size)
+    return {"Type": "Message", "Time": send_time, "LogLevel": log_level, "Device": _DEVICES[device], "Msg": msg}
+
+
+def _decode_hand_data(raw, offset, send_time):
+    values = _HAND_DATA.unpack_from(raw, offset)
+    now_task, offset = _unpack_str8(raw, offset + _HAND_DATA.size)
+    recent_task, offset = _unpack_str8(raw, offset)
+    values += _HAND_DATA_TAIL.unpack_from(raw, offset)
+    offset += _HAND_DATA_TAIL.size
+    n_force = raw[offset]
+    now_force = np.frombuffer(raw, dtype="<f8", count=n_force, offset=offset + 1).tolist()
+    offset += 1 + 8 * n_force
+    n_contact = raw[offset]
+    is_contact = [b != 0 for b in _slice(raw, offset + 1, n_contact)]
+    data = {
+        "now_pos": values[0],
+        "goal_pos": values[1],
+        "now_speed": values[2],
+        "goal_speed": values[3],
+        "now_current": values[4],
+        "goal_current": values[5],
+        "task_info": {
+            "now_task": now_task,
+            "recent_task": recent_task,
+            "recent_task_status": values[6],
+            "error_flag": values[7],
+        },
+        "avg_force": values[8],
+        "goal_force": values[9],
+        "stiffness": values[10],
+        "imu_acc": list(values[11:14]),
+        "imu_gyr": list(values[14:17]),
+        "now_force": now_force,
+        "is_contact": is_contact,
+    }
+    return {"Type": "Data", "Device": "Hand", "Time": send_time, "Data": data}
+
+
+def _decode_tac3d_data(raw, offset, send_time):
+    SN, offset = _unpack_str8(raw, offset)
+    n_fields = raw[offset]
+    offset += 1
+    frame = {}
+    for _ in range(n_fields):
+        name, offset = _unpack_str8(raw, offset)
+        kind, rows, cols = _TAC3D_FIELD.unpack_from(raw, offset)
+        offset += _TAC3D_FIELD.size
+        if kind == _FIELD_SCALAR:
+            frame[name] = _F64.unpack_from(raw, offset)[0]
+            offset += _F64.size
+        else:
+            frame[name] = np.frombuffer(raw, dtype="<f4", count=rows * cols, offset=offset).reshape(rows, cols)
+            offset += 4 * rows * cols
+    return {"Type": "Data", "Device": "Tac3D", "Time": send_time, "SN": SN, "Data": frame}
+
+
+_DECODERS = {
+    MSG_COMMAND: _decode_command,
+    MSG_TASK: _decode_task,
+    MSG_MESSAGE: _decode_message,
+    MSG_HAND_DATA: _decode_hand_data,
+    MSG_TAC3D_DATA: _decode_tac3d_data,
+}
+
+
+# message kinds used for dispatching: "Type" or "Type/Device" for data messages
+KIND_TASK = "Task"
+KIND_MESSAGE = "Message"
+KIND_HAND_DATA = "Data/Hand"
+KIND_TAC3D_DATA = "Data/Tac3D"
+
+_BINARY_KINDS = {
+    MSG_COMMAND: "Command",
+    MSG_TASK: KIND_TASK,
+    MSG_MESSAGE: KIND_MESSAGE,
+    MSG_HAND_DATA: KIND_HAND_DATA,
+    MSG_TAC3D_DATA: KIND_TAC3D_DATA,
+}
+
+
+def default_json_loads():
+    """
+    Return the fastest available JSON decoder (orjson if installed, the standard json module otherwise).
+    """
+    return orjson.loads if orjson is not None else json.loads
+
+
+class MessageDecoder:
+    """
+    Decoder layer between the sockets and the message handlers of a client.
+
+    The kind of a message is peeked from the binary header or, for JSON, by searching the raw bytes
+    for the "Type" and "Device" keys. Messages of unsubscribed kinds are dropped before parsing.
+    """
+
+    def __init__(self, json_loads=None):
+        self.json_loads = json_loads if json_loads is not None else default_json_loads()
+        self._unsubscribed = set()
+        self._stats = {}
+
+    def subscribe(self, kind, enable=True):
+        """
+        Enable or disable decoding of a message kind, e.g. `KIND_TAC3D_DATA`.
+
+        Parameters:
+        ---
+            - kind: "Task", "Message", "Data/Hand", "Data/Tac3D", ...
+            - enable: set to False to drop messages of this kind without parsing them
+        """
+        if enable:
+            self._unsubscribed.discard(kind)
+        else:
+            self._unsubscribed.add(kind)
+
+    def decode(self, raw):
+        """
+        Decode a datagram. Return `(kind, msg)`, where msg is None if the kind is not subscribed.
+        Raise ValueError for malformed messages.
+        """
+        binary = is_binary(raw)
+        if binary:
+            kind = _BINARY_KINDS.get(raw[3]) if len(raw) > 3 else None
+        else:
+            kind = self._peek_json(raw)
+        if kind in self._unsubscribed:
+            self._record(kind, 0.0, True)
+            return kind, None
+
+        t0 = time.perf_counter()
+        msg = decode_msg(raw) if binary else self.json_loads(raw)
+        elapsed = time.perf_counter() - t0
+        try:
+            msg_type = msg["Type"]
+            actual_kind = msg_type if msg_type != "Data" else f"Data/{msg['Device']}"
+        except (KeyError, TypeError):
+            raise ValueError("message without type.")
+        self._record(actual_kind, elapsed, False)
+        if actual_kind != kind and actual_kind in self._unsubscribed:
+            return actual_kind, None
+        return actual_kind, msg
+
+    def stats(self):
+        """
+        Get decode statistics per message kind.
+
+        Returns:
+        ---
+            - {kind: {"decoded": count, "skipped": count, "avg_us": mean decode time, "max_us": max decode time}}
+        """
+        return {
+            kind: {
+                "decoded": s[0],
+                "skipped": s[1],
+                "avg_us": s[2] / s[0] * 1e6 if s[0] else None,
+                "max_us": s[3] * 1e6 if s[0] else None,
+            }
+            for kind, s in list(self._stats.items())
+        }
+
+    def _record(self, kind, elapsed, skipped):
+        s = self._stats.get(kind)
+        if s is None:
+            s = self._stats[kind] = [0, 0, 0.0, 0.0]
+        if skipped:
+            s[1] += 1
+        else:
+            s[0] += 1
+            s[2] += elapsed
+            if elapsed > s[3]:
+                s[3] = elapsed
+
+    def _peek_json(self, raw):
+        msg_type = _peek_json_str(raw, b'"Type"')
+        if msg_type != b"Data":
+            return None if msg_type is None else msg_type.decode()
+        device = _peek_json_str(raw, b'"Device"')
+        return None if device is None else "Data/" + device.decode()
+
+
+####################################################################
+#####                                                          #####
+#####               Belows are private functions.              #####
+#####                                                          #####
+####################################################################
+
+
+def _pack_str8(s):
+    b = s.encode()
+    if len(b) > 0xFF:
+        raise ValueError(f"string of {len(b)} bytes does not fit the binary wire format: {s[:32]!r}...")
+    return _U8.pack(len(b)) + b
+
+
+def _pack_str16(s):
+    b = s.encode()
+    return _U16.pack(len(b)) + b
+
+
+def _pack_msg(msg):
+    if msg is None:
+        return _U16.pack(_NO_MSG)
+    return _pack_str16(msg)
+
+
+def _unpack_str8(raw, offset):
+    n = raw[offset]
+    return bytes(_slice(raw, offset + 1, n)).decode(), offset + 1 + n
+
+
+def _unpack_str16(raw, offset):
+    n = _U16.unpack_from(raw, offset)[0]
+    return bytes(_slice(raw, offset + 2, n)).decode(), offset + 2 + n
+
+
+def _slice(raw, offset, n):
+    # a short slice means a truncated datagram, which must not decode silently
+    if offset + n > len(raw):
+        raise IndexError(f"{n} bytes at offset {offset} exceed the message size {len(raw)}")
+    return raw[offset : offset + n]
+
+
+def _unpack_msg(raw, offset):
+    if _U16.unpack_from(raw, offset)[0] == _NO_MSG:
+        return None, offset + 2
+    return _unpack_str16(raw, offset)
+
+
+def _peek_json_str(raw, key):
+    # value of the first `"key": "value"` pair in the raw bytes, None if it can not be found cheaply
+    idx = raw.find(key)
+    if idx < 0:
+        return None
+    start = raw.find(b'"', idx + len(key))
+    if start < 0 or raw[idx + len(key) : start].strip() != b":":
+        return None
+    end = raw.find(b'"', start + 1)
+    if end < 0:
+        return None
+    return raw[start + 1 : end]
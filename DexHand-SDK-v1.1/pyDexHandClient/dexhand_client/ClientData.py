@@ -1,51 +1,203 @@
+from .ClientHistory import HandHistory
 from .ClientLogger import ClientLogger
 import logging
+import threading
+import time
 import numpy as np
 
 
+class HandState:
+    """
+    One sample of DexHand telemetry. `DexHandDataManager` keeps two preallocated instances (see
+    `_DoubleBuffer`); `copy()` gives an independent snapshot.
+    """
+
+    __slots__ = (
+        "seq",
+        "recv_time",
+        "frame_cnt",
+        "now_pos",
+        "goal_pos",
+        "now_speed",
+        "goal_speed",
+        "now_current",
+        "goal_current",
+        "now_task",
+        "recent_task",
+        "recent_task_status",
+        "error_flag",
+        "now_force",
+        "avg_force",
+        "goal_force",
+        "stiffness",
+        "imu_acc",
+        "imu_gyr",
+        "is_contact",
+    )
+
+    def __init__(self):
+        for name in HandState.__slots__:
+            setattr(self, name, None)
+        self.seq = 0
+        self.frame_cnt = 0
+        self.now_force = []
+        self.imu_acc = np.empty(3, dtype=np.float32)
+        self.imu_gyr = np.empty(3, dtype=np.float32)
+        self.is_contact = []
+
+    def copy(self):
+        state = HandState.__new__(HandState)
+        for name in HandState.__slots__:
+            setattr(state, name, getattr(self, name))
+        state.now_force = list(self.now_force)
+        state.imu_acc = self.imu_acc.copy()
+        state.imu_gyr = self.imu_gyr.copy()
+        state.is_contact = list(self.is_contact)
+        return state
+
+    def __repr__(self):
+        fields = ", ".join(f"{name}={getattr(self, name)!r}" for name in HandState.__slots__)
+        return f"HandState({fields})"
+
+
+class _DoubleBuffer:
+    """
+    Two preallocated state objects: the receive thread fills the back one and then swaps it to the
+    front, so attribute readers always see a completely written sample.
+
+    `seq` of a state works as a seqlock: it is -1 while the state is being rewritten and the sequence
+    number of the sample afterwards. `snapshot()` copies the front state and retries if `seq` changed
+    meanwhile, so readers never block the receive path and never return a torn copy.
+    """
+
+    def __init__(self, factory):
+        self.front = factory()
+        self.back = factory()
+        self.seq = 0
+        # only serializes several receive threads, readers never take it
+        self._write_lock = threading.Lock()
+
+    def begin(self):
+        self._write_lock.acquire()
+        back = self.back
+        back.seq = -1
+        return back
+
+    def publish(self):
+        back = self.back
+        self.seq += 1
+        back.seq = self.seq
+        self.back = self.front
+        self.front = back
+        self._write_lock.release()
+
+    def abort(self):
+        # the half-written back state is never published
+        self._write_lock.release()
+
+    def snapshot(self):
+        while True:
+            state = self.front
+            seq = state.seq
+            copy = state.copy()
+            if seq >= 0 and state.seq == seq:
+                return copy
+
+
+def _state_property(name):
+    return property(lambda self: getattr(self._buffers.front, name))
+
+
 class DexHandDataManager:
+    # log every n-th frame at DEBUG level
+    LOG_INTERVAL = 10
+
     def __init__(self, info_config, logger, recvCallback, client_ptr):
         self._recv_time = None
+        self._recv_monotonic = None  # local arrival time, checked by the heartbeat watchdog
         self._frame_cnt = 0
-        self._watchdog = 0
         self._recvCallback = recvCallback
         self._logger: ClientLogger = logger
         self._auto_extract = info_config["auto_extract"]
         self._client_ptr = client_ptr
+        self._buffers = _DoubleBuffer(HandState)
+        self._task_info = {}
+        self.history: HandHistory = None
         if not self._auto_extract:
             self.frame = None
             return
 
         self._components = info_config["InfoComponents"]
-        if "Ego" in self._components:
-            self.now_pos = None
-            self.goal_pos = None
-            self.now_speed = None
-            self.goal_speed = None
-            self.now_current = None
-            self.goal_current = None
-            self._task_info = {}
-            self.now_task = None
-            self.recent_task = None
-            self.recent_task_status = None
-            self.error_flag = None
-
-
-        if "Force" in self._components:
-            self.now_force = []
-            self.avg_force = None
-            self.goal_force = None
-            self.stiffness = None
-
-        if "Imu" in self._components:
-            self.imu_acc = np.empty(3, dtype=np.float32)
-            self.imu_gyr = np.empty(3, dtype=np.float32)
-
-        if "Contact" in self._components:
-            self.is_contact = []
+        self._has_ego = "Ego" in self._components
+        self._has_force = "Force" in self._components
+        self._has_imu = "Imu" in self._components
+        self._has_contact = "Contact" in self._components
+
+    def snapshot(self):
+        """
+        Get a consistent copy of the latest hand state without blocking the receive thread.
+
+        Returns:
+        ---
+            - a `HandState` carrying `seq` (sequence number) and `recv_time`, or the raw data dict
+              when `auto_extract` is disabled
+        """
+        if not self._auto_extract:
+            return self.frame
+        return self._buffers.snapshot()
+
+    def enable_history(self, capacity: int = 2000, fingers: int = None) -> HandHistory:
+        """
+        Start recording the received telemetry into a fixed-capacity ring buffer, see `HandHistory`.
+
+        Parameters:
+        ---
+            - capacity: number of samples kept (2000 samples are 10 s at 200 Hz)
+            - fingers: number of fingers reported in now_force / is_contact, None to take it from the
+              first frame
+
+        Usage:
+        ---
+            history = client.hand_info.enable_history(capacity=2000)
+            w = history.window(0.5)
+            velocity = history.derivative(w.pos, w.t)
+        """
+        if not self._auto_extract:
+            raise RuntimeError("Client: telemetry history needs auto_extract to be enabled.")
+        self.history = HandHistory(capacity, fingers)
+        return self.history
+
+    def disable_history(self):
+        """
+        Stop recording the telemetry history and release its buffer.
+        """
+        self.history = None
+
+    def _append_history(self, history, state, recv_time):
+        # a failure here must not reach the receive thread, the telemetry itself is still published
+        try:
+            recorded = history.append(
+                recv_time,
+                state.now_pos if self._has_ego else None,
+                state.now_speed if self._has_ego else None,
+                state.now_current if self._has_ego else None,
+                state.now_force if self._has_force else None,
+                state.imu_acc if self._has_imu else None,
+                state.imu_gyr if self._has_imu else None,
+                state.is_contact if self._has_contact else None,
+            )
+        except Exception as e:
+            self._logger.push_log(ClientLogger.ERROR, f"Client: telemetry history failed ({e!r}), history disabled.")
+            self.history = None
+            return
+        if not recorded and history.skipped == 1:
+            self._logger.push_log(
+                ClientLogger.WARNING,
+                f"Client: hand data does not report {history.fingers} fingers, such samples are not recorded.",
+            )
 
     def _unpack_data(self, data, recv_time):
-        self._watchdog = 0
+        self._recv_monotonic = time.monotonic()
         if self._recv_time is not None and self._recv_time > recv_time:
             return
 
@@ -55,45 +207,102 @@ class DexHandDataManager:
             self.frame = data
 
         else:
-            log_str = ""
-            if "Ego" in self._components:
-                self.now_pos = data["now_pos"]
-                self.goal_pos = data["goal_pos"]
-                self.now_speed = data["now_speed"]
-                self.goal_speed = data["goal_speed"]
-                self.now_current = data["now_current"]
-                self.goal_current = data["goal_current"]
-                self._task_info = data["task_info"]
-                self.now_task = self._task_info["now_task"]
-                self.recent_task = self._task_info["recent_task"]
-                self.recent_task_status = self._task_info["recent_task_status"]
-                self.error_flag = self._task_info["error_flag"]
-                log_str += (
-                    f"error:{self.error_flag}, {self.now_task} ({self.recent_task},{self.recent_task_status})"
-                    + f"Pos:{self.now_pos:.2f}/{self.goal_pos:.2f} Speed:{self.now_speed:.2f}/{self.goal_speed:.2f}, Current:{self.now_current:.2f} "
-                )
-
-            if "Force" in self._components:
-                self.now_force = data["now_force"]
-                self.avg_force = data["avg_force"]
-                self.goal_force = data["goal_force"]
-                self.stiffness = data["stiffness"]
-                log_str += f"Force:{self.avg_force:.3f}/{self.goal_force:.3f}"
-
-            if "Imu" in self._components:
-                self.imu_acc[:] = data["imu_acc"]
-                self.imu_gyr[:] = data["imu_gyr"]
-
-            if "Contact" in self._components:
-                self.is_contact = data["is_contact"]
-
-            if self._frame_cnt % 10 == 0:
-                self._logger.push_log(ClientLogger.DEBUG, log_str)
+            state = self._buffers.begin()
+            try:
+                state.recv_time = recv_time
+                state.frame_cnt = self._frame_cnt
+                if self._has_ego:
+                    state.now_pos = data["now_pos"]
+                    state.goal_pos = data["goal_pos"]
+                    state.now_speed = data["now_speed"]
+                    state.goal_speed = data["goal_speed"]
+                    state.now_current = data["now_current"]
+                    state.goal_current = data["goal_current"]
+                    task_info = self._task_info = data["task_info"]
+                    state.now_task = task_info["now_task"]
+                    state.recent_task = task_info["recent_task"]
+                    state.recent_task_status = task_info["recent_task_status"]
+                    state.error_flag = task_info["error_flag"]
+
+                if self._has_force:
+                    state.now_force = data["now_force"]
+                    state.avg_force = data["avg_force"]
+                    state.goal_force = data["goal_force"]
+                    state.stiffness = data["stiffness"]
+
+                if self._has_imu:
+                    state.imu_acc[:] = data["imu_acc"]
+                    state.imu_gyr[:] = data["imu_gyr"]
+
+                if self._has_contact:
+                    state.is_contact = data["is_contact"]
+
+                # recorded under the write lock, so several receive threads never append concurrently
+                history = self.history
+                if history is not None:
+                    self._append_history(history, state, recv_time)
+            except BaseException:
+                self._buffers.abort()
+                raise
+            self._buffers.publish()
+
+            # the log string is only built for the frames which are actually logged
+            if self._frame_cnt % self.LOG_INTERVAL == 0:
+                self._logger.push_log(ClientLogger.DEBUG, self._log_str(state))
 
         # print(self.recvCallback)
         if self._recvCallback is not None:
             self._recvCallback(self._client_ptr)
 
+    def _log_str(self, state):
+        log_str = ""
+        if self._has_ego:
+            log_str += (
+                f"error:{state.error_flag}, {state.now_task} ({state.recent_task},{state.recent_task_status})"
+                + f"Pos:{state.now_pos:.2f}/{state.goal_pos:.2f} Speed:{state.now_speed:.2f}/{state.goal_speed:.2f}, Current:{state.now_current:.2f} "
+            )
+        if self._has_force:
+            log_str += f"Force:{state.avg_force:.3f}/{state.goal_force:.3f}"
+        return log_str
+
+
+# latest values are read through the preallocated state, e.g. `client.hand_info.now_pos`
+for _name in HandState.__slots__[2:]:
+    setattr(DexHandDataManager, _name, _state_property(_name))
+
+
+class Tac3DState:
+    """
+    One Tac3D frame relayed by DexHand server, see `Tac3D_Data`.
+    """
+
+    __slots__ = ("seq", "recv_time", "frame_cnt", "frame", "P", "D", "F", "Fr", "Mr")
+
+    def __init__(self, basic=False):
+        self.seq = 0
+        self.recv_time = None
+        self.frame_cnt = 0
+        self.frame = None
+        if basic:
+            self.P = np.empty((20, 20, 3), dtype=np.float32)
+            self.D = np.empty((20, 20, 3), dtype=np.float32)
+            self.F = np.empty((20, 20, 3), dtype=np.float32)
+            self.Fr = np.empty(3, dtype=np.float32)
+            self.Mr = np.empty(3, dtype=np.float32)
+        else:
+            self.P = self.D = self.F = self.Fr = self.Mr = None
+
+    def copy(self):
+        state = Tac3DState.__new__(Tac3DState)
+        state.seq = self.seq
+        state.recv_time = self.recv_time
+        state.frame_cnt = self.frame_cnt
+        state.frame = self.frame
+        for name in ("P", "D", "F", "Fr", "Mr"):
+            value = getattr(self, name)
+            setattr(state, name, None if value is None else value.copy())
+        return state
+
 
 class Tac3D_Data:
     def __init__(self, SN, auto_extract, components):
@@ -102,36 +311,71 @@ class Tac3D_Data:
         self._auto_extract = auto_extract
         self._components = components
         self._frame_cnt = 0
+        self._basic = self._auto_extract and "Basic" in components
+        self._buffers = _DoubleBuffer(lambda: Tac3DState(self._basic))
 
         if not self._auto_extract:
-            self.frame = None
             return
 
-        if "Basic" in components:
-            self.P = np.empty((20, 20, 3), dtype=np.float32)
-            self.D = np.empty((20, 20, 3), dtype=np.float32)
-            self.F = np.empty((20, 20, 3), dtype=np.float32)
-            self.Fr = np.empty(3, dtype=np.float32)
-            self.Mr = np.empty(3, dtype=np.float32)
         if "Contact" in components:
             self.is_contact: bool = False
 
+    @property
+    def frame(self):
+        return self._buffers.front.frame
+
+    @property
+    def P(self):
+        return self._buffers.front.P
+
+    @property
+    def D(self):
+        return self._buffers.front.D
+
+    @property
+    def F(self):
+        return self._buffers.front.F
+
+    @property
+    def Fr(self):
+        return self._buffers.front.Fr
+
+    @property
+    def Mr(self):
+        return self._buffers.front.Mr
+
+    def snapshot(self):
+        """
+        Get a consistent copy of the latest frame without blocking the receive thread.
+
+        Returns:
+        ---
+            - a `Tac3DState` carrying `seq` (sequence number), `recv_time` and `P`, `D`, `F`, `Fr`, `Mr`
+              (or only the raw `frame` when `auto_extract` is disabled)
+        """
+        return self._buffers.snapshot()
+
     def extract_data(self, frame, recv_time) -> bool:
         if self.recv_time is not None and self.recv_time > recv_time:
             return False
 
         self.recv_time = recv_time
         self._frame_cnt += 1
-        if not self._auto_extract:
-            self.frame = frame
-            return True
-        if "Basic" in self._components:
-            self.P[...] = frame["3D_Positions"].reshape(20, 20, 3)
-            self.D[...] = frame["3D_Displacements"].reshape(20, 20, 3)
-            self.F[...] = frame["3D_Forces"].reshape(20, 20, 3)
-            self.Fr[:] = frame["3D_ResultantForce"].reshape(-1)
-            self.Mr[:] = frame["3D_ResultantMoment"].reshape(-1)
-
+        state = self._buffers.begin()
+        try:
+            state.recv_time = recv_time
+            state.frame_cnt = self._frame_cnt
+            state.frame = frame
+            if self._basic:
+                state.P[...] = np.reshape(frame["3D_Positions"], (20, 20, 3))
+                state.D[...] = np.reshape(frame["3D_Displacements"], (20, 20, 3))
+                state.F[...] = np.reshape(frame["3D_Forces"], (20, 20, 3))
+                state.Fr[:] = np.reshape(frame["3D_ResultantForce"], -1)
+                state.Mr[:] = np.reshape(frame["3D_ResultantMoment"], -1)
+        except BaseException:
+            self._buffers.abort()
+            raise
+        self._buffers.publish()
         return True
 
 
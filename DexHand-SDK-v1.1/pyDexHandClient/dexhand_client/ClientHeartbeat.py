@@ -0,0 +1,247 @@
+from .ClientLogger import ClientLogger
+
+import threading
+import time
+
+
+class HeartbeatScheduler:
+    """
+    Heartbeat sender and link watchdog of `DexHandClient`, driven by `time.monotonic()`.
+
+    While the client controls DexHand, an `Acquire` heartbeat is sent every `period` seconds. The
+    schedule is kept on absolute deadlines, so a late tick does not shift the following ones; ticks
+    which could not be served in time are counted as misses instead of being sent in a burst.
+
+    The watchdog checks the age of the latest hand data. When no data arrives for `data_timeout`
+    seconds a "timeout" event is pushed to the listeners, and a "recovery" event when data comes
+    back. Command calls gate on `wait_ready()` instead of polling.
+    """
+
+    EVENT_TIMEOUT = "timeout"
+    EVENT_RECOVERY = "recovery"
+
+    STATE_WAITING = "waiting"  # no hand data received yet
+    STATE_ALIVE = "alive"
+    STATE_TIMEOUT = "timeout"
+
+    def __init__(self, client, period: float = 0.1, data_timeout: float = 1.0, max_hb_age: float = 0.5):
+        """
+        Parameters:
+        ---
+            - client: the `DexHandClient`
+            - period: heartbeat period (in s)
+            - data_timeout: the link is considered lost after this long without hand data (in s)
+            - max_hb_age: commands wait until the latest heartbeat is younger than this (in s)
+        """
+        self._client = client
+        self._logger: ClientLogger = client.logger
+        self.period = period
+        self.data_timeout = data_timeout
+        self.max_hb_age = max_hb_age
+
+        self._cond = threading.Condition()
+        self._stop_event = threading.Event()
+        self._listeners = []
+        self.state = HeartbeatScheduler.STATE_WAITING
+        self.last_sent = None
+
+        self._ticks = 0
+        self._sent = 0
+        self._misses = 0
+        self._jitter_sum = 0.0
+        self._jitter_max = 0.0
+        self._timeouts = 0
+        self._recoveries = 0
+        self.running = False
+
+    def start(self):
+        """
+        Start the scheduler thread.
+
+        Parameters:
+        ---
+            - None
+        """
+        if self.running:
+            return
+        self.running = True
+        self._stop_event.clear()
+        self.thread = threading.Thread(target=self._run, args=())
+        self.thread.setDaemon(True)
+        self.thread.start()
+
+    def stop(self):
+        """
+        Stop the scheduler thread and release every caller blocked in `wait_ready()`.
+
+        Parameters:
+        ---
+            - None
+        """
+        if not self.running:
+            return
+        self.running = False
+        self._stop_event.set()
+        with self._cond:
+            self._cond.notify_all()
+        if threading.current_thread() is not self.thread:
+            self.thread.join()
+
+    def add_listener(self, callback):
+        """
+        Register a link event listener. It is called from the scheduler thread as
+        `callback(event, info)`, where `event` is "timeout" or "recovery" and `info` is the dict of `stats()`.
+
+        Parameters:
+        ---
+            - callback: the listener
+        """
+        with self._cond:
+            if callback not in self._listeners:
+                self._listeners.append(callback)
+
+    def remove_listener(self, callback):
+        """
+        Unregister a listener added by `add_listener()`.
+
+        Parameters:
+        ---
+            - callback: the listener
+        """
+        with self._cond:
+            if callback in self._listeners:
+                self._listeners.remove(callback)
+
+    def notify_sent(self):
+        """
+        Record a heartbeat which was sent outside the schedule, e.g. by `acquire_hand()`.
+        """
+        with self._cond:
+            self.last_sent = time.monotonic()
+            self._cond.notify_all()
+
+    def wait_ready(self, timeout=None) -> bool:
+        """
+        Block until the latest heartbeat is younger than `max_hb_age`. Return at once if DexHand is
+        not acquired, and stop waiting if the link times out or the scheduler is stopped.
+
+        Parameters:
+        ---
+            - timeout: maximum waiting time (in s), None to wait without limit
+
+        Returns:
+        ---
+            - True if a command can be sent
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while True:
+                if not self._client.acquired_hand or not self.running:
+                    return True
+                now = time.monotonic()
+                if self.last_sent is not None and now - self.last_sent <= self.max_hb_age:
+                    return True
+                if deadline is not None and now >= deadline:
+                    return False
+                # woken by the next heartbeat; the timeout only guards against a missed notification
+                self._cond.wait(self.period if deadline is None else min(self.period, deadline - now))
+
+    def stats(self):
+        """
+        Get heartbeat and watchdog metrics.
+
+        Returns:
+        ---
+            - state: "waiting" (no hand data yet), "alive" or "timeout"
+            - ticks: scheduler ticks served
+            - sent: heartbeats sent
+            - misses: ticks skipped because the scheduler thread was late by more than one period
+            - jitter_avg / jitter_max: delay of ticks behind their deadline (in s)
+            - data_age: seconds since the latest hand data (None if none received)
+            - timeouts / recoveries: number of link events
+        """
+        with self._cond:
+            ticks = self._ticks
+            return {
+                "state": self.state,
+                "ticks": ticks,
+                "sent": self._sent,
+                "misses": self._misses,
+                "jitter_avg": self._jitter_sum / ticks if ticks else None,
+                "jitter_max": self._jitter_max if ticks else None,
+                "data_age": self._data_age(time.monotonic()),
+                "timeouts": self._timeouts,
+                "recoveries": self._recoveries,
+            }
+
+    ####################################################################
+    #####                                                          #####
+    #####               Belows are private functions.              #####
+    #####                                                          #####
+    ####################################################################
+
+    def _run(self):
+        deadline = time.monotonic()
+        while self.running:
+            if self._client._in_emg_stop:
+                break
+            now = time.monotonic()
+            late = now - deadline
+            # deadlines which already passed are skipped, not caught up in a burst
+            missed = int(late // self.period) if late > 0 else 0
+            with self._cond:
+                self._ticks += 1
+                self._misses += missed
+                jitter = late - missed * self.period
+                self._jitter_sum += jitter
+                self._jitter_max = max(self._jitter_max, jitter)
+            deadline += (missed + 1) * self.period
+
+            if self._client.acquired_hand:
+                task_id = self._client.task_manager.get_task_id()
+                self._client._pack_and_send_msg("Hand", "Acquire", task_id)
+                with self._cond:
+                    self._sent += 1
+                    self.last_sent = time.monotonic()
+                    self._cond.notify_all()
+
+            self._check_link(time.monotonic())
+            self._stop_event.wait(max(0.0, deadline - time.monotonic()))
+
+    def _data_age(self, now):
+        hand_data = self._client.data_manager.hand_data
+        if hand_data is None or hand_data._recv_monotonic is None:
+            return None
+        return now - hand_data._recv_monotonic
+
+    def _check_link(self, now):
+        age = self._data_age(now)
+        if age is None:
+            return
+        if self.state != HeartbeatScheduler.STATE_TIMEOUT and age > self.data_timeout:
+            self._logger.push_log(ClientLogger.ERROR, "Client: Timeout. DexHand Server may be not available.")
+            self._client.acquired_hand = False
+            with self._cond:
+                self.state = HeartbeatScheduler.STATE_TIMEOUT
+                self._timeouts += 1
+                self._cond.notify_all()
+            self._emit(HeartbeatScheduler.EVENT_TIMEOUT)
+        elif self.state != HeartbeatScheduler.STATE_ALIVE and age <= self.data_timeout:
+            recovered = self.state == HeartbeatScheduler.STATE_TIMEOUT
+            with self._cond:
+                self.state = HeartbeatScheduler.STATE_ALIVE
+                if recovered:
+                    self._recoveries += 1
+            if recovered:
+                self._logger.push_log(ClientLogger.INFO, "Client: DexHand data received again.")
+                self._emit(HeartbeatScheduler.EVENT_RECOVERY)
+
+    def _emit(self, event):
+        with self._cond:
+            listeners = list(self._listeners)
+        info = self.stats()
+        for callback in listeners:
+            try:
+                callback(event, info)
+            except Exception as e:
+                self._logger.push_log(ClientLogger.ERROR, f"Client: heartbeat listener failed ({e!r}).")
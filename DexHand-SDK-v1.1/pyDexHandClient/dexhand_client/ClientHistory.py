@@ -0,0 +1,239 @@
+import numpy as np
+
+
+class HistoryWindow:
+    """
+    A time window of DexHand telemetry returned by `HandHistory.window()` / `HandHistory.since()`.
+
+    Every column is a numpy view into the ring buffer of `HandHistory` (no copy). A row may be
+    overwritten once its sample is no longer among the latest `capacity` samples; use `copy()` to
+    keep a window longer.
+
+    Columns:
+    ---
+        - t: receive time of each sample (in s, server clock), shape (n,)
+        - pos / speed / current: now_pos (mm), now_speed, now_current, shape (n,)
+        - force: now_force of each finger (N), shape (n, fingers)
+        - acc / gyr: imu_acc, imu_gyr, shape (n, 3)
+        - contact: is_contact of each finger, shape (n, fingers)
+    """
+
+    COLUMNS = ("t", "pos", "speed", "current", "force", "acc", "gyr", "contact")
+
+    __slots__ = COLUMNS
+
+    def __init__(self, columns, start, stop):
+        for name in HistoryWindow.COLUMNS:
+            setattr(self, name, columns[name][start:stop])
+
+    def __len__(self):
+        return len(self.t)
+
+    def copy(self):
+        window = HistoryWindow.__new__(HistoryWindow)
+        for name in HistoryWindow.COLUMNS:
+            setattr(window, name, getattr(self, name).copy())
+        return window
+
+    def __repr__(self):
+        if len(self) == 0:
+            return "HistoryWindow(empty)"
+        return f"HistoryWindow({len(self)} samples, {self.t[0]:.3f}..{self.t[-1]:.3f})"
+
+
+class HandHistory:
+    """
+    Fixed-capacity ring buffer of recent DexHand telemetry, stored in preallocated numpy columns.
+
+    The columns hold `2 * capacity` rows and samples are appended at an increasing write index. When
+    the index reaches the end, the latest `capacity - 1` rows are moved back to the front once, so the
+    recorded samples are always contiguous and every query can return views instead of copies.
+
+    Enable it with `client.hand_info.enable_history()`; it is filled by the receive thread.
+    """
+
+    def __init__(self, capacity: int = 2000, fingers: int = None):
+        """
+        Parameters:
+        ---
+            - capacity: number of samples kept
+            - fingers: number of fingers reported in now_force / is_contact, None to take it from the
+              first sample which carries them
+        """
+        if capacity < 2:
+            raise ValueError("capacity should be at least 2.")
+        self.capacity = capacity
+        self.fingers = fingers
+        rows = 2 * capacity
+        width = 0 if fingers is None else fingers
+        self._columns = {
+            "t": np.zeros(rows, dtype=np.float64),
+            "pos": np.zeros(rows, dtype=np.float64),
+            "speed": np.zeros(rows, dtype=np.float64),
+            "current": np.zeros(rows, dtype=np.float64),
+            "force": np.full((rows, width), np.nan, dtype=np.float64),
+            "acc": np.zeros((rows, 3), dtype=np.float64),
+            "gyr": np.zeros((rows, 3), dtype=np.float64),
+            "contact": np.zeros((rows, width), dtype=bool),
+        }
+        # (start, stop) of the recorded rows, replaced as a whole so that readers get a consistent pair
+        self._span = (0, 0)
+        self.total = 0
+        self.skipped = 0
+
+    def __len__(self):
+        start, stop = self._span
+        return stop - start
+
+    def append(self, recv_time, pos=None, speed=None, current=None, force=None, acc=None, gyr=None, contact=None):
+        """
+        Record one sample. Called by `DexHandDataManager` for every hand frame; fields which are not
+        enabled in `InfoComponents` are recorded as NaN (or False for contact).
+
+        Returns:
+        ---
+            - False if the sample was skipped because its finger count does not match `fingers`
+        """
+        if not self._check_fingers(force, contact):
+            self.skipped += 1
+            return False
+
+        start, stop = self._span
+        if stop == len(self._columns["t"]):
+            # move the latest rows back to the front, the rows of views taken before are left untouched
+            keep = self.capacity - 1
+            for column in self._columns.values():
+                column[:keep] = column[stop - keep : stop]
+            start, stop = 0, keep
+
+        columns = self._columns
+        columns["t"][stop] = recv_time
+        columns["pos"][stop] = np.nan if pos is None else pos
+        columns["speed"][stop] = np.nan if speed is None else speed
+        columns["current"][stop] = np.nan if current is None else current
+        columns["force"][stop] = np.nan if force is None else force
+        columns["acc"][stop] = np.nan if acc is None else acc
+        columns["gyr"][stop] = np.nan if gyr is None else gyr
+        columns["contact"][stop] = False if contact is None else contact
+
+        stop += 1
+        self._span = (max(start, stop - self.capacity), stop)
+        self.total += 1
+        return True
+
+    def clear(self):
+        """
+        Drop all recorded samples.
+        """
+        self._span = (0, 0)
+        self.total = 0
+        self.skipped = 0
+
+    def latest(self, n: int) -> HistoryWindow:
+        """
+        Get the latest `n` samples (or fewer if not recorded yet).
+
+        Parameters:
+        ---
+            - n: number of samples
+        """
+        start, stop = self._span
+        return HistoryWindow(self._columns, max(start, stop - n), stop)
+
+    def window(self, seconds: float) -> HistoryWindow:
+        """
+        Get the samples of the last `seconds` seconds, counted back from the latest sample.
+
+        Parameters:
+        ---
+            - seconds: length of the window (in s)
+        """
+        start, stop = self._span
+        if start == stop:
+            return HistoryWindow(self._columns, start, stop)
+        t = self._columns["t"]
+        return self._since(start, stop, t[stop - 1] - seconds)
+
+    def since(self, t: float) -> HistoryWindow:
+        """
+        Get the samples received at or after time `t`.
+
+        Parameters:
+        ---
+            - t: start time, on the same clock as `hand_info.recv_time` (server time, in s)
+        """
+        start, stop = self._span
+        return self._since(start, stop, t)
+
+    @staticmethod
+    def rolling_mean(values, n: int):
+        """
+        Moving average over the last `n` samples, computed with one cumulative sum.
+
+        Parameters:
+        ---
+            - values: a column of a `HistoryWindow`, shape (m,) or (m, k)
+            - n: window length (in samples)
+
+        Returns:
+        ---
+            - array of shape (m - n + 1, ...) whose i-th row is the mean of `values[i : i + n]`
+        """
+        values = np.asarray(values, dtype=np.float64)
+        if n < 1:
+            raise ValueError("n should be at least 1.")
+        if len(values) < n:
+            return np.empty((0,) + values.shape[1:], dtype=np.float64)
+        csum = np.cumsum(values, axis=0)
+        out = csum[n - 1 :].copy()
+        out[1:] -= csum[:-n]
+        out /= n
+        return out
+
+    @staticmethod
+    def derivative(values, t):
+        """
+        Time derivative of a column, e.g. `derivative(w.pos, w.t)` for the finger velocity.
+        Uses central differences inside the window and one-sided ones at both ends; samples with the
+        same timestamp give inf / NaN.
+
+        Parameters:
+        ---
+            - values: a column of a `HistoryWindow`, shape (m,) or (m, k)
+            - t: the `t` column of the same window, shape (m,)
+
+        Returns:
+        ---
+            - array of the same shape as `values` (all NaN if fewer than 2 samples)
+        """
+        values = np.asarray(values, dtype=np.float64)
+        if len(values) < 2:
+            return np.full_like(values, np.nan)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return np.gradient(values, np.asarray(t, dtype=np.float64), axis=0)
+
+    ####################################################################
+    #####                                                          #####
+    #####               Belows are private functions.              #####
+    #####                                                          #####
+    ####################################################################
+
+    def _check_fingers(self, force, contact):
+        sizes = {len(value) for value in (force, contact) if value is not None}
+        if not sizes:
+            return True
+        if len(sizes) > 1:
+            return False
+        size = sizes.pop()
+        if self.fingers is None:
+            # sized from the first sample; the rows recorded before have no finger data
+            rows = len(self._columns["t"])
+            self._columns["force"] = np.full((rows, size), np.nan, dtype=np.float64)
+            self._columns["contact"] = np.zeros((rows, size), dtype=bool)
+            self.fingers = size
+        return size == self.fingers
+
+    def _since(self, start, stop, t0):
+        # timestamps are appended in order, so the window starts at a binary-searched row
+        first = start + int(np.searchsorted(self._columns["t"][start:stop], t0, side="left"))
+        return HistoryWindow(self._columns, first, stop)
@@ -1,5 +1,7 @@
 from .ClientLogger import ClientLogger
+import collections
 import numpy as np
+import threading
 import time
 from enum import Enum
 
@@ -16,6 +18,10 @@ class TaskInfo:
         self.state = ServiceTaskManager.TASK_UNKNOWN
         self.started = False
         self.stopped = False
+        self.cond = threading.Condition()
+        self.create_time = time.monotonic()
+        self.waiting = False
+        self.claimed = False
 
 
 class ServiceTaskManager:
@@ -26,103 +32,235 @@ class ServiceTaskManager:
     TASK_FAILED = 4
     TASK_SUCCEED = 5
 
+    # seconds to wait for the server to acknowledge a task before it is considered lost
+    SEND_TIMEOUT = 1.0
+    # seconds an unclaimed task (e.g. a heartbeat) stays in the table
+    TASK_TTL = 5.0
+    # number of evicted task IDs remembered to tell late replies from unmatched ones
+    EXPIRED_MEMORY = 1024
+
     def __init__(self, parent, logger: ClientLogger):
         self.parent = parent
         self.task_id = np.random.randint(0, 65536)
-        self.task_list = []
         self.logger = logger
-        self._need_popout = False
+        self._tasks = {}
+        self._expired = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._last_evict = time.monotonic()
+        self._popout = False
+        self._popout_gen = 0
+        self.lost_count = 0
+        self.late_count = 0
+        self.unmatched_count = 0
+        # called with replies of unregistered tasks, returns True if the reply was consumed
+        self.stream_handler = None
+
+    @property
+    def _need_popout(self):
+        return self._popout
+
+    @_need_popout.setter
+    def _need_popout(self, value):
+        # waiters only compare generations, so a short pulse of the flag still aborts every pending task
+        self._popout = value
+        if value:
+            self._popout_gen += 1
+            with self._lock:
+                pending = list(self._tasks.values())
+            for now_task in pending:
+                with now_task.cond:
+                    now_task.cond.notify_all()
 
-    def get_task_id(self):
-        assigned_task_id = self.task_id
-        self.task_id = (self.task_id + 1) % 65536
+    def get_task_id(self, register: bool = True):
+        """
+        Allocate a task ID and register it in the task table, so that replies arriving before
+        `listen_in_task` / `check_task_copy` is called are not lost.
+
+        Parameters:
+        ---
+            - register: set to False for tasks whose replies are handled by `stream_handler`
+        """
+        with self._lock:
+            self._evict(time.monotonic())
+            # after the 16-bit counter wraps around, skip IDs which are still in the table
+            for _ in range(65536):
+                assigned_task_id = self.task_id
+                self.task_id = (self.task_id + 1) % 65536
+                if assigned_task_id not in self._tasks:
+                    break
+            else:
+                raise RuntimeError("Client: no free task ID.")
+            if register:
+                self._tasks[assigned_task_id] = TaskInfo(assigned_task_id)
+            self._expired.pop(assigned_task_id, None)
         return assigned_task_id
 
     def check_task_copy(self, task_id: int, task_name: str) -> TASKRET:
-        now_task = TaskInfo(task_id)
-        st_time = time.time()
-        self.task_list.append(now_task)
+        now_task = self._claim(task_id)
+        popout_gen = self._popout_gen
+        lost = False
+        try:
+            if not self._wait_task(now_task, "sent", popout_gen, self.SEND_TIMEOUT):
+                if not self._popped(popout_gen):
+                    self._log_timeout()
+                    lost = True
+                    return TASKRET.lost.value
 
-        while now_task.sent == False and not self._need_popout:
-            time.sleep(0.001)
-            if self._check_timeout(st_time):
-                self.task_list.remove(now_task)
-                return TASKRET.lost.value
+            # check arg error
+            if now_task.state == ServiceTaskManager.TASK_ARG_ERROR or self._popped(popout_gen):
+                return TASKRET.failed.value
 
-        # check arg error
-        if now_task.state == ServiceTaskManager.TASK_ARG_ERROR or self._need_popout:
-            self.task_list.remove(now_task)
-            return TASKRET.failed.value
+            self._wait_task(now_task, "started", popout_gen)
+            return TASKRET.failed.value if self._popped(popout_gen) else TASKRET.succeeded.value
+        finally:
+            self._release(now_task, lost)
 
-        while now_task.started == False and not self._need_popout:
-            time.sleep(0.001)
+    def listen_in_task(self, task_id: int, task_name: str)-> TASKRET:
+        now_task = self._claim(task_id)
+        popout_gen = self._popout_gen
+        lost = False
+        try:
+            if not self._wait_task(now_task, "sent", popout_gen, self.SEND_TIMEOUT):
+                if not self._popped(popout_gen):
+                    self._log_timeout()
+                    lost = True
+                    return TASKRET.lost.value
 
-        self.task_list.remove(now_task)
-        return TASKRET.failed.value if self._need_popout else TASKRET.succeeded.value
+            # check arg error
+            if now_task.state == ServiceTaskManager.TASK_ARG_ERROR or self._popped(popout_gen):
+                return TASKRET.failed.value
 
-    def listen_in_task(self, task_id: int, task_name: str)-> TASKRET:
-        now_task = TaskInfo(task_id)
-        st_time = time.time()
-        self.task_list.append(now_task)
-
-        while now_task.sent == False and not self._need_popout:
-            time.sleep(0.001)
-            if self._check_timeout(st_time):
-                self.task_list.remove(now_task)
-                return TASKRET.lost.value
-
-        # check arg error
-        if now_task.state == ServiceTaskManager.TASK_ARG_ERROR or self._need_popout:
-            self.task_list.remove(now_task)
-            return TASKRET.failed.value
-        while now_task.started == False and not self._need_popout:
-            time.sleep(0.001)
-        while now_task.stopped == False and not self._need_popout:
-            time.sleep(0.001)
-
-        if self._need_popout:
-            self.task_list.remove(now_task)
-            return TASKRET.failed.value
-        self.task_list.remove(now_task)
-        return TASKRET.succeeded.value if now_task.state == ServiceTaskManager.TASK_SUCCEED else TASKRET.failed.value
+            if not self._wait_task(now_task, "stopped", popout_gen):
+                return TASKRET.failed.value
+            return TASKRET.succeeded.value if now_task.state == ServiceTaskManager.TASK_SUCCEED else TASKRET.failed.value
+        finally:
+            self._release(now_task, lost)
+
+    def stats(self):
+        """
+        Get statistics of the task table.
+
+        Returns:
+        ---
+            - pending: number of tasks in the table
+            - lost: tasks whose first reply did not arrive within `SEND_TIMEOUT`
+            - late: replies to tasks which had already been evicted
+            - unmatched: replies with an unknown TaskID
+        """
+        with self._lock:
+            return {
+                "pending": len(self._tasks),
+                "lost": self.lost_count,
+                "late": self.late_count,
+                "unmatched": self.unmatched_count,
+            }
 
     def unpack_msg(self, data):
-        for now_task in self.task_list:
-            if data["TaskID"] == now_task.id:
-                if data["SubTask"] == False:
-                    now_task.state = data["TaskInfo"]
-                    # got message
-                    if (
-                        now_task.state == ServiceTaskManager.TASK_ARG_ERROR
-                        or now_task.state == ServiceTaskManager.TASK_START
-                        or now_task.state == ServiceTaskManager.TASK_UPDATE
-                        or now_task.state == ServiceTaskManager.TASK_FAILED
-                        or now_task.state == ServiceTaskManager.TASK_SUCCEED
-                    ):
-                        now_task.sent = True
-                    # start
-                    if (
-                        now_task.state == ServiceTaskManager.TASK_START
-                        or now_task.state == ServiceTaskManager.TASK_UPDATE
-                        or now_task.state == ServiceTaskManager.TASK_FAILED
-                        or now_task.state == ServiceTaskManager.TASK_SUCCEED
-                    ):
-                        now_task.started = True
-                    # end
-                    if (
-                        now_task.state == ServiceTaskManager.TASK_FAILED
-                        or now_task.state == ServiceTaskManager.TASK_SUCCEED
-                    ):
-                        now_task.stopped = True
-
-                if data["Msg"] is None:
-                    return
-                msg = data["Msg"]
-                device = data["Device"]
-                self.logger.push_log(data["LogLevel"], f"{device}: {msg}", from_server=True)
-
-    def _check_timeout(self, st_time):
-        if time.time() > st_time + 1:
-            self.logger.push_log(self.logger.WARN,"Client: Timeout. The package may be lost.")
-            return True
-        return False
+        with self._lock:
+            now_task = self._tasks.get(data["TaskID"])
+        if now_task is None:
+            stream_handler = self.stream_handler
+            if stream_handler is None or not stream_handler(data):
+                with self._lock:
+                    if data["TaskID"] in self._expired:
+                        self.late_count += 1
+                    else:
+                        self.unmatched_count += 1
+                return
+
+        elif data["SubTask"] == False:
+            with now_task.cond:
+                now_task.state = data["TaskInfo"]
+                # got message
+                if (
+                    now_task.state == ServiceTaskManager.TASK_ARG_ERROR
+                    or now_task.state == ServiceTaskManager.TASK_START
+                    or now_task.state == ServiceTaskManager.TASK_UPDATE
+                    or now_task.state == ServiceTaskManager.TASK_FAILED
+                    or now_task.state == ServiceTaskManager.TASK_SUCCEED
+                ):
+                    now_task.sent = True
+                # start
+                if (
+                    now_task.state == ServiceTaskManager.TASK_START
+                    or now_task.state == ServiceTaskManager.TASK_UPDATE
+                    or now_task.state == ServiceTaskManager.TASK_FAILED
+                    or now_task.state == ServiceTaskManager.TASK_SUCCEED
+                ):
+                    now_task.started = True
+                # end
+                if (
+                    now_task.state == ServiceTaskManager.TASK_FAILED
+                    or now_task.state == ServiceTaskManager.TASK_SUCCEED
+                ):
+                    now_task.stopped = True
+                now_task.cond.notify_all()
+
+        if data["Msg"] is None:
+            return
+        msg = data["Msg"]
+        device = data["Device"]
+        self.logger.push_log(data["LogLevel"], f"{device}: {msg}", from_server=True)
+
+    def _popped(self, popout_gen):
+        return self._popout or popout_gen != self._popout_gen
+
+    def _wait_task(self, now_task: TaskInfo, flag: str, popout_gen: int, timeout=None) -> bool:
+        """
+        Block until `unpack_msg` sets `flag` of the task. Return False on timeout or when `_need_popout` is raised.
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with now_task.cond:
+            while not getattr(now_task, flag):
+                if self._popped(popout_gen):
+                    return False
+                if deadline is None:
+                    now_task.cond.wait()
+                else:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        return False
+                    now_task.cond.wait(remaining)
+        return True
+
+    def _claim(self, task_id):
+        with self._lock:
+            now_task = self._tasks.get(task_id)
+            if now_task is None:
+                # the ID was not allocated by get_task_id, or it has been evicted already
+                now_task = TaskInfo(task_id)
+                self._tasks[task_id] = now_task
+            now_task.waiting = True
+        return now_task
+
+    def _release(self, now_task: TaskInfo, lost: bool):
+        with self._lock:
+            now_task.waiting = False
+            now_task.claimed = True
+            if lost:
+                self.lost_count += 1
+                self._expire(now_task.id)
+            elif now_task.stopped:
+                self._expire(now_task.id)
+
+    def _expire(self, task_id):
+        # self._lock must be held
+        self._tasks.pop(task_id, None)
+        self._expired[task_id] = None
+        self._expired.move_to_end(task_id)
+        if len(self._expired) > self.EXPIRED_MEMORY:
+            self._expired.popitem(last=False)
+
+    def _evict(self, now):
+        # self._lock must be held; sweep at most every 0.1 s
+        if now - self._last_evict < 0.1:
+            return
+        self._last_evict = now
+        for task_id, now_task in list(self._tasks.items()):
+            if now_task.waiting:
+                continue
+            if (now_task.claimed and now_task.stopped) or now - now_task.create_time > self.TASK_TTL:
+                self._expire(task_id)
+
+    def _log_timeout(self):
+        self.logger.push_log(self.logger.WARN,"Client: Timeout. The package may be lost.")
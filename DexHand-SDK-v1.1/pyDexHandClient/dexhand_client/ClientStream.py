@@ -0,0 +1,207 @@
+from .ClientLogger import ClientLogger
+from .ClientService import ServiceTaskManager
+
+import collections
+import threading
+import time
+
+
+class SetpointStream:
+    """
+    Fire-and-forget setpoint channel for high-rate closed-loop control.
+
+    Setpoints are sent as `PosServo` / `ForceServo` commands without waiting for the server to
+    acknowledge them. Only the latest setpoint is kept: if several setpoints are given between two
+    sending slots, the older ones are dropped (coalesced). Acknowledgements and errors are counted
+    when they arrive, and a summary is reported every `report_interval` seconds.
+
+    Use `DexHandClient.open_setpoint_stream()` to create a stream.
+    """
+
+    # seconds to wait for the acknowledgement of a setpoint before it is considered lost
+    ACK_TIMEOUT = 1.0
+
+    def __init__(self, client, rate: float = 500.0, report_callback=None, report_interval: float = 1.0):
+        self._client = client
+        self._task_manager: ServiceTaskManager = client.task_manager
+        self._logger: ClientLogger = client.logger
+        self.interval = 1.0 / rate
+        self.report_callback = report_callback
+        self.report_interval = report_interval
+
+        self._lock = threading.Lock()
+        self._event = threading.Event()
+        self._pending = None
+        self._inflight = collections.OrderedDict()
+        self._counters = self._new_counters()
+        self.last_report = None
+        self.running = False
+
+    def start(self):
+        """
+        Start the sending thread.
+
+        Parameters:
+        ---
+            - None
+        """
+        if self.running:
+            return
+        self.running = True
+        self._task_manager.stream_handler = self._handle_reply
+        self.thread = threading.Thread(target=self._sender, args=())
+        self.thread.setDaemon(True)
+        self.thread.start()
+
+    def stop(self):
+        """
+        Stop the sending thread. Setpoints not sent yet are discarded.
+
+        Parameters:
+        ---
+            - None
+        """
+        if not self.running:
+            return
+        self.running = False
+        self._event.set()
+        if threading.current_thread() is not self.thread:
+            self.thread.join()
+        if self._task_manager.stream_handler == self._handle_reply:
+            self._task_manager.stream_handler = None
+
+    def set_pos(self, goal_pos: float, max_f: float = 1.0):
+        """
+        Update the position setpoint. Streamed version of `DexHandClient.pos_servo()`.
+
+        Parameters:
+        ---
+            - goal_pos: the assigned position (in mm)
+            - max_f: the maximum force that is allowed when moving (in N)
+        """
+        self._put(("PosServo", {"goal_pos": goal_pos, "max_f": max_f}))
+
+    def set_force(self, goal_force: float):
+        """
+        Update the force setpoint. Streamed version of `DexHandClient.force_servo()`.
+
+        Parameters:
+        ---
+            - goal_force: desired grasping force (in N)
+        """
+        self._put(("ForceServo", {"goal_force": goal_force}))
+
+    def stats(self):
+        """
+        Get the statistics of the current (unfinished) report period.
+
+        Returns:
+        ---
+            - sent: setpoints sent
+            - coalesced: setpoints overwritten by a newer one before being sent
+            - acked: setpoints started by the server
+            - errors: setpoints rejected by the server (argument error or failed)
+            - lost: setpoints without acknowledgement within `ACK_TIMEOUT`
+            - ack_latency_avg / ack_latency_max: acknowledgement latency (in s)
+        """
+        with self._lock:
+            return self._summary(self._counters)
+
+    ####################################################################
+    #####                                                          #####
+    #####               Belows are private functions.              #####
+    #####                                                          #####
+    ####################################################################
+
+    def _new_counters(self):
+        return {"sent": 0, "coalesced": 0, "acked": 0, "errors": 0, "lost": 0, "latency_sum": 0.0, "latency_max": 0.0}
+
+    def _summary(self, counters):
+        acked = counters["acked"]
+        return {
+            "sent": counters["sent"],
+            "coalesced": counters["coalesced"],
+            "acked": acked,
+            "errors": counters["errors"],
+            "lost": counters["lost"],
+            "ack_latency_avg": counters["latency_sum"] / acked if acked else None,
+            "ack_latency_max": counters["latency_max"] if acked else None,
+        }
+
+    def _put(self, setpoint):
+        with self._lock:
+            if self._pending is not None:
+                self._counters["coalesced"] += 1
+            self._pending = setpoint
+        self._event.set()
+
+    def _sender(self):
+        next_slot = time.monotonic()
+        next_report = next_slot + self.report_interval
+        while self.running:
+            self._event.wait(max(0.0, min(next_report - time.monotonic(), self.ACK_TIMEOUT)))
+            now = time.monotonic()
+            if now >= next_report:
+                self._report(now)
+                next_report = now + self.report_interval
+            if not self._event.is_set() or not self.running:
+                continue
+
+            # keep at most one setpoint per sending slot, later ones overwrite the pending one
+            if now < next_slot:
+                time.sleep(next_slot - now)
+            with self._lock:
+                self._event.clear()
+                setpoint = self._pending
+                self._pending = None
+            if setpoint is None:
+                continue
+
+            cmd_type, kwargs = setpoint
+            task_id = self._task_manager.get_task_id(register=False)
+            send_time = time.monotonic()
+            with self._lock:
+                self._inflight[task_id] = [send_time, False]
+                self._counters["sent"] += 1
+            self._client._pack_and_send_msg("Hand", cmd_type, task_id, **kwargs)
+            next_slot = max(next_slot + self.interval, send_time)
+
+    def _handle_reply(self, data):
+        with self._lock:
+            record = self._inflight.get(data["TaskID"])
+            if record is None:
+                return False
+            # only the first reply of a setpoint is counted, later state updates are swallowed
+            if data["SubTask"] == False and not record[1] and data["TaskInfo"] != ServiceTaskManager.TASK_UNKNOWN:
+                record[1] = True
+                state = data["TaskInfo"]
+                if state == ServiceTaskManager.TASK_ARG_ERROR or state == ServiceTaskManager.TASK_FAILED:
+                    self._counters["errors"] += 1
+                else:
+                    latency = time.monotonic() - record[0]
+                    self._counters["acked"] += 1
+                    self._counters["latency_sum"] += latency
+                    self._counters["latency_max"] = max(self._counters["latency_max"], latency)
+        return True
+
+    def _report(self, now):
+        with self._lock:
+            # setpoints are sent in order, so the expired ones are at the front
+            while self._inflight:
+                task_id, (send_time, replied) = next(iter(self._inflight.items()))
+                if now - send_time < self.ACK_TIMEOUT:
+                    break
+                del self._inflight[task_id]
+                if not replied:
+                    self._counters["lost"] += 1
+            counters = self._counters
+            self._counters = self._new_counters()
+
+        self.last_report = self._summary(counters)
+        if counters["errors"] or counters["lost"]:
+            self._logger.push_log(
+                ClientLogger.WARNING,
+                f"Client: setpoint stream {counters['errors']} errors, {counters['lost']} lost in the last period.",
+            )
+        if self.report_callback is not None:
+            self.report_callback(self.last_report)
@@ -1,6 +1,10 @@
+from .ClientCodec import WIRE_BINARY, WIRE_JSON, MessageDecoder, encode_command, wire_format_name
+from .ClientCodec import KIND_HAND_DATA, KIND_MESSAGE, KIND_TAC3D_DATA, KIND_TASK
 from .ClientData import DataManager
+from .ClientHeartbeat import HeartbeatScheduler
 from .ClientLogger import ClientLogger
 from .ClientService import ServiceTaskManager
+from .ClientStream import SetpointStream
 from .UDPManager import UDP_Manager
 from .UDPMCManager import UDP_MC_Manager
 
@@ -19,13 +23,33 @@ class TASKRET(Enum):
 
 
 class DexHandClient:
-    def __init__(self, ip: str, port: int, recvCallback_hand=None, ignore_myself=False):
+    def __init__(self, ip: str, port: int, recvCallback_hand=None, ignore_myself=False, wire_format=WIRE_JSON):
+        """
+        Parameters:
+        ---
+            - ip, port: address of DexHand server
+            - recvCallback_hand: called as `recvCallback_hand(client)` when hand info is updated
+            - ignore_myself: log client-side INFO messages as DEBUG
+            - wire_format: "json" or "binary". The binary format is only used if the server accepts it
+              in `start_server()`, otherwise the client falls back to JSON
+
+        Incoming messages go through `self.decoder` (a `MessageDecoder`). Relayed Tac3D data is not
+        parsed at all after `client.decoder.subscribe("Data/Tac3D", False)`, and
+        `client.decoder.stats()` reports the decode time per message kind.
+
+        Heartbeats are sent by `self.heartbeat` (a `HeartbeatScheduler`). Use
+        `client.heartbeat.add_listener(callback)` to be told about link timeouts and recoveries, and
+        `client.heartbeat.stats()` for heartbeat jitter and misses. The scheduler is stopped by
+        `stop_server()` and `close()`.
+        """
         self.local_ip = ""  # any IP address
         self.local_port = 0  # any available port
         self.server_ip = ip
         self.server_port = port
         self.goal_addr = (self.server_ip, self.server_port)
         self.acquired_hand = False
+        self.wire_format = wire_format
+        self._wire_format = WIRE_JSON  # format in use, switched by the server's reply to start_server()
 
         ### Initialize modules ###
         config_path = pkg_resources.resource_filename("dexhand_client", "config/DexHandConfig.json")
@@ -44,6 +68,21 @@ class DexHandClient:
             client_ptr=self,
         )
 
+        # messages are decoded once and dispatched by kind; data nobody consumes is not parsed
+        self.decoder = MessageDecoder()
+        self._handlers = {
+            KIND_MESSAGE: self.logger.unpack_msg,
+            KIND_TASK: self._unpack_task_msg,
+        }
+        if self.data_manager.hand_data is not None:
+            self._handlers[KIND_HAND_DATA] = self._unpack_hand_data
+        else:
+            self.decoder.subscribe(KIND_HAND_DATA, False)
+        if self.data_manager.tac3d_data is not None:
+            self._handlers[KIND_TAC3D_DATA] = self._unpack_tac3d_data
+        else:
+            self.decoder.subscribe(KIND_TAC3D_DATA, False)
+
         # command client
         self.udp_manager = UDP_Manager(
             callback=self.udp_callback,
@@ -70,14 +109,9 @@ class DexHandClient:
         self.logger.push_log(logging.INFO, "Client: Start DexHand client.")
         self._in_emg_stop = False
 
-        # hand heart beat pack
-        self.ctrl_worker = threading.Thread(
-            target=self.hb_sender,
-            args=(),
-        )
-        self.ctrl_worker.setDaemon(True)
-        self.ctrl_worker.start()
-        self.hb_time = time.time()
+        # hand heart beat pack and link watchdog
+        self.heartbeat = HeartbeatScheduler(self)
+        self.heartbeat.start()
 
     ####################################################################
     #####                                                          #####
@@ -85,27 +119,17 @@ class DexHandClient:
     #####                                                          #####
     ####################################################################
 
-    def hb_sender(self):
-        while True:
-            if self._in_emg_stop:
-                break
-            if self.acquired_hand:
-                task_id = self.task_manager.get_task_id()
-                self._pack_and_send_msg("Hand", "Acquire", task_id)
-                self.hb_time = time.time()
-            self.hand_info._watchdog +=1
-            if self.hand_info._watchdog >= 10:
-                self.logger.push_log(ClientLogger.ERROR, "Client: Timeout. DexHand Server may be not available.")
-                self.acquired_hand = False
-                raise TimeoutError("DexHand Server may be not available.")
-            time.sleep(0.1)
-
     def udp_callback(self, recvData, recvAddr):
-        data = json.loads(recvData)
-        if data["Type"] == "Message":
-            self.logger.unpack_msg(data)
-        elif data["Type"] == "Task":
-            self.task_manager.unpack_msg(data)
+        try:
+            kind, data = self.decoder.decode(recvData)
+        except ValueError as e:
+            self.logger.push_log(ClientLogger.WARNING, f"Client: drop a malformed message ({e}).")
+            return
+        if data is None:
+            return
+        handler = self._handlers.get(kind)
+        if handler is not None:
+            handler(data)
         elif data["Type"] == "Data":
             self.data_manager.unpack_msg(data)
 
@@ -132,14 +156,19 @@ class DexHandClient:
     def start_server(self):
         """
         Start DexHand server.
+        If the client was created with `wire_format="binary"`, the binary wire format is requested here.
 
         Parameters:
         ---
             - None
         """
         self.logger.push_log(logging.INFO, "Client: Try to start DexHand server.")
+        self.heartbeat.start()
         task_id = self.task_manager.get_task_id()
-        self._pack_and_send_msg("Server", "Start", task_id)
+        if self.wire_format == WIRE_BINARY:
+            self._pack_and_send_msg("Server", "Start", task_id, wire_format=wire_format_name(WIRE_BINARY))
+        else:
+            self._pack_and_send_msg("Server", "Start", task_id)
         return self.task_manager.listen_in_task(task_id, "StartServer")
          
 
@@ -159,6 +188,7 @@ class DexHandClient:
         self.logger.push_log(logging.INFO, "Client: Acquire DexHand control.")
         task_id = self.task_manager.get_task_id()
         self._pack_and_send_msg("Hand", "Acquire", task_id)
+        self.heartbeat.notify_sent()
         ret = self.task_manager.listen_in_task(task_id, "Acquire")
         self.acquired_hand = self.acquired_hand or ret
         return ret
@@ -306,6 +336,29 @@ class DexHandClient:
         self._pack_and_send_msg("Hand", "PosServo", task_id, goal_pos=goal_pos, max_f=max_f)
         return self.task_manager.check_task_copy(task_id, "PosServo")
 
+    def open_setpoint_stream(self, rate: float = 500.0, report_callback=None, report_interval: float = 1.0):
+        """
+        Open a fire-and-forget setpoint channel for high-rate closed-loop control.
+        Unlike `pos_servo()` / `force_servo()`, setpoints given to the stream are sent without waiting
+        for the server's acknowledgement, and only the latest setpoint is sent in each sending slot.
+
+        Parameters:
+        ---
+            - rate: maximum sending rate (in Hz)
+            - report_callback: called as `report_callback(stats)` every `report_interval` seconds with the
+              ack/error statistics of the period, see `SetpointStream.stats()`
+            - report_interval: statistics report period (in s)
+
+        Usage:
+        ---
+            stream = client.open_setpoint_stream(rate=500)
+            stream.set_pos(10.0, max_f=3.0)  # or stream.set_force(2.0)
+            stream.stop()
+        """
+        stream = SetpointStream(self, rate=rate, report_callback=report_callback, report_interval=report_interval)
+        stream.start()
+        return stream
+
     def impedance(self, M: float = 1.0, B: float = 0.001, K: float = 0.06, x0: float = 10.0):
         """
         Simulate the Dexhand with as an inpedance system, with mass, damp and spring.
@@ -441,7 +494,26 @@ class DexHandClient:
         self.logger.push_log(logging.INFO, "Client: Stop DexHand and server.")
         task_id = self.task_manager.get_task_id()
         self._pack_and_send_msg("Server", "Stop", task_id)
-        return self.task_manager.listen_in_task(task_id, "Stop")
+        ret = self.task_manager.listen_in_task(task_id, "Stop")
+        self.heartbeat.stop()
+        return ret
+
+    def close(self):
+        """
+        Halt and release DexHand if it is controlled by this client, then stop the heartbeat
+        and the receive threads.
+
+        Parameters:
+        ---
+            - None
+        """
+        if self.acquired_hand:
+            self.halt()
+            self.release_hand()
+        self.heartbeat.stop()
+        self.udp_manager.close()
+        self.udp_mc_manager.close()
+        self.logger.push_log(logging.INFO, "Client: Close DexHand client.")
 
     ####################################################################
     #####                                                          #####
@@ -507,6 +579,7 @@ class DexHandClient:
         self.halt()
         self.release_hand()
         self.task_manager._need_popout = True
+        self.heartbeat.stop()
         os._exit(0)
 
     def _pack_and_send_msg(self, device, cmd_type, task_id, **kwargs):
@@ -515,6 +588,9 @@ class DexHandClient:
                 ClientLogger.WARNING, f"Client: the task {cmd_type} is aborted since program is halting."
             )
             return
+        if self._wire_format == WIRE_BINARY:
+            self.udp_manager.send(encode_command(device, cmd_type, task_id, time.time(), **kwargs), self.goal_addr)
+            return
         command = {
             "Time": time.time(),
             "Command": {
@@ -527,10 +603,27 @@ class DexHandClient:
         msg_data = json.dumps(command)
         self.udp_manager.send(msg_data.encode(), self.goal_addr)
 
+    def _unpack_task_msg(self, data):
+        if "WireFormat" in data:
+            self._accept_wire_format(data["WireFormat"])
+        self.task_manager.unpack_msg(data)
+
+    def _unpack_hand_data(self, data):
+        self.data_manager.hand_data._unpack_data(data["Data"], data["Time"])
+
+    def _unpack_tac3d_data(self, data):
+        self.data_manager.tac3d_data._unpack_data(data["Data"], data["Time"], data["SN"])
+
+    def _accept_wire_format(self, server_format):
+        if server_format == wire_format_name(WIRE_BINARY) and self.wire_format == WIRE_BINARY:
+            if self._wire_format != WIRE_BINARY:
+                self.logger.push_log(ClientLogger.INFO, f"Client: use {server_format} wire format.")
+            self._wire_format = WIRE_BINARY
+        else:
+            self._wire_format = WIRE_JSON
+
     def _wait_heartbeat(self):
-        if self.acquired_hand:
-            while time.time() - self.hb_time > 0.5:
-                time.sleep(0.01)
+        self.heartbeat.wait_ready()
 
 
 if __name__ == "__main__":
@@ -5,6 +5,10 @@ Author: lhy
 """
 
 from .DexHandClient import DexHandClient
+from .AsyncDexHandClient import AsyncDexHandClient
+from .ClientStream import SetpointStream
+from .ClientHistory import HandHistory
+from .ClientHeartbeat import HeartbeatScheduler
 
 
 class TestClient:
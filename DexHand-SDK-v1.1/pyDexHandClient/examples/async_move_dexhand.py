@@ -0,0 +1,27 @@
+from dexhand_client import AsyncDexHandClient
+import asyncio
+
+
+async def report_hand_info(client: AsyncDexHandClient):
+    async for info in client.hand_updates():
+        if info.frame_cnt % 10 == 0:
+            print(f"Error:{info.error_flag}, nowforce: {info.avg_force:.3f}N nowpos: {info.now_pos:.3f}mm")
+
+
+async def main():
+    async with AsyncDexHandClient(ip="192.168.2.100", port=60031) as client:
+        reporter = asyncio.create_task(report_hand_info(client))
+        await client.start_server()
+        await client.acquire_hand()
+
+        await client.set_home()
+        await client.pos_goto(goal_pos=30, max_speed=40, max_acc=20, max_f=3)
+        await client.pos_servo(goal_pos=10, max_f=3)
+        await asyncio.sleep(2)
+
+        await client.release_hand()
+        reporter.cancel()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -65,8 +65,9 @@ if __name__ == "__main__":
 
     # 机械手的回调函数，当机械手启动后，每次返回数据时均会执行该函数
     def HandRecvCallback(client: DexHandClient):
-        info = client.hand_info
-        if info._frame_cnt % 10 == 0:
+        # snapshot()获得一致的机械手状态副本，其中各字段来自同一帧数据
+        info = client.hand_info.snapshot()
+        if info.frame_cnt % 10 == 0:
             print(
                 f"Error:{info.error_flag}, nowforce1: {info.now_force[0]:.3f}N nowforce2: {info.now_force[1]:.3f}N nowTacFz1: {tacinfo1.Fr[0][2]:.3f}N nowTacFz2: {tacinfo2.Fr[0][2]:.3f}N nowpos: {info.now_pos:.3f}mm",
                 end=" ",
@@ -8,6 +8,9 @@ setup(
         "numpy",
         "colorlog",
     ],
+    extras_require={
+        "fast": ["orjson"],
+    },
     package_data={
         "dexhand_client": ["config/*.json"],
     },
@@ -0,0 +1,171 @@
+"""
+Round trip of every DexHand message kind through the JSON and the binary wire format: both encodings
+of the same message must decode to the same dict.
+
+Usage:
+    python -m pytest tests
+"""
+
+import copy
+import json
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from dexhand_client import ClientCodec
+from dexhand_client.ClientCodec import KIND_HAND_DATA, KIND_MESSAGE, KIND_TAC3D_DATA, KIND_TASK, MessageDecoder
+
+SEND_TIME = 1760000000.25
+LONG_NAME = "CalibrateZeroAndWaitForContact"  # longer than 16 bytes
+
+HAND_DATA = {
+    "now_pos": 12.5,
+    "goal_pos": 20.0,
+    "now_speed": 3.25,
+    "goal_speed": 4.0,
+    "now_current": 0.5,
+    "goal_current": 0.75,
+    "task_info": {"now_task": LONG_NAME, "recent_task": "Grasp", "recent_task_status": 3, "error_flag": -1},
+    "now_force": [1.5, 2.25, 0.125],
+    "avg_force": 1.25,
+    "goal_force": 2.0,
+    "stiffness": 0.5,
+    "imu_acc": [0.0, 0.5, 9.75],
+    "imu_gyr": [0.125, -0.25, 0.0],
+    "is_contact": [True, False, True],
+}
+
+
+def tac3d_frame():
+    # float32 values, so the JSON (float64) and the binary (float32) encodings carry the same numbers
+    rng = np.random.default_rng(0)
+    return {
+        "3D_Positions": rng.random((400, 3), dtype=np.float32),
+        "3D_Forces": rng.random((400, 3), dtype=np.float32),
+        "3D_ResultantForce": rng.random((1, 3), dtype=np.float32),
+        "InitializeProgress": 100.0,
+    }
+
+
+def to_plain(value):
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    if isinstance(value, dict):
+        return {key: to_plain(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [to_plain(item) for item in value]
+    return value
+
+
+def json_bytes(msg):
+    return json.dumps(to_plain(msg)).encode()
+
+
+def command_pair(cmd_type, **kwargs):
+    msg = {
+        "Time": SEND_TIME,
+        "Command": {"Device": "Hand", "Type": cmd_type, "args": kwargs, "TaskID": 4321},
+    }
+    return msg, ClientCodec.encode_command("Hand", cmd_type, 4321, SEND_TIME, **kwargs)
+
+
+def task_pair(msg_text):
+    msg = {
+        "Type": "Task",
+        "Time": SEND_TIME,
+        "TaskID": 65535,
+        "SubTask": True,
+        "TaskInfo": 2,
+        "LogLevel": 30,
+        "Device": "Hand",
+        "Msg": msg_text,
+    }
+    raw = ClientCodec.encode_task(65535, 2, SEND_TIME, sub_task=True, msg=msg_text, log_level=30, device="Hand")
+    return msg, raw
+
+
+def message_pair(msg_text):
+    msg = {"Type": "Message", "Time": SEND_TIME, "LogLevel": 40, "Device": "Server", "Msg": msg_text}
+    return msg, ClientCodec.encode_message(msg_text, SEND_TIME, log_level=40, device="Server")
+
+
+def hand_pair(data):
+    msg = {"Type": "Data", "Device": "Hand", "Time": SEND_TIME, "Data": data}
+    return msg, ClientCodec.encode_hand_data(data, SEND_TIME)
+
+
+def tac3d_pair(frame):
+    msg = {"Type": "Data", "Device": "Tac3D", "Time": SEND_TIME, "SN": "HDL1-0003", "Data": frame}
+    return msg, ClientCodec.encode_tac3d_data("HDL1-0003", frame, SEND_TIME)
+
+
+CASES = {
+    "command": command_pair(
+        LONG_NAME, goal_pos=10.5, max_f=1, enable=True, mode="position control with a long name", extra=None
+    ),
+    "command without args": command_pair("Halt"),
+    "task": task_pair("Task " + LONG_NAME + " finished."),
+    "task without msg": task_pair(None),
+    "message": message_pair("A log message from the server, " + "x" * 300),
+    "hand data": hand_pair(HAND_DATA),
+    "tac3d data": tac3d_pair(tac3d_frame()),
+}
+
+
+@pytest.mark.parametrize("name", list(CASES))
+def test_json_and_binary_decode_equal(name):
+    msg, raw = CASES[name]
+    assert ClientCodec.is_binary(raw)
+    from_json = ClientCodec.decode_msg(json_bytes(msg))
+    from_binary = ClientCodec.decode_msg(raw)
+    assert to_plain(from_binary) == to_plain(from_json) == to_plain(msg)
+
+
+@pytest.mark.parametrize("name", [name for name in CASES if not name.startswith("command")])
+def test_message_decoder_kinds(name):
+    msg, raw = CASES[name]
+    decoder = MessageDecoder(json_loads=json.loads)
+    kind_json, from_json = decoder.decode(json_bytes(msg))
+    kind_binary, from_binary = decoder.decode(raw)
+    assert kind_json == kind_binary
+    assert to_plain(from_binary) == to_plain(from_json)
+
+
+def test_message_decoder_skips_unsubscribed():
+    decoder = MessageDecoder(json_loads=json.loads)
+    decoder.subscribe(KIND_TAC3D_DATA, False)
+    for raw in (json_bytes(CASES["tac3d data"][0]), CASES["tac3d data"][1]):
+        assert decoder.decode(raw) == (KIND_TAC3D_DATA, None)
+    assert decoder.decode(CASES["hand data"][1])[0] == KIND_HAND_DATA
+    assert decoder.decode(CASES["task"][1])[0] == KIND_TASK
+    assert decoder.decode(CASES["message"][1])[0] == KIND_MESSAGE
+    assert decoder.stats()[KIND_TAC3D_DATA]["skipped"] == 2
+
+
+def test_long_task_names_are_not_truncated():
+    data = copy.deepcopy(HAND_DATA)
+    data["task_info"]["now_task"] = "N" * 255
+    data["task_info"]["recent_task"] = "\u6293\u53d6" * 10  # multi-byte UTF-8
+    decoded = ClientCodec.decode_msg(ClientCodec.encode_hand_data(data, SEND_TIME))["Data"]
+    assert decoded["task_info"] == data["task_info"]
+
+
+def test_names_over_255_bytes_raise():
+    data = copy.deepcopy(HAND_DATA)
+    data["task_info"]["now_task"] = "N" * 256
+    with pytest.raises(ValueError):
+        ClientCodec.encode_hand_data(data, SEND_TIME)
+    with pytest.raises(ValueError):
+        ClientCodec.encode_command("Hand", "C" * 256, 1, SEND_TIME)
+    with pytest.raises(ValueError):
+        ClientCodec.encode_tac3d_data("S" * 256, {}, SEND_TIME)
+
+
+def test_truncated_binary_message_raises_value_error():
+    raw = ClientCodec.encode_hand_data(HAND_DATA, SEND_TIME)
+    for length in (3, 20, len(raw) - 1):
+        with pytest.raises(ValueError):
+            ClientCodec.decode_msg(raw[:length])
@@ -1,7 +1,11 @@
 import numpy as np
+import os
 import time
+import bisect
+import collections
 import struct
 import queue
+import re
 import ruamel.yaml
 import socket
 import threading
@@ -11,11 +15,23 @@ import cv2
 PYTAC3D_VERSION = '3.3.0-p1'
 
 class UDP_Manager:
-    def __init__(self, callback, isServer = False, ip = '', port = 8083, frequency = 50, inet = 4):
+    def __init__(self, callback, isServer = False, ip = '', port = 8083, frequency = 50, inet = 4, blocking = True, recvTimeout = 0.1,
+                 recvInto = False, bufferSize = 65535):
         self.callback = callback
         
         self.isServer = isServer
         self.interval = 1.0 / frequency
+        # blocking为True时接收线程阻塞在recvfrom上，数据包到达后立即调用callback。
+        # 为False时使用按frequency轮询的旧接收方式。两种方式下recvTimeout都决定
+        # close()后接收线程最迟多久退出
+        self.blocking = blocking
+        self.recvTimeout = recvTimeout
+        # recvInto为True时，同样阻塞在带超时的接收上，但用recvfrom_into将数据包
+        # 读入一个预分配并重复使用的缓冲区，再以memoryview调用callback，不为每个
+        # 数据包分配bytes。该memoryview仅在callback执行期间有效，callback需自行
+        # 复制需要保留的数据
+        self.recvInto = recvInto
+        self.bufferSize = bufferSize
 
         # self.available_addr = socket.getaddrinfo(socket.gethostname(), port)
         # self.hostname = socket.getfqdn(socket.gethostname())
@@ -48,9 +64,18 @@ class UDP_Manager:
         self.ip = self.addr[0]
         self.port = self.addr[1]
         print(self.roleName, '(UDP) at:', self.ip, ':', self.port)
+        if self.recvInto:
+            self.sockUDP.settimeout(self.recvTimeout)
+            receive = self._receiveInto
+        elif self.blocking:
+            self.sockUDP.settimeout(self.recvTimeout)
+            receive = self.receive
+        else:
+            self.sockUDP.settimeout(self.recvTimeout)
+            receive = self._receivePolling
         
         self.running = True
-        self.thread = threading.Thread(target = self.receive, args=())
+        self.thread = threading.Thread(target = receive, args=())
         self.thread.setDaemon(True)
         self.thread.start()  #打开收数据的线程
         
@@ -60,6 +85,36 @@ class UDP_Manager:
     #             print(item[4])
     
     def receive(self):
+        while self.running:
+            try:
+                recvData, recvAddr = self.sockUDP.recvfrom(65535) #等待接受数据
+            except socket.timeout:
+                continue
+            except OSError:
+                # 如Windows下向不可达的地址发送$C/$Q后recvfrom报ConnectionResetError，
+                # 只有close()之后才退出
+                if not self.running:
+                    break
+                continue
+            if recvData:
+                self.callback(recvData, recvAddr)
+
+    def _receiveInto(self):
+        view = memoryview(bytearray(self.bufferSize))
+        while self.running:
+            try:
+                length, recvAddr = self.sockUDP.recvfrom_into(view)
+            except socket.timeout:
+                continue
+            except OSError:
+                # 与receive()相同，只有close()之后才退出
+                if not self.running:
+                    break
+                continue
+            if length:
+                self.callback(view[:length], recvAddr)
+
+    def _receivePolling(self):
         while self.running:
             time.sleep(self.interval)
             while self.running:
@@ -76,11 +131,243 @@ class UDP_Manager:
 
     def close(self):
         self.running = False
+        if threading.current_thread() is not self.thread:
+            self.thread.join(self.recvTimeout * 2 + self.interval)
         self.sockUDP.close()
 
+class _HeadCodec:
+    '''
+    数据帧帧头解码器。帧头中只有index、SN和timestamp逐帧变化，data字段描述的
+    数据布局只随传感器配置（sensor.yaml中的sendData）变化。首次遇到某种布局时
+    进行完整的YAML解析并将其编译为解码计划缓存起来，此后同一布局的帧只需提取
+    这三个标量即可解码。布局变化或帧头无法识别时自动回退到完整解析。
+    '''
+    MAT = 0
+    F64 = 1
+    I32 = 2
+    IMG = 3
+
+    _scalarPattern = re.compile(rb'^(index|SN|timestamp):[ \t]*([^\r\n]*?)[ \t]*\r?$', re.M)
+    _snPattern = re.compile(rb'^SN:[ \t]*([^\r\n]*?)[ \t]*\r?$', re.M)
+
+    def __init__(self, maxCacheSize = 16):
+        self._yaml = ruamel.yaml.YAML()
+        self._plans = {}
+        self._maxCacheSize = maxCacheSize
+        self.hits = 0
+        self.misses = 0
+
+    def decode(self, headBytes):
+        scalars = {}
+        def take(match):
+            scalars[match.group(1)] = match.group(2)
+            return b''
+        layoutKey = self._scalarPattern.sub(take, headBytes)
+        cacheable = len(scalars) == 3 and self._maxCacheSize > 0
+        if cacheable:
+            try:
+                index = int(scalars[b'index'])
+                SN = scalars[b'SN'].strip(b'\'"').decode('ascii')
+                timestamp = float(scalars[b'timestamp'])
+            except ValueError:
+                cacheable = False
+            else:
+                plan = self._plans.get(layoutKey)
+                if plan is not None:
+                    self.hits += 1
+                    return index, SN, timestamp, plan
+
+        self.misses += 1
+        head = self._yaml.load(headBytes.decode('ascii'))
+        plan = self._compile(head['data'])
+        # 仅当快速提取的结果与完整解析一致时才缓存该布局
+        if cacheable and (index, SN, timestamp) == (head['index'], head['SN'], head['timestamp']):
+            if len(self._plans) >= self._maxCacheSize:
+                self._plans.clear()
+            self._plans[layoutKey] = plan
+        return head['index'], head['SN'], head['timestamp'], plan
+
+    def peekSN(self, headBytes):
+        match = self._snPattern.search(headBytes)
+        if match is not None:
+            return match.group(1).strip(b'\'"').decode('ascii')
+        return self._yaml.load(headBytes.decode('ascii'))['SN']
+
+    def _compile(self, dataInfo):
+        plan = []
+        for item in dataInfo:
+            dataType = item['type']
+            if dataType == 'mat':
+                if item['dtype'] == 'f64':
+                    plan.append((item['name'], _HeadCodec.MAT, item['offset'], item['length'], (item['height'], item['width'])))
+            elif dataType == 'f64':
+                plan.append((item['name'], _HeadCodec.F64, item['offset'], item['length'], None))
+            elif dataType == 'i32':
+                plan.append((item['name'], _HeadCodec.I32, item['offset'], item['length'], None))
+            elif dataType == 'img':
+                plan.append((item['name'], _HeadCodec.IMG, item['offset'], item['length'], None))
+        return tuple(plan)
+
+_UDP_PACKET_SIZE = 1400  # 须与Tac3D-Desktop的NetworkTransport_SDK数据包大小一致（见libTac3D.hpp）
+_PACKET_HEAD = struct.Struct('=IHH')
+_PACKET_PAYLOAD_SIZE = _UDP_PACKET_SIZE - _PACKET_HEAD.size
+
+class _RecvBuffer:
+    '''
+    一个正在重组的数据帧，对应libTac3D中的NetworkReceiveBuffer。各数据包的
+    负载按包序号直接写入data中的最终位置，data在缓冲区池中循环使用。
+    '''
+    __slots__ = ('serialNum', 'pktNum', 'pktCnt', 'timestamp', 'head', 'data', 'dataLen')
+
+    def __init__(self):
+        self.data = bytearray()
+
+    def reset(self, serialNum, pktNum):
+        self.serialNum = serialNum
+        self.pktNum = pktNum
+        self.pktCnt = 0
+        self.head = None
+        self.dataLen = 0
+        capacity = pktNum * _PACKET_PAYLOAD_SIZE
+        if len(self.data) < capacity:
+            self.data = bytearray(capacity)
+
+class _FrameRing:
+    '''
+    重组阶段与解码阶段之间的有界数据帧缓冲区。缓冲区已满时按dropPolicy处理：
+    'drop-oldest'丢弃最早的帧，'drop-newest'丢弃新完成的帧，'block'阻塞接收
+    线程直到解码线程取走一帧。
+    '''
+    DROP_POLICIES = ('drop-oldest', 'drop-newest', 'block')
+
+    def __init__(self, size, dropPolicy = 'drop-oldest'):
+        if not dropPolicy in _FrameRing.DROP_POLICIES:
+            raise ValueError('Unknown drop policy: %s' % dropPolicy)
+        self._items = collections.deque()
+        self._size = max(1, size)
+        self._dropPolicy = dropPolicy
+        self._cond = threading.Condition()
+        self._closed = False
+        self._finishing = False
+
+    def put(self, item):
+        # 返回因缓冲区已满而被丢弃的元素，没有丢弃时返回None
+        with self._cond:
+            # 先检查是否已关闭，以免已从缓冲区取出的元素被丢失而不返回给调用者
+            if self._closed or self._finishing:
+                return item
+            dropped = None
+            if len(self._items) >= self._size:
+                if self._dropPolicy == 'drop-oldest':
+                    dropped = self._items.popleft()
+                elif self._dropPolicy == 'drop-newest':
+                    return item
+                else:
+                    while len(self._items) >= self._size and not self._closed and not self._finishing:
+                        self._cond.wait()
+            if self._closed or self._finishing:
+                return item
+            self._items.append(item)
+            self._cond.notify_all()
+            return dropped
+
+    def get(self):
+        # 阻塞直到取得一个元素，缓冲区关闭（或finish()后取空）时返回None
+        with self._cond:
+            while not self._items and not self._closed and not self._finishing:
+                self._cond.wait()
+            if self._closed or not self._items:
+                return None
+            item = self._items.popleft()
+            self._cond.notify_all()
+            return item
+
+    def __len__(self):
+        return len(self._items)
+
+    def close(self):
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def finish(self):
+        # 不再接受新元素，已有的元素仍可被取出
+        with self._cond:
+            self._finishing = True
+            self._cond.notify_all()
+
+class Frame:
+    '''
+    预分配的触觉数据帧，在Sensor(pooledFrames=True)时代替字典使用。各矩阵
+    只在首次使用时分配，此后每帧数据直接写入其中，Frame对象本身也由Sensor
+    循环使用。兼容字典形式的访问方式：frame['SN']、frame.get('3D_Positions')、
+    frame.keys()等；也可通过属性frame.P、frame.D、frame.F、frame.Fr、frame.Mr
+    直接访问三维形貌、三维变形场、三维分布力、三维合力和三维合力矩。
+    '''
+    __slots__ = ('index', 'SN', 'sendTimestamp', 'recvTimestamp', 'P', 'D', 'F', 'Fr', 'Mr', '_plan', '_extra', '_released')
+
+    _baseKeys = ('index', 'SN', 'sendTimestamp', 'recvTimestamp')
+    _matAttrs = {'3D_Positions': 'P',
+                 '3D_Displacements': 'D',
+                 '3D_Forces': 'F',
+                 '3D_ResultantForce': 'Fr',
+                 '3D_ResultantMoment': 'Mr',
+                 }
+
+    def __init__(self):
+        self.index = -1
+        self.SN = ''
+        self.sendTimestamp = 0.0
+        self.recvTimestamp = 0.0
+        self.P = None
+        self.D = None
+        self.F = None
+        self.Fr = None
+        self.Mr = None
+        self._plan = ()
+        self._extra = {}
+        self._released = False
+
+    def __getitem__(self, key):
+        if key in Frame._baseKeys:
+            return getattr(self, key)
+        for item in self._plan:
+            if item[0] == key:
+                attr = Frame._matAttrs.get(key)
+                if attr is None:
+                    return self._extra[key]
+                return getattr(self, attr)
+        raise KeyError(key)
+
+    def __contains__(self, key):
+        return key in Frame._baseKeys or any(item[0] == key for item in self._plan)
+
+    def get(self, key, default = None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def keys(self):
+        return list(Frame._baseKeys) + [item[0] for item in self._plan]
+
+    def items(self):
+        return [(key, self[key]) for key in self.keys()]
+
+class _BufferedFrame(dict):
+    # 零拷贝模式下的数据帧，_buffer为其矩阵数据所在的接收缓冲区
+    __slots__ = ('_buffer',)
+
+def _RemoveByIdentity(items, item):
+    # 数据帧（字典中含np.ndarray）不能用==比较，按对象标识删除
+    for i, other in enumerate(items):
+        if other is item:
+            del items[i]
+            return
+
 class Sensor:
 
-    def __init__(self, recvCallback = None, port = 9988, maxQSize = 5, callbackParam = None):
+    def __init__(self, recvCallback = None, port = 9988, maxQSize = 5, callbackParam = None, ringSize = 8, dropPolicy = 'drop-oldest', zeroCopy = False, pooledFrames = False):
         '''
         Parameters
         ----------
@@ -96,116 +383,253 @@ class Sensor:
             最大接收队列长度。在使用Sensor.getFrame()获取触觉数据帧时，
             数据帧缓存队列的最大长度。（若使用recvCallback方法获取触觉
             数据帧，则不受此参数的影响）
+        ringSize: 整形
+            已完成重组、等待解码的数据帧缓冲区长度。当解码（包括调用
+            recvCallback）速度暂时跟不上接收速度时，最多缓存ringSize帧。
+        dropPolicy: 字符串
+            等待解码的数据帧缓冲区已满时的处理方式：
+            'drop-oldest'：丢弃缓冲区中最早的一帧（默认）
+            'drop-newest'：丢弃新完成重组的一帧
+            'block'：阻塞UDP接收线程直到缓冲区有空位（此时数据包将积压
+                     在系统的socket接收缓冲区中）
+            各传感器被丢弃的帧数可通过Sensor.stats()查询
+        zeroCopy: 布尔型
+            为False（默认）时，每帧数据从接收缓冲区复制一次，数据帧中的
+            矩阵可长期保存，接收缓冲区立即复用。
+            为True时，数据帧中的矩阵直接是接收缓冲区上的视图，不进行任何
+            复制。该接收缓冲区在调用Sensor.releaseFrame(frame)之后才会被
+            复用；未释放的数据帧在不再被引用后由垃圾回收释放其缓冲区。
+        pooledFrames: 布尔型
+            为True时，数据帧为预分配的PyTac3D.Frame对象而不是字典，每帧
+            数据被写入其中已分配好的矩阵。调用Sensor.releaseFrame(frame)
+            后该Frame对象将被用于承载后续的数据帧，稳定运行时解码过程不再
+            分配新的矩阵。此时zeroCopy参数不起作用。
         '''
-        self._UDP = UDP_Manager(self._recvCallback_UDP, isServer = True, port = port)
-        self._recvQueue = queue.Queue()
+        self._UDP = UDP_Manager(self._recvCallback_UDP, isServer = True, port = port, recvInto = True)
+        self._initFrameQueues(recvCallback, maxQSize, callbackParam)
         self._recvBuffer = {}
-        self._maxQSize = maxQSize
-        self._recvCallback = recvCallback
-        self._callbackParam = callbackParam
+        self._freeBuffers = [_RecvBuffer() for i in range(10)]
+        self._zeroCopy = zeroCopy
+        self._pooledFrames = pooledFrames
+        self._framePool = []
         self._count = 0
-        self._yaml = ruamel.yaml.YAML()
+        self._headCodec = _HeadCodec()
         self._startTime = time.time()
-        self._UDP.start()
-        self._recvFlag = False
-        self._fromAddrMap = {}
-        self._currBufferData = None
-        self._lock = threading.Event()
+        self._frameRing = _FrameRing(ringSize, dropPolicy)
         
         self._running = True
         self._thread = threading.Thread(target = self._decodeThread, args=())
         self._thread.setDaemon(True)
         self._thread.start()  #打开收数据的线程
+        # 接收线程最后启动，此前各状态须已全部初始化
+        self._UDP.start()
         
+    def _initFrameQueues(self, recvCallback, maxQSize, callbackParam):
+        # 数据帧交付（getFrame队列、recvCallback、按SN的队列与回调）所需的状态，回放数据源共用
+        self._recvQueue = queue.Queue()
+        self._snQueues = {}
+        self._snCallbacks = {}
+        self._latestFrames = {}
+        self._maxQSize = maxQSize
+        self._recvCallback = recvCallback
+        self._callbackParam = callbackParam
+        self._recvFlag = False
+        self._fromAddrMap = {}
+        self._stats = {}
+        self._deliverLock = threading.Lock()
         self.frame = None
-        
+
     def _recvCallback_UDP(self, data, addr):
-        serialNum, pktNum, pktCount = struct.unpack('=IHH', data[0:8])
+        serialNum, pktNum, pktCount = _PACKET_HEAD.unpack_from(data)
         currBuffer = self._recvBuffer.get(serialNum)
         if currBuffer is None:
-            currBuffer = [0.0, pktNum, 0, [None]*(pktNum+1)]
+            currBuffer = self._getFreeBuffer()
+            currBuffer.reset(serialNum, pktNum)
             self._recvBuffer[serialNum] = currBuffer
-        currBuffer[0] = time.time()
-        currBuffer[2] += 1
-        currBuffer[3][pktCount] = data[8:]
+        currBuffer.timestamp = time.time()
+        currBuffer.pktCnt += 1
+        payload = data[_PACKET_HEAD.size:]
+        if pktCount == 0:
+            currBuffer.head = bytes(payload)
+        else:
+            offset = (pktCount - 1) * _PACKET_PAYLOAD_SIZE
+            currBuffer.data[offset:offset+len(payload)] = payload
+            currBuffer.dataLen += len(payload)
         
-        if currBuffer[2] == currBuffer[1]+1:
-            self._currBufferData = [currBuffer, addr]
+        if currBuffer.pktCnt == currBuffer.pktNum+1:
             del self._recvBuffer[serialNum]
-            self._lock.set()
+            try:
+                SN = self._headCodec.peekSN(currBuffer.head)
+            except:
+                SN = None
+            self._getStats(SN)['completed'] += 1
+            dropped = self._frameRing.put((SN, currBuffer, addr))
+            if not dropped is None:
+                self._getStats(dropped[0])['dropped'] += 1
+                self._freeBuffers.append(dropped[1])
         self._count += 1
         if self._count > 2000:
             self._cleanBuffer()
             self._count = 0
             
+    def _getFreeBuffer(self):
+        try:
+            return self._freeBuffers.pop()
+        except IndexError:
+            return _RecvBuffer()
+
     def _decodeThread(self):
-        self._lock.wait()
         while self._running:
-            try:
-                currBuffer, addr = self._currBufferData
-                frame = self._decodeFrame(currBuffer[3][0], b''.join(currBuffer[3][1:]))
-                initializeProgress = frame.get('InitializeProgress')
-                if initializeProgress != None:
-                    if initializeProgress != 100:
-                        return
-            except:
-                return
+            item = self._frameRing.get()
+            if item is None:
+                break
+            SN, currBuffer, addr = item
+            frame = self._decodeBuffer(currBuffer)
+            if frame is None:
+                self._getStats(SN)['dropped'] += 1
+                continue
+            initializeProgress = frame.get('InitializeProgress')
+            if initializeProgress != None:
+                if initializeProgress != 100:
+                    self.releaseFrame(frame)
+                    continue
+            self._deliverFrame(frame, SN, addr)
+
+    def _deliverFrame(self, frame, SN, addr):
+        frameSN = frame['SN']
+        if not addr is None:
+            self._fromAddrMap[frameSN] = addr
+        with self._deliverLock:
             self.frame = frame
-            self._fromAddrMap[frame['SN']] = addr
+            self._latestFrames[frameSN] = frame
             self._recvQueue.put(frame)
             if self._recvQueue.qsize() > self._maxQSize:
                 self._recvQueue.get()
-            self._recvFlag = True
-            if not self._recvCallback is None:
-                self._recvCallback(frame, self._callbackParam)
-            self._lock.clear()
-            self._lock.wait()
+            snQueue = self._snQueues.get(frameSN)
+            if snQueue is None:
+                snQueue = collections.deque(maxlen=self._maxQSize)
+                self._snQueues[frameSN] = snQueue
+            snQueue.append(frame)
+        self._recvFlag = True
+        self._getStats(SN)['decoded'] += 1
+        if not self._recvCallback is None:
+            self._recvCallback(frame, self._callbackParam)
+        for callback, param in self._snCallbacks.get(frameSN, ()):
+            callback(frame, param)
         
+    def _forgetFrame(self, frame):
+        # 数据帧被释放后即将被复用，清除Sensor内部对它的全部引用，
+        # 以免getLatest()、getFrame()返回被覆盖或属于其他传感器的数据
+        with self._deliverLock:
+            if self.frame is frame:
+                self.frame = None
+            SN = frame['SN']
+            if self._latestFrames.get(SN) is frame:
+                del self._latestFrames[SN]
+            snQueue = self._snQueues.get(SN)
+            if snQueue:
+                _RemoveByIdentity(snQueue, frame)
+            with self._recvQueue.mutex:
+                _RemoveByIdentity(self._recvQueue.queue, frame)
+
+    def _getStats(self, SN):
+        stats = self._stats.get(SN)
+        if stats is None:
+            stats = {'completed': 0, 'decoded': 0, 'dropped': 0}
+            self._stats[SN] = stats
+        return stats
         
+    def _decodeBuffer(self, currBuffer):
+        # 解码一帧，并根据zeroCopy和pooledFrames决定接收缓冲区何时归还
+        dataBytes = memoryview(currBuffer.data)[:currBuffer.dataLen]
+        keepBuffer = self._zeroCopy and not self._pooledFrames
+        if not keepBuffer and not self._pooledFrames:
+            dataBytes = bytes(dataBytes)
+        try:
+            if self._pooledFrames:
+                frame = self._decodeFrameInto(self._getFreeFrame(), currBuffer.head, dataBytes)
+            else:
+                frame = self._decodeFrame(currBuffer.head, dataBytes)
+        except:
+            frame = None
+        if keepBuffer and not frame is None:
+            frame._buffer = currBuffer
+        else:
+            self._freeBuffers.append(currBuffer)
+        return frame
+
+    def _getFreeFrame(self):
+        try:
+            frame = self._framePool.pop()
+        except IndexError:
+            return Frame()
+        frame._released = False
+        return frame
+
+    def _decodeFrameInto(self, frame, headBytes, dataBytes):
+        index, SN, timestamp, plan = self._headCodec.decode(headBytes)
+        frame.index = index
+        frame.SN = SN
+        frame.sendTimestamp = timestamp
+        frame.recvTimestamp = time.time() - self._startTime
+        frame._plan = plan
+        frame._extra.clear()
+        for name, dataType, offset, length, shape in plan:
+            if dataType == _HeadCodec.MAT:
+                value = np.frombuffer(dataBytes, dtype=np.float64, count=length//8, offset=offset).reshape(shape)
+                attr = Frame._matAttrs.get(name)
+                if attr is None:
+                    frame._extra[name] = value.copy()
+                    continue
+                mat = getattr(frame, attr)
+                if mat is None or mat.shape != shape:
+                    mat = np.empty(shape)
+                    setattr(frame, attr, mat)
+                mat[...] = value
+            elif dataType == _HeadCodec.F64:
+                frame._extra[name] = struct.unpack_from('d', dataBytes, offset)[0]
+            elif dataType == _HeadCodec.I32:
+                frame._extra[name] = struct.unpack_from('i', dataBytes, offset)[0]
+            elif dataType == _HeadCodec.IMG:
+                frame._extra[name] = cv2.imdecode(np.frombuffer(dataBytes, np.uint8, count=length, offset=offset), cv2.IMREAD_ANYCOLOR)
+        return frame
+
     def _decodeFrame(self, headBytes, dataBytes):
-        head = self._yaml.load(headBytes.decode('ascii'))
-        frame = {}
-        frame['index'] = head['index']
-        frame['SN'] = head['SN']
-        frame['sendTimestamp'] = head['timestamp']
+        index, SN, timestamp, plan = self._headCodec.decode(headBytes)
+        frame = _BufferedFrame() if self._zeroCopy else {}
+        frame['index'] = index
+        frame['SN'] = SN
+        frame['sendTimestamp'] = timestamp
         frame['recvTimestamp'] = time.time() - self._startTime
-        for item in head['data']:
-            dataType = item['type']
-            if dataType == 'mat':
-                dtype = item['dtype']
-                if dtype == 'f64':
-                    width = item['width']
-                    height = item['height']
-                    offset = item['offset']
-                    length = item['length']
-                    frame[item['name']] = np.frombuffer(dataBytes[offset:offset+length], dtype=np.float64).reshape([height, width])
-            elif dataType == 'f64':
-                offset = item['offset']
-                length = item['length']
-                frame[item['name']] = struct.unpack('d', dataBytes[offset:offset+length])[0]
-            elif dataType == 'i32':
-                offset = item['offset']
-                length = item['length']
-                frame[item['name']] = struct.unpack('i', dataBytes[offset:offset+length])[0]
-            elif dataType == 'img':
-                offset = item['offset']
-                length = item['length']
-                frame[item['name']] = cv2.imdecode(np.frombuffer(dataBytes[offset:offset+length], np.uint8), cv2.IMREAD_ANYCOLOR)
+        for name, dataType, offset, length, shape in plan:
+            if dataType == _HeadCodec.MAT:
+                frame[name] = np.frombuffer(dataBytes, dtype=np.float64, count=length//8, offset=offset).reshape(shape)
+            elif dataType == _HeadCodec.F64:
+                frame[name] = struct.unpack_from('d', dataBytes, offset)[0]
+            elif dataType == _HeadCodec.I32:
+                frame[name] = struct.unpack_from('i', dataBytes, offset)[0]
+            elif dataType == _HeadCodec.IMG:
+                frame[name] = cv2.imdecode(np.frombuffer(dataBytes, np.uint8, count=length, offset=offset), cv2.IMREAD_ANYCOLOR)
         return frame
         
     def _cleanBuffer(self, timeout = 1.0):
         currTime = time.time()
         delList = []
         for item in self._recvBuffer.items():
-            if currTime - item[1][0] > timeout:
+            if currTime - item[1].timestamp > timeout:
                 delList.append(item[0])
         for item in delList:
-            #print(self._recvBuffer[item][0:3])
-            del self._recvBuffer[item]
+            self._freeBuffers.append(self._recvBuffer.pop(item))
         
-    def getFrame(self):
+    def getFrame(self, SN = None):
         '''
         获取缓存数据帧队中的数据帧。
+        Parameters
+        ----------
+        SN: 字符串
+            传感器SN码。为None时从所有传感器共用的缓存数据帧队列中获取；
+            指定SN时从该传感器独立的缓存数据帧队列（最大长度同样为maxQSize）
+            中获取，不受其他传感器帧率的影响。
         Return
         ----------
         frame: 触觉数据帧
@@ -237,11 +661,44 @@ class Sensor:
                     组的每一列分别对应标志点附近区域的x、y、z方向受力。
             }
         '''
+        if not SN is None:
+            snQueue = self._snQueues.get(SN)
+            try:
+                return snQueue.popleft()
+            except (AttributeError, IndexError):
+                return None
         if not self._recvQueue.empty():
             return self._recvQueue.get()
         else:
             return None
     
+    def getLatest(self, SN):
+        '''
+        获取指定传感器最近接收到的一帧数据帧，不会将其从缓存数据帧队列中
+        取出。该函数不加锁，时间复杂度为O(1)，适合在控制循环中高频调用。
+        若尚未收到该传感器的数据帧则返回None。
+        '''
+        return self._latestFrames.get(SN)
+
+    def registerCallback(self, SN, callback, param = None):
+        '''
+        为指定传感器注册回调函数callback(frame, param)。每收到一帧来自该
+        传感器的数据帧，在调用初始化时设置的recvCallback之后调用一次。
+        同一传感器可注册多个回调函数。
+        '''
+        callbacks = self._snCallbacks.get(SN, ())
+        self._snCallbacks[SN] = callbacks + ((callback, param),)
+
+    def unregisterCallback(self, SN, callback = None):
+        '''
+        注销通过registerCallback为指定传感器注册的回调函数。callback为None
+        时注销该传感器的全部回调函数。
+        '''
+        if callback is None:
+            self._snCallbacks.pop(SN, None)
+        else:
+            self._snCallbacks[SN] = tuple(item for item in self._snCallbacks.get(SN, ()) if item[0] != callback)
+
     def waitForFrame(self):
         '''
         阻塞等待接收数据帧，直到接收到第一帧数据帧为止。需注意，此函数的
@@ -281,9 +738,428 @@ class Sensor:
         else:
             print("Quit failed! (sensor %s is not connected)" % SN)
 
+    def releaseFrame(self, frame, copy = False):
+        '''
+        在零拷贝模式（zeroCopy=True）下，归还数据帧所占用的接收缓冲区以供
+        后续数据帧复用；在对象池模式（pooledFrames=True）下，归还Frame对象
+        本身。释放后该数据帧中的数据随时可能被覆盖，不应再使用。重复释放
+        同一数据帧时只有第一次有效。其他情况下调用此函数没有任何效果。该数据帧同时从getLatest()和各缓存数据帧
+        队列中移除。
+        Parameters
+        ----------
+        frame: 触觉数据帧
+            通过recvCallback或Sensor.getFrame()获得的数据帧
+        copy: 布尔型
+            为True时先将数据帧中的矩阵复制出来再归还缓冲区，释放后的数据
+            帧仍可继续使用（对象池模式下即保留该Frame对象，不归还）
+        '''
+        if isinstance(frame, Frame):
+            # 重复释放会使同一Frame对象在对象池中出现两次，之后两帧数据互相覆盖
+            if not copy and not frame._released:
+                frame._released = True
+                self._forgetFrame(frame)
+                self._framePool.append(frame)
+            return
+        buffer = getattr(frame, '_buffer', None)
+        if buffer is None:
+            return
+        if copy:
+            for key, value in frame.items():
+                if isinstance(value, np.ndarray):
+                    frame[key] = value.copy()
+        else:
+            self._forgetFrame(frame)
+        frame._buffer = None
+        self._freeBuffers.append(buffer)
+
+    def stats(self):
+        '''
+        获取各传感器的数据帧统计信息。
+        Return
+        ----------
+        stats: 字典
+            以传感器SN码为键，每个值为一个字典
+            {
+                "completed": （整形）完成重组的数据帧数
+                "decoded": （整形）完成解码并交付给getFrame队列和
+                    recvCallback的数据帧数
+                "dropped": （整形）因等待解码的缓冲区已满（见dropPolicy）
+                    或解码失败而被丢弃的数据帧数
+            }
+        '''
+        return {SN: dict(item) for SN, item in list(self._stats.items())}
+
     def release(self):
         self._UDP.close()
         self._running = False
-        time.sleep(0.2)
-        self._lock.set()
+        self._frameRing.close()
+        if threading.current_thread() is not self._thread:
+            self._thread.join()
+
+
+class FrameSynchronizer:
+
+    MATCH_KEYS = ('sendTimestamp', 'recvTimestamp', 'index')
+
+    def __init__(self, SNs, callback = None, callbackParam = None, matchBy = 'sendTimestamp', tolerance = 0.01, bufferSize = 32, roles = None):
+        '''
+        将多个传感器的数据帧按时间对齐，每找到一组对齐的数据帧就输出一个
+        按SNs顺序排列的元组。可将push作为回调函数注册到Sensor上：
+        sensor.registerCallback(SN, sync.push)
+        Parameters
+        ----------
+        SNs: 字符串列表
+            需要对齐的传感器SN码
+        callback: 回调函数
+            callback(frames, param)，每得到一组对齐的数据帧时调用一次，
+            frames为按SNs顺序排列的数据帧元组
+        matchBy: 字符串
+            'sendTimestamp'（默认）或'recvTimestamp'：取与新数据帧时间戳
+            最接近且相差不超过tolerance秒的数据帧进行对齐；'index'：按
+            帧序号相等对齐
+        tolerance: 浮点数
+            按时间戳对齐时允许的最大时间差（秒）
+        bufferSize: 整形
+            每个传感器等待对齐的数据帧缓存的最大长度，超出后最早的帧被丢弃
+        roles: 字典
+            SN码到角色名称的映射，例如{'HDL1-0003': 'left', 'HDL1-0004': 'right'}，
+            用于getLatestByRole()
+        '''
+        if not matchBy in FrameSynchronizer.MATCH_KEYS:
+            raise ValueError('Unknown match key: %s' % matchBy)
+        self._SNs = tuple(SNs)
+        self._callback = callback
+        self._callbackParam = callbackParam
+        self._matchBy = matchBy
+        self._tolerance = 0 if matchBy == 'index' else tolerance
+        self._bufferSize = bufferSize
+        self._roles = dict(roles) if roles else {SN: SN for SN in self._SNs}
+        self._keys = {SN: [] for SN in self._SNs}
+        self._frames = {SN: [] for SN in self._SNs}
+        self._lastKeys = {SN: None for SN in self._SNs}
+        self._lock = threading.Lock()
+        self._latest = None
+        self._matched = 0
+        self._unmatched = {SN: 0 for SN in self._SNs}
+        self._stale = {SN: 0 for SN in self._SNs}
+
+    def push(self, frame, param = None):
+        '''
+        输入一帧数据帧，不属于SNs的数据帧将被忽略。
+        '''
+        SN = frame['SN']
+        keys = self._keys.get(SN)
+        if keys is None:
+            return
+        key = frame[self._matchBy]
+        with self._lock:
+            lastKey = self._lastKeys[SN]
+            if not lastKey is None and key <= lastKey:
+                self._stale[SN] += 1
+                return
+            frames = self._frames[SN]
+            pos = bisect.bisect_right(keys, key)
+            keys.insert(pos, key)
+            frames.insert(pos, frame)
+            if len(keys) > self._bufferSize:
+                del keys[0]
+                del frames[0]
+                self._unmatched[SN] += 1
+            matched = self._match(SN, key)
+        if not matched is None and not self._callback is None:
+            self._callback(matched, self._callbackParam)
+
+    def _match(self, SN, key):
+        positions = {}
+        for otherSN in self._SNs:
+            keys = self._keys[otherSN]
+            pos = bisect.bisect_left(keys, key)
+            best = None
+            for candidate in (pos - 1, pos):
+                if 0 <= candidate < len(keys) and abs(keys[candidate] - key) <= self._tolerance:
+                    if best is None or abs(keys[candidate] - key) < abs(keys[best] - key):
+                        best = candidate
+            if best is None:
+                return None
+            positions[otherSN] = best
+        matched = tuple(self._frames[otherSN][positions[otherSN]] for otherSN in self._SNs)
+        for otherSN, pos in positions.items():
+            self._unmatched[otherSN] += pos
+            self._lastKeys[otherSN] = self._keys[otherSN][pos]
+            del self._keys[otherSN][:pos+1]
+            del self._frames[otherSN][:pos+1]
+        self._matched += 1
+        self._latest = matched
+        return matched
+
+    def getLatest(self):
+        '''
+        获取最近一组对齐的数据帧元组（按SNs顺序排列），尚无对齐结果时返回None。
+        '''
+        return self._latest
+
+    def getLatestByRole(self):
+        '''
+        获取最近一组对齐的数据帧，以角色名称为键的字典形式返回，尚无对齐
+        结果时返回None。
+        '''
+        latest = self._latest
+        if latest is None:
+            return None
+        return {self._roles.get(SN, SN): frame for SN, frame in zip(self._SNs, latest)}
+
+    def stats(self):
+        '''
+        获取对齐统计信息：
+        {
+            "matched": （整形）已输出的对齐帧组数
+            "unmatched": （字典）各传感器未能参与对齐而被丢弃的帧数
+            "stale": （字典）各传感器因晚于已对齐的帧到达而被丢弃的帧数
+            "pending": （字典）各传感器当前等待对齐的帧数
+        }
+        '''
+        with self._lock:
+            return {'matched': self._matched,
+                    'unmatched': dict(self._unmatched),
+                    'stale': dict(self._stale),
+                    'pending': {SN: len(keys) for SN, keys in self._keys.items()},
+                    }
+
+
+mesh_table = { 'A1': (20,20),
+               'AD2': (20,20),
+               'HDL1': (20,20),
+               'DM1': (20,20),
+               'DS1': (16,16),
+               'DSt1': (16,16),
+               'B1': (16,16),
+               'UNKNOWN': (20,20),
+               }
+
+_meshTopologyCache = {}
+
+def getModelName(SN):
+    '''
+    根据传感器SN获取传感器型号，未知型号返回'UNKNOWN'
+    '''
+    model = SN.split('-')[0]
+    if model[0] == 'Y':
+        model = model[1:]
 
+    if model in mesh_table.keys():
+        return model
+    else:
+        return 'UNKNOWN'
+
+def getMeshTopology(model):
+    '''
+    获取传感器标志点阵列的三角网格拓扑（面片顶点索引）。
+    每种型号只计算一次，结果在所有调用者之间共享，不可修改。
+
+    Parameters
+    ----------
+    model: 传感器型号（mesh_table中的键）或传感器SN
+
+    Return
+    ----------
+    faces: 形状为 (2*(nx-1)*(ny-1), 3) 的 np.int32 数组，每行为一个三角形面片的三个顶点索引
+    '''
+    if not model in mesh_table:
+        model = getModelName(model)
+    faces = _meshTopologyCache.get(model)
+    if faces is None:
+        faces = _GenMeshTopology(*mesh_table[model])
+        _meshTopologyCache[model] = faces
+    return faces
+
+def _GenMeshTopology(nx, ny):
+    # 每个网格单元拆分为两个三角形，顺序与逐单元生成的结果一致
+    iy, ix = np.meshgrid(np.arange(ny-1, dtype=np.int32), np.arange(nx-1, dtype=np.int32), indexing='ij')
+    idx = (iy * nx + ix).ravel()
+    faces = np.empty((idx.size, 2, 3), dtype=np.int32)
+    faces[:, 0, 0] = idx
+    faces[:, 0, 1] = idx + 1
+    faces[:, 0, 2] = idx + nx
+    faces[:, 1, 0] = idx + nx + 1
+    faces[:, 1, 1] = idx + nx
+    faces[:, 1, 2] = idx + 1
+    faces = faces.reshape(-1, 3)
+    faces.flags.writeable = False
+    return faces
+
+_contactMatrixCache = {}
+
+def _LoadContactConfig(path):
+    # path为传感器配置目录（含sensor.yaml和ContactDetector/）或检测矩阵文件
+    path = os.path.abspath(path)
+    if os.path.isdir(path):
+        configDir = path
+        matrixPath = os.path.join(path, 'ContactDetector', 'HD_Matrix.csv')
+    else:
+        configDir = os.path.dirname(os.path.dirname(path))
+        matrixPath = path
+    config = {}
+    yamlPath = os.path.join(configDir, 'sensor.yaml')
+    if os.path.isfile(yamlPath):
+        with open(yamlPath, 'r') as f:
+            for item in ruamel.yaml.YAML(typ='safe').load(f).get('pipeline') or []:
+                if isinstance(item, dict) and item.get('name') == 'ContactDetector':
+                    config = item.get('config') or {}
+        if 'detectMatrix' in config and os.path.isdir(path):
+            matrixPath = os.path.join(configDir, 'ContactDetector', config['detectMatrix'])
+    matrix = _contactMatrixCache.get(matrixPath)
+    if matrix is None:
+        matrix = np.loadtxt(matrixPath, delimiter=',', dtype=np.float64, ndmin=2)
+        matrix.flags.writeable = False
+        _contactMatrixCache[matrixPath] = matrix
+    return os.path.basename(configDir), matrix, config
+
+def _TriangleArea(e1, e2):
+    # 以两条边向量计算三角形面积，比np.cross快
+    nx = e1[..., 1] * e2[..., 2] - e1[..., 2] * e2[..., 1]
+    ny = e1[..., 2] * e2[..., 0] - e1[..., 0] * e2[..., 2]
+    nz = e1[..., 0] * e2[..., 1] - e1[..., 1] * e2[..., 0]
+    return 0.5 * np.sqrt(nx * nx + ny * ny + nz * nz)
+
+class ContactDetector:
+
+    def __init__(self, path, threshold = None, field = None, callback = None, callbackParam = None):
+        '''
+        在客户端根据三维变形场检测接触，与Tac3D-Core中的ContactDetector使用
+        相同的检测矩阵（ContactDetector/HD_Matrix.csv）和阈值。检测矩阵的各行
+        为一组标准正交的非接触变形模态，变形场减去其在这些模态上的投影后，
+        残差大于阈值的标志点视为处于接触状态。每个传感器的检测矩阵只读取一次。
+        可将push作为回调函数注册到Sensor上：
+        sensor.registerCallback(SN, detector.push)
+        Parameters
+        ----------
+        path: 字符串
+            传感器配置目录（例如Tac3D-Core/config/.../HDL1-0001），或检测矩阵文件的路径
+        threshold: 浮点数
+            接触判定阈值（mm），为None时使用sensor.yaml中的设置，默认0.15
+        field: 字符串
+            用于检测的数据，为None时使用sensor.yaml中的设置，默认'3D_Displacements'
+        callback: 回调函数
+            callback(frame, result, param)，每检测一帧数据帧时调用一次，
+            result为detect()的返回值
+        '''
+        SN, self._matrix, config = _LoadContactConfig(path)
+        self.SN = SN
+        self.threshold = float(threshold if not threshold is None else config.get('threshold', 0.15))
+        self.field = field if not field is None else config.get('accordingTo', '3D_Displacements')
+        self._dim = int(config.get('accordingTo_dim', 3))
+        self._points = self._matrix.shape[1] // self._dim
+        self._thresholdSq = self.threshold * self.threshold
+        self._callback = callback
+        self._callbackParam = callbackParam
+        self._latest = None
+
+        nx, ny = mesh_table[getModelName(SN)]
+        self._grid = (ny, nx) if nx * ny == self._points else None
+
+    def getResidual(self, D):
+        '''
+        计算变形场中不能由非接触变形模态解释的部分。
+        Parameters
+        ----------
+        D: np.ndarray
+            形状为(N, dim)的单帧数据，或(n, N, dim)的多帧数据，
+            例如RecordReader.getField('3D_Displacements')
+        Return
+        ----------
+        residual: np.ndarray
+            与D形状相同的残差
+        '''
+        D = np.asarray(D, dtype=np.float64)
+        flat = D.reshape(D.shape[:-2] + (-1,))
+        # 等价于flat @ (I - M.T @ M)，但不预先计算1200x1200的投影矩阵：检测矩阵M只有
+        # 几行到几十行，两次低秩乘法每帧约10us，而与稠密投影矩阵相乘每帧约470us
+        residual = flat - (flat @ self._matrix.T) @ self._matrix
+        return residual.reshape(D.shape)
+
+    def getContactMask(self, D):
+        '''
+        计算各标志点是否处于接触状态，返回形状为(N,)或(n, N)的布尔数组。
+        '''
+        residual = self.getResidual(D)
+        return (residual * residual).sum(axis=-1) > self._thresholdSq
+
+    def getPointArea(self, P):
+        '''
+        根据三维形貌计算每个标志点代表的表面积（mm^2）。
+        Parameters
+        ----------
+        P: np.ndarray
+            形状为(N, 3)或(n, N, 3)的三维形貌，例如frame['3D_Positions']
+        Return
+        ----------
+        area: np.ndarray
+            形状为(N,)或(n, N)的标志点面积
+        '''
+        if self._grid is None:
+            raise ValueError('Mesh topology of %s does not match the detect matrix.' % self.SN)
+        P = np.asarray(P, dtype=np.float64)
+        grid = P.reshape(P.shape[:-2] + self._grid + (3,))
+        # 网格单元的划分与getMeshTopology()一致：(a, b, c)和(d, c, b)两个三角形，
+        # 标志点面积为其相邻三角形面积之和的1/3
+        a = grid[..., :-1, :-1, :]
+        b = grid[..., :-1, 1:, :]
+        c = grid[..., 1:, :-1, :]
+        d = grid[..., 1:, 1:, :]
+        area1 = _TriangleArea(b - a, c - a) * (1.0 / 3.0)
+        area2 = _TriangleArea(c - d, b - d) * (1.0 / 3.0)
+        area = np.zeros(grid.shape[:-1])
+        area[..., :-1, :-1] += area1
+        area[..., :-1, 1:] += area1 + area2
+        area[..., 1:, :-1] += area1 + area2
+        area[..., 1:, 1:] += area2
+        return area.reshape(P.shape[:-1])
+
+    def detect(self, D, P = None):
+        '''
+        检测单帧或多帧数据的接触状态。
+        Parameters
+        ----------
+        D: np.ndarray
+            形状为(N, dim)或(n, N, dim)的变形场
+        P: np.ndarray
+            对应的三维形貌，用于计算接触面积，为None时不计算面积
+        Return
+        ----------
+        result: 字典
+        {
+            "contact": （布尔或(n,)布尔数组）是否存在接触点
+            "mask": （(N,)或(n, N)布尔数组）各标志点是否处于接触状态
+            "points": （整形或(n,)整形数组）接触点数
+            "area": （浮点数或(n,)数组）接触面积（mm^2），P为None时为None
+        }
+        '''
+        mask = self.getContactMask(D)
+        points = np.count_nonzero(mask, axis=-1)
+        area = None
+        if not P is None:
+            area = np.einsum('...i,...i->...', self.getPointArea(P), mask)
+        return {'contact': points > 0,
+                'mask': mask,
+                'points': points,
+                'area': area,
+                }
+
+    def push(self, frame, param = None):
+        '''
+        检测一帧数据帧（使用其中的检测数据和3D_Positions），返回detect()的结果。
+        '''
+        D = frame.get(self.field)
+        if D is None:
+            return None
+        result = self.detect(D, frame.get('3D_Positions'))
+        self._latest = result
+        if not self._callback is None:
+            self._callback(frame, result, self._callbackParam)
+        return result
+
+    def getLatest(self):
+        '''
+        获取最近一次push()的检测结果，尚无结果时返回None。
+        '''
+        return self._latest
@@ -17,26 +17,6 @@ class Tac3D_info:
         self.Mr = np.zeros((1, 3))  # 整个传感器接触面受到的x,y,z三维合力矩
 
 
-mesh_table = { 'A1': (20,20),
-               'AD2': (20,20),
-               'HDL1': (20,20),
-               'DM1': (20,20),
-               'DS1': (16,16),
-               'DSt1': (16,16),
-               'B1': (16,16),
-               'UNKNOWN': (20,20),
-               }
-
-def getModelName(SN):
-    model = SN.split('-')[0]
-    if model[0] == 'Y':
-        model = model[1:]
-
-    if model in mesh_table.keys():
-        return model
-    else:
-        return 'UNKNOWN'
-
 class Tac3D_Displayer:
     
     def __init__(self, port=9988):
@@ -52,8 +32,9 @@ class Tac3D_Displayer:
         self.Tac3DSensor = PyTac3D.Sensor(recvCallback=self._recvCallback, port=port, maxQSize=5, callbackParam=self.tac_dict)
         self.SN = ''
         self.SN_list = []
-        self.frameCacheLeft = {}
-        self.frameCacheRight = {}
+        # 按接收时间对齐左右两个传感器的数据帧（两个传感器的sendTimestamp各自从启动时开始计时）
+        self._sync = PyTac3D.FrameSynchronizer([self.Tac3D_name1, self.Tac3D_name2], matchBy='recvTimestamp', tolerance=0.05,
+                                               roles={self.Tac3D_name1: 'left', self.Tac3D_name2: 'right'})
         self.updateFlag = True
         
         self._plotter = vedo.Plotter(N=4)
@@ -134,10 +115,7 @@ class Tac3D_Displayer:
         tacinfo.Fr = Fr
         Mr = frame.get("3D_ResultantMoment")
         tacinfo.Mr = Mr
-        if SN=="HDL1-0003":
-           self.frameCacheLeft[recvTimestamp] = frame
-        else :  
-            self.frameCacheRight[recvTimestamp] = frame 
+        self._sync.push(frame)
         self.SN=SN
         if not SN in self.SN_list:
             self.SN_list.append(SN)
@@ -155,12 +133,10 @@ class Tac3D_Displayer:
     def _ShowFrame(self, event):
         # if self.SN != '':
                 # 确保左右手数据可用
-        if self.frameCacheLeft and self.frameCacheRight:
-            latest_timestamp_left = max(self.frameCacheLeft.keys())
-            frame_left = self.frameCacheLeft[latest_timestamp_left]
-
-            latest_timestamp_right = max(self.frameCacheRight.keys())
-            frame_right = self.frameCacheRight[latest_timestamp_right]
+        matched = self._sync.getLatestByRole()
+        if matched is not None:
+            frame_left = matched['left']
+            frame_right = matched['right']
 
             # 提取左手数据
             L_left = frame_left.get('3D_Positions')
@@ -195,8 +171,7 @@ class Tac3D_Displayer:
             
             # 处理左手数据 (窗口 0, 2)
             if L_left is not None:
-                meshSize = mesh_table[getModelName("HDL1-0003")]
-                self._GenConnect(*meshSize)
+                self._connect = PyTac3D.getMeshTopology("HDL1-0003")
                 mesh_left = vedo.Mesh([L_left, self._connect], alpha=0.9, c=[150, 150, 230])
                 if self._enable_Mesh0:
                     self._plotter.at(0).add(mesh_left)
@@ -214,8 +189,7 @@ class Tac3D_Displayer:
 
             # 处理右手数据 (窗口 1, 3)
             if L_right is not None:
-                meshSize = mesh_table[getModelName("HDL1-0004")]
-                self._GenConnect(*meshSize)
+                self._connect = PyTac3D.getMeshTopology("HDL1-0004")
                 mesh_right = vedo.Mesh([L_right, self._connect], alpha=0.9, c=[230, 150, 150])
                 if self._enable_Mesh1:
                     self._plotter.at(2).add(mesh_right)
@@ -283,15 +257,6 @@ class Tac3D_Displayer:
             self._plotter.at(2).render()
             self._plotter.at(3).render()
     
-    def _GenConnect(self, nx, ny):
-
-        self._connect = []
-        for iy in range(ny-1):
-            for ix in range(nx-1):
-                idx = iy * nx + ix
-                self._connect.append([idx, idx+1, idx+nx])
-                self._connect.append([idx+nx+1, idx+nx, idx+1])
-                
     def _ButtonFunc_Calibrate(self):
         if self.SN != '':
             self.Tac3DSensor.calibrate(self.SN)
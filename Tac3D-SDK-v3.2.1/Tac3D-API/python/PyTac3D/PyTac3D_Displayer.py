@@ -2,18 +2,11 @@ import PyTac3D
 from dexhand_client import DexHandClient
 import ruamel.yaml
 import vedo
+import vtk
+from vtk.util import numpy_support
 import numpy as np
 import time
 
-mesh_table = { 'A1': (20,20),
-               'AD2': (20,20),
-               'HDL1': (20,20),
-               'DM1': (20,20),
-               'DS1': (16,16),
-               'DSt1': (16,16),
-               'B1': (16,16),
-               'UNKNOWN': (20,20),
-               }
 class Tac3D_info:
     def __init__(self, SN):
         self.SN = SN  # 传感器SN
@@ -26,19 +19,59 @@ class Tac3D_info:
         self.Fr = np.zeros((1, 3))  # 整个传感器接触面受到的x,y,z三维合力
         self.Mr = np.zeros((1, 3))  # 整个传感器接触面受到的x,y,z三维合力矩
 
-def getModelName(SN):
-    model = SN.split('-')[0]
-    if model[0] == 'Y':
-        model = model[1:]
+class _ArrowField:
+    '''
+    由一组起点和向量构成的箭头场。VTK管线只在创建时搭建一次，之后每帧只需把
+    新的起点和向量写入已有的VTK数组，不再重新生成vedo.Arrows。
+    '''
+    def __init__(self, numPoints, s=2, c=(0.3, 0.3, 0.3)):
+        self._points = vtk.vtkPoints()
+        self._points.SetDataTypeToDouble()
+        self._points.SetNumberOfPoints(numPoints)
+        self._vectors = vtk.vtkDoubleArray()
+        self._vectors.SetNumberOfComponents(3)
+        self._vectors.SetNumberOfTuples(numPoints)
+        self._pointsView = numpy_support.vtk_to_numpy(self._points.GetData())
+        self._vectorsView = numpy_support.vtk_to_numpy(self._vectors)
+        self._pointsView[...] = 0
+        self._vectorsView[...] = 0
+        polydata = vtk.vtkPolyData()
+        polydata.SetPoints(self._points)
+        polydata.GetPointData().SetVectors(self._vectors)
 
-    if model in mesh_table.keys():
-        return model
-    else:
-        return 'UNKNOWN'
+        # 与vedo.Arrows(..., s=s)相同的箭头尺寸
+        size = 0.02 * s
+        arrow = vtk.vtkArrowSource()
+        arrow.SetShaftResolution(6)
+        arrow.SetTipResolution(6)
+        arrow.SetTipRadius(size * 2)
+        arrow.SetShaftRadius(size)
+        arrow.SetTipLength(size * 10)
+        glyph = vtk.vtkGlyph3D()
+        glyph.SetSourceConnection(arrow.GetOutputPort())
+        glyph.SetInputData(polydata)
+        glyph.SetVectorModeToUseVector()
+        glyph.SetScaleModeToScaleByVector()
+        glyph.OrientOn()
+
+        mapper = vtk.vtkPolyDataMapper()
+        mapper.SetInputConnection(glyph.GetOutputPort())
+        mapper.ScalarVisibilityOff()
+        self.actor = vtk.vtkActor()
+        self.actor.SetMapper(mapper)
+        self.actor.GetProperty().SetColor(*c)
+        self.actor.GetProperty().LightingOff()
+        self.actor.PickableOff()
+
+    def update(self, start, vectors, scale):
+        self._pointsView[...] = start
+        np.multiply(vectors, scale, out=self._vectorsView)
+        self._points.Modified()
+        self._vectors.Modified()
 
 class Tac3D_Displayer:
     
-    def __init__(self, port=9988):
+    def __init__(self, port=9988, incremental=True):
         self._scaleF = 30 * 1
         self._scaleD = 5 * 1
         self._connect = None
@@ -56,6 +89,18 @@ class Tac3D_Displayer:
         
         self.frames_data = {} # collect data from each frame
         
+        # incremental为True时，网格和箭头只在切换传感器时创建一次，此后每帧只更新坐标，
+        # 且没有新的数据帧时不重新渲染；为False时每帧重新创建全部对象
+        self._incremental = incremental
+        self._actorPoints = None
+        self._lastShown = None
+        self._dirty = True
+        self._refPoints = None
+        self._fpsCount = 0
+        self._fpsTime = time.time()
+        self.displayFPS = 0.0
+        self._fpsText = vedo.Text2D('', pos='top-right', s=0.8)
+        
         self._plotter = vedo.Plotter(N=2)
         
         self._box = vedo.Box(pos=(0,0,0), length=16, width=16, height=8).alpha(0.03)
@@ -133,7 +178,13 @@ class Tac3D_Displayer:
         self._plotter.at(0).show(self._sensor_SN)
         self._plotter.at(0).show()
         self._plotter.at(1).show()
-        self._timerevt = self._plotter.add_callback('timer', self._ShowFrame)
+        if self._incremental:
+            self._plotter.at(1).add(self._fpsText)
+            self._plotter.at(0).add(self._box, self._axs)
+            self._plotter.at(1).add(self._box, self._axs)
+            self._timerevt = self._plotter.add_callback('timer', self._ShowFrameIncremental)
+        else:
+            self._timerevt = self._plotter.add_callback('timer', self._ShowFrame)
         self._timer_id = self._plotter.timer_callback('create', dt=10)
         self._plotter.interactive().close()
         
@@ -180,8 +231,7 @@ class Tac3D_Displayer:
             self._plotter.at(1).add(self._box, self._axs)
             if not L is None:
                 if self.updateFlag:
-                    meshSize = mesh_table[getModelName(self.SN)]
-                    self._GenConnect(*meshSize)
+                    self._connect = PyTac3D.getMeshTopology(self.SN)
                 mesh = vedo.Mesh([L, self._connect], alpha=0.9, c=[150,150,230])
                 if self._enable_Mesh0:
                     self._plotter.at(0).add(mesh)
@@ -211,19 +261,76 @@ class Tac3D_Displayer:
             self._plotter.at(0).render()
             self._plotter.at(1).render()
     
-    def _GenConnect(self, nx, ny):
-        self._connect = []
-        for iy in range(ny-1):
-            for ix in range(nx-1):
-                idx = iy * nx + ix
-                self._connect.append([idx, idx+1, idx+nx])
-                self._connect.append([idx+nx+1, idx+nx, idx+1])
-        
+    def _BuildActors(self, L):
+        if self._actorPoints is not None:
+            self._plotter.at(0).remove(self._mesh0, self._arrowsD.actor)
+            self._plotter.at(1).remove(self._mesh1, self._arrowsF.actor)
+        self._connect = PyTac3D.getMeshTopology(self.SN)
+        self._mesh0 = vedo.Mesh([L, self._connect], alpha=0.9, c=[150,150,230])
+        self._mesh1 = vedo.Mesh([L, self._connect], alpha=0.9, c=[150,150,230])
+        self._arrowsD = _ArrowField(len(L), s=2)
+        self._arrowsF = _ArrowField(len(L), s=2)
+        self._plotter.at(0).add(self._mesh0, self._arrowsD.actor)
+        self._plotter.at(1).add(self._mesh1, self._arrowsF.actor)
+        self._actorPoints = len(L)
+
+    def _ShowFrameIncremental(self, event):
+        if self.SN == '':
+            return
+        frame = self.frameCache[self.SN]
+        frameIndex = frame["index"]
+        if not self.updateFlag and not self._dirty and self._lastShown == (self.SN, frameIndex):
+            return
+
+        L = frame.get('3D_Positions')
+        D = frame.get('3D_Displacements')
+        F = frame.get('3D_Forces')
+        if not L is None:
+            if self.updateFlag or self._actorPoints != len(L):
+                self._BuildActors(L)
+                self.updateFlag = False
+            self._mesh0.vertices = L
+            self._mesh1.vertices = L
+            if not D is None:
+                self._arrowsD.update(L, D, self._scaleD)
+            if not F is None:
+                self._arrowsF.update(L, F, self._scaleF)
+            self._mesh0.actor.SetVisibility(self._enable_Mesh0)
+            self._mesh1.actor.SetVisibility(self._enable_Mesh1)
+            self._arrowsD.actor.SetVisibility(self._enable_Displacements and not D is None)
+            self._arrowsF.actor.SetVisibility(self._enable_Forces and not F is None)
+
+        refPoint = frame.get('3D_refPoints_P')
+        if not refPoint is None:
+            if self._refPoints_org is None:
+                self._refPoints_org = refPoint
+                self._refPoints = vedo.Points(refPoint, c=[0,0,0])
+                self._plotter.at(0).add(self._refPoints, vedo.Points(self._refPoints_org, c=[255,0,0]))
+            self._refPoints.vertices = refPoint
+
+        if not self._recvFirstFrame:
+            self._recvFirstFrame = True
+            self._plotter.reset_camera()
+
+        self._plotter.at(0).render()
+        self._plotter.at(1).render()
+        self._lastShown = (self.SN, frameIndex)
+        self._dirty = False
+
+        self._fpsCount += 1
+        currTime = time.time()
+        if currTime - self._fpsTime >= 1.0:
+            self.displayFPS = self._fpsCount / (currTime - self._fpsTime)
+            self._fpsCount = 0
+            self._fpsTime = currTime
+            self._fpsText.text('display: %.1f FPS' % self.displayFPS)
+
     def _ButtonFunc_Calibrate(self):
         if self.SN != '':
             self.Tac3DSensor.calibrate(self.SN)
 
     def _ButtonFunc_Switch(self):
+        self._dirty = True
         if self.SN in self.SN_list:
             # 获取self.SN在SN_list中索引
             idx = self.SN_list.index(self.SN)
@@ -234,18 +341,22 @@ class Tac3D_Displayer:
             self._sensor_SN.text('SN: ' + self.SN)
         
     def _ButtonFunc_Mesh0(self):
+        self._dirty = True
         self._button_mesh0.switch()
         self._enable_Mesh0 = not self._enable_Mesh0
         
     def _ButtonFunc_Displacements(self):
+        self._dirty = True
         self._button_displacements.switch()
         self._enable_Displacements = not self._enable_Displacements
         
     def _ButtonFunc_Mesh1(self):
+        self._dirty = True
         self._button_mesh1.switch()
         self._enable_Mesh1 = not self._enable_Mesh1
         
     def _ButtonFunc_Forces(self):
+        self._dirty = True
         self._button_force.switch()
         self._enable_Forces = not self._enable_Forces
     
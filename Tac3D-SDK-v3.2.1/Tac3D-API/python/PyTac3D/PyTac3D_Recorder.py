@@ -0,0 +1,629 @@
+import PyTac3D
+import numpy as np
+import json
+import mmap
+import struct
+import threading
+import time
+import zlib
+
+_RECORD_MAGIC = b'TAC3DREC'
+_RECORD_VERSION = 1
+_FILE_HEAD = struct.Struct('<8sII')  # magic, version, 头部JSON长度
+_INDEX_TAIL = struct.Struct('<QQ8s')  # 索引偏移, 帧数, magic
+_INDEX_MAGIC = b'TAC3DIDX'
+_CHUNK_HEAD = struct.Struct('<4sII')  # magic, 帧数, 压缩后长度
+_CHUNK_MAGIC = b'TCHK'
+_DATA_ALIGN = 64
+
+_BASE_FIELDS = [('SN', 'S32'), ('index', '<i8'), ('sendTimestamp', '<f8'), ('recvTimestamp', '<f8')]
+_INDEX_DTYPE = np.dtype([('SN', 'S32'), ('index', '<i8'), ('sendTimestamp', '<f8'), ('offset', '<u8')])
+
+def _recordDtype(fields):
+    # 每帧为一条定长记录：帧头标量之后依次为各数据字段
+    items = list(_BASE_FIELDS)
+    for field in fields:
+        if field['type'] == 'mat':
+            items.append((field['name'], '<f8', tuple(field['shape'])))
+        elif field['type'] == 'f64':
+            items.append((field['name'], '<f8'))
+        elif field['type'] == 'i32':
+            items.append((field['name'], '<i4'))
+    return np.dtype(items)
+
+def _fieldsOf(frame, names):
+    # 根据数据帧推断字段布局，图像等不定长数据不支持记录
+    fields = []
+    for name in (names if not names is None else frame.keys()):
+        if name in PyTac3D.Frame._baseKeys:
+            continue
+        value = frame[name]
+        if isinstance(value, np.ndarray) and value.dtype == np.float64 and value.ndim == 2:
+            fields.append({'name': name, 'type': 'mat', 'shape': list(value.shape)})
+        elif isinstance(value, float):
+            fields.append({'name': name, 'type': 'f64'})
+        elif isinstance(value, int) and not isinstance(value, bool):
+            fields.append({'name': name, 'type': 'i32'})
+        elif not names is None:
+            raise ValueError('Field %s can not be recorded.' % name)
+    return fields
+
+class Recorder:
+    '''
+    将触觉数据帧以二进制形式记录到文件中，可直接作为回调函数使用：
+    sensor.registerCallback(SN, recorder.write)
+
+    文件由三部分组成：
+    1. 文件头：magic、版本号和描述字段布局的JSON（字段名、类型、矩阵形状、记录长度）
+    2. 数据区：每帧一条定长记录（SN、index、sendTimestamp、recvTimestamp及各数据字段），
+       连续存放，每积累chunkSize帧以一次写操作写入
+    3. 索引：每帧的(SN, index, sendTimestamp, offset)，在close()时写在文件末尾
+    未正常关闭的文件缺少索引，RecordReader会根据数据区中的记录重建索引。
+    使用压缩时数据区由各自独立压缩的数据块组成（块头为magic、帧数和压缩后
+    长度），索引中的offset为该帧所在数据块的块头位置。
+    '''
+
+    COMPRESSIONS = (None, 'zlib')
+
+    def __init__(self, path, fields = None, chunkSize = 64, compression = None, compressLevel = 1):
+        '''
+        Parameters
+        ----------
+        path: 字符串
+            记录文件路径，已存在的文件将被覆盖
+        fields: 字符串列表
+            需要记录的数据名称，例如['3D_Positions', '3D_Forces']。为None时
+            记录第一帧中所有的矩阵和标量数据。同一文件中各帧的数据布局须相同
+        chunkSize: 整形
+            每次写入文件的帧数
+        compression: 字符串
+            None（默认）不压缩，RecordReader可直接返回文件映射上的视图；
+            'zlib'按数据块压缩，读取时需要解压
+        compressLevel: 整形
+            zlib压缩等级（1~9）
+        '''
+        if not compression in Recorder.COMPRESSIONS:
+            raise ValueError('Unknown compression: %s' % compression)
+        self._compression = compression
+        self._compressLevel = compressLevel
+        self._file = open(path, 'wb')
+        self._names = None if fields is None else list(fields)
+        self._chunkSize = max(1, chunkSize)
+        self._fields = None
+        self._chunk = None
+        self._chunkLen = 0
+        self._index = np.empty(1024, dtype=_INDEX_DTYPE)
+        self._count = 0
+        self._chunkOffset = 0
+        self._lock = threading.Lock()
+        self.bytesWritten = 0
+        self.closed = False
+
+    def write(self, frame, param = None):
+        '''
+        记录一帧数据帧。数据被复制到内存中的写入块，调用返回后即可释放该数据帧。
+        Parameters
+        ----------
+        frame: 触觉数据帧
+            Sensor产生的数据帧（字典或PyTac3D.Frame）
+        param: 任意
+            未使用，仅为兼容回调函数的参数形式
+        '''
+        with self._lock:
+            if self.closed:
+                raise ValueError('Recorder is closed.')
+            if self._fields is None:
+                self._start(frame)
+            i = self._chunkLen
+            columns = self._columns
+            try:
+                for name, column in columns:
+                    column[i] = frame[name]
+            except KeyError as e:
+                raise ValueError('The frame has no field %s.' % e) from None
+            entry = self._index[self._count] if self._count < len(self._index) else self._growIndex()
+            entry['SN'] = frame['SN']
+            entry['index'] = frame['index']
+            entry['sendTimestamp'] = frame['sendTimestamp']
+            entry['offset'] = self._chunkOffset if self._compression else self._dataStart + self._count * self._recordDtype.itemsize
+            self._count += 1
+            self._chunkLen += 1
+            if self._chunkLen == self._chunkSize:
+                self._flushChunk()
+
+    def flush(self):
+        '''
+        将已记录但尚未写入的数据帧写入文件。
+        '''
+        with self._lock:
+            if not self.closed and self._chunkLen > 0:
+                self._flushChunk()
+                self._file.flush()
+
+    def close(self):
+        '''
+        写入剩余的数据帧和索引，并关闭文件。
+        '''
+        with self._lock:
+            if self.closed:
+                return
+            if self._fields is None:
+                self._writeHead([])
+            if self._chunkLen > 0:
+                self._flushChunk()
+            indexOffset = self._file.tell()
+            self._write(self._index[:self._count].data)
+            self._write(_INDEX_TAIL.pack(indexOffset, self._count, _INDEX_MAGIC))
+            self._file.close()
+            self.closed = True
+
+    def __len__(self):
+        return self._count
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self.close()
+
+    def _start(self, frame):
+        fields = _fieldsOf(frame, self._names)
+        self._writeHead(fields)
+        self._chunk = np.zeros(self._chunkSize, dtype=self._recordDtype)
+        self._columns = [(name, self._chunk[name]) for name in self._recordDtype.names]
+
+    def _writeHead(self, fields):
+        self._fields = fields
+        self._recordDtype = _recordDtype(fields)
+        head = json.dumps({'version': _RECORD_VERSION,
+                           'PyTac3D': PyTac3D.PYTAC3D_VERSION,
+                           'created': time.time(),
+                           'recordSize': self._recordDtype.itemsize,
+                           'compression': self._compression,
+                           'fields': fields,
+                           }).encode('utf-8')
+        headLen = _FILE_HEAD.size + len(head)
+        self._dataStart = (headLen + _DATA_ALIGN - 1) // _DATA_ALIGN * _DATA_ALIGN
+        self._chunkOffset = self._dataStart
+        self._write(_FILE_HEAD.pack(_RECORD_MAGIC, _RECORD_VERSION, len(head)))
+        self._write(head)
+        self._write(bytes(self._dataStart - headLen))
+
+    def _flushChunk(self):
+        data = self._chunk[:self._chunkLen].data
+        if self._compression:
+            data = zlib.compress(data, self._compressLevel)
+            self._write(_CHUNK_HEAD.pack(_CHUNK_MAGIC, self._chunkLen, len(data)))
+        self._write(data)
+        self._chunkOffset = self._file.tell()
+        self._chunkLen = 0
+
+    def _write(self, data):
+        self._file.write(data)
+        self.bytesWritten += len(data) if isinstance(data, bytes) else data.nbytes
+
+    def _growIndex(self):
+        index = np.empty(len(self._index) * 2, dtype=_INDEX_DTYPE)
+        index[:self._count] = self._index[:self._count]
+        self._index = index
+        return index[self._count]
+
+class RecordSink:
+    '''
+    在独立的写线程中记录数据帧。write()只把数据帧放入有界队列，磁盘写入
+    和压缩都在写线程中按数据块成批进行，不会阻塞Sensor的解码线程。
+    可直接作为回调函数使用：sensor.registerCallback(SN, sink.write)
+    '''
+
+    def __init__(self, path, fields = None, chunkSize = 64, compression = None, compressLevel = 1, queueSize = 256, dropPolicy = 'drop-newest', copyFrames = False):
+        '''
+        Parameters
+        ----------
+        path, fields, chunkSize, compression, compressLevel:
+            同Recorder
+        queueSize: 整形
+            等待写入的数据帧队列的最大长度
+        dropPolicy: 字符串
+            写入速度跟不上、队列已满时的处理方式：
+            'drop-newest'：丢弃新的数据帧（默认，write()从不阻塞）
+            'drop-oldest'：丢弃队列中最早的数据帧
+            'block'：阻塞调用write()的线程直到队列有空位
+            丢弃的帧数和阻塞时间可通过RecordSink.stats()查询
+        copyFrames: 布尔型
+            为True时在write()中复制数据帧中的矩阵。Sensor使用zeroCopy或
+            pooledFrames且数据帧在回调函数返回后即被释放时需要设置为True
+        '''
+        self._recorder = Recorder(path, fields, chunkSize, compression, compressLevel)
+        self._ring = PyTac3D._FrameRing(queueSize, dropPolicy)
+        self._queueSize = max(1, queueSize)
+        self._copyFrames = copyFrames
+        self._received = 0
+        self._dropped = 0
+        self._maxQueued = 0
+        self._blockedTime = 0.0
+        self._written = 0
+        self._writeTime = 0.0
+        self._lock = threading.Lock()  # 统计量由调用write()的线程和写线程共同更新
+        self.error = None
+        self.closed = False
+
+        self._thread = threading.Thread(target = self._writeThread, args=())
+        self._thread.setDaemon(True)
+        self._thread.start()
+
+    def write(self, frame, param = None):
+        '''
+        将一帧数据帧放入写入队列。
+        Parameters
+        ----------
+        frame: 触觉数据帧
+            Sensor产生的数据帧（字典或PyTac3D.Frame）
+        param: 任意
+            未使用，仅为兼容回调函数的参数形式
+        Return
+        ----------
+        accepted: 布尔型
+            数据帧是否进入了写入队列（为False时该帧因队列已满被丢弃）
+        '''
+        if self._copyFrames:
+            frame = {key: value.copy() if isinstance(value, np.ndarray) else value for key, value in frame.items()}
+        startTime = time.perf_counter()
+        dropped = self._ring.put(frame)
+        blockedTime = time.perf_counter() - startTime
+        queued = len(self._ring)
+        with self._lock:
+            self._blockedTime += blockedTime
+            self._received += 1
+            if queued > self._maxQueued:
+                self._maxQueued = queued
+            if not dropped is None:
+                self._dropped += 1
+        return dropped is not frame
+
+    def stats(self):
+        '''
+        获取记录状态与背压信息。
+        Return
+        ----------
+        stats: 字典
+            {
+                "received": （整形）write()收到的数据帧数
+                "written": （整形）已交给Recorder写入的数据帧数
+                "dropped": （整形）因队列已满被丢弃的数据帧数
+                "queued": （整形）当前等待写入的数据帧数
+                "maxQueued": （整形）等待写入的数据帧数的最大值
+                "backpressure": （浮点数）当前队列占用率，0~1，持续接近1
+                    表示磁盘写入跟不上数据帧速率
+                "blockedTime": （浮点数）write()累计耗时（秒），'block'策略下
+                    主要为等待队列空位的时间
+                "writeTime": （浮点数）写线程累计写入耗时（秒）
+                "bytesWritten": （整形）已写入文件的字节数
+            }
+        '''
+        queued = len(self._ring)
+        with self._lock:
+            return {'received': self._received,
+                    'written': self._written,
+                    'dropped': self._dropped,
+                    'queued': queued,
+                    'maxQueued': self._maxQueued,
+                    'backpressure': queued / self._queueSize,
+                    'blockedTime': self._blockedTime,
+                    'writeTime': self._writeTime,
+                    'bytesWritten': self._recorder.bytesWritten,
+                    }
+
+    def close(self):
+        '''
+        停止接收数据帧，等待队列中的数据帧全部写入后关闭文件。
+        '''
+        if self.closed:
+            return
+        self.closed = True
+        self._ring.finish()
+        self._thread.join()
+        self._recorder.close()
+
+    def __len__(self):
+        return self._written
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self.close()
+
+    def _writeThread(self):
+        while True:
+            frame = self._ring.get()
+            if frame is None:
+                break
+            startTime = time.perf_counter()
+            try:
+                self._recorder.write(frame)
+            except Exception as e:
+                # 写入失败（如磁盘已满）后停止记录，后续数据帧全部丢弃
+                self.error = e
+                print('RecordSink stopped: %s' % e)
+                self._ring.finish()
+                while not self._ring.get() is None:
+                    with self._lock:
+                        self._dropped += 1
+                break
+            writeTime = time.perf_counter() - startTime
+            with self._lock:
+                self._writeTime += writeTime
+                self._written += 1
+
+class RecordReader:
+    '''
+    以内存映射方式读取Recorder记录的文件。读取时不解析数据，返回的矩阵
+    均为文件映射上的只读视图，在RecordReader关闭前有效。
+    压缩的记录文件需要按数据块解压，此时返回的是解压得到的数组而不是视图。
+    '''
+
+    def __init__(self, path):
+        '''
+        Parameters
+        ----------
+        path: 字符串
+            记录文件路径
+        '''
+        self._file = open(path, 'rb')
+        try:
+            self._mm = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self._file.close()
+            raise ValueError('%s is not a Tac3D record file.' % path) from None
+        if len(self._mm) < _FILE_HEAD.size:
+            self.close()
+            raise ValueError('%s is not a Tac3D record file (only %d bytes).' % (path, len(self._mm)))
+        magic, version, headLen = _FILE_HEAD.unpack_from(self._mm, 0)
+        if magic != _RECORD_MAGIC or version != _RECORD_VERSION:
+            self.close()
+            raise ValueError('%s is not a Tac3D record file (version %d).' % (path, _RECORD_VERSION))
+        try:
+            if len(self._mm) < _FILE_HEAD.size + headLen:
+                raise ValueError('truncated header')
+            self.header = json.loads(bytes(self._mm[_FILE_HEAD.size:_FILE_HEAD.size+headLen]).decode('utf-8'))
+        except ValueError:
+            self.close()
+            raise ValueError('%s has a damaged header.' % path) from None
+        self.fields = [field['name'] for field in self.header['fields']]
+        self._recordDtype = _recordDtype(self.header['fields'])
+        self._dataStart = (_FILE_HEAD.size + headLen + _DATA_ALIGN - 1) // _DATA_ALIGN * _DATA_ALIGN
+        self._scalars = [field['name'] for field in self.header['fields'] if field['type'] != 'mat']
+        self.compression = self.header.get('compression')
+        self._cachedChunk = (-1, None)
+
+        size = len(self._mm)
+        tail = _INDEX_TAIL.unpack_from(self._mm, size - _INDEX_TAIL.size) if size >= self._dataStart + _INDEX_TAIL.size else None
+        self.complete = not tail is None and tail[2] == _INDEX_MAGIC
+        dataEnd = tail[0] if self.complete else size
+        if self.compression:
+            self._records = None
+            self._scanChunks(dataEnd)
+            self._count = int(self._chunkStarts[-1])
+        else:
+            # 文件未正常关闭时按记录长度截取完整的记录
+            self._count = tail[1] if self.complete else max(0, size - self._dataStart) // self._recordDtype.itemsize
+            self._records = self._view(self._recordDtype, self._dataStart, self._count)
+        if self.complete:
+            self.index = self._view(_INDEX_DTYPE, tail[0], tail[1])
+        else:
+            self._rebuildIndex()
+
+    def __len__(self):
+        return self._count
+
+    def getSNs(self):
+        '''
+        获取文件中出现过的传感器SN码列表。
+        '''
+        return [SN.decode('ascii') for SN in np.unique(self.index['SN'])]
+
+    def findSN(self, SN):
+        '''
+        获取指定传感器的各帧在文件中的位置。
+        Return
+        ----------
+        positions: np.ndarray
+            该传感器各帧的帧位置（可用于getField、getFrame等函数）
+        '''
+        return np.flatnonzero(self.index['SN'] == SN.encode('ascii'))
+
+    def getField(self, name, start = 0, stop = None):
+        '''
+        获取一段帧范围内某一数据的全部值，不进行任何复制。
+        Parameters
+        ----------
+        name: 字符串
+            数据名称，例如'3D_Positions'，也可以是'index'、'sendTimestamp'、
+            'recvTimestamp'
+        start, stop: 整形
+            帧位置范围[start, stop)，stop为None时直到最后一帧
+        Return
+        ----------
+        values: np.ndarray
+            只读视图，矩阵数据的形状为(帧数, 行数, 列数)
+        '''
+        return self.getRecords(start, stop)[name]
+
+    def getRecords(self, start = 0, stop = None):
+        '''
+        获取一段帧范围内的全部记录，返回只读的结构化数组视图，
+        例如records['3D_Forces']、records['sendTimestamp']。
+        '''
+        if self._records is None:
+            return self._decompress(*slice(start, stop).indices(self._count)[:2])
+        return self._records[start:stop]
+
+    def getFrame(self, pos):
+        '''
+        以与Sensor.getFrame()相同的字典形式获取第pos帧，其中的矩阵为只读视图。
+        '''
+        if pos < 0:
+            pos += self._count
+        record = self._records[pos] if self._records is not None else self._decompress(pos, pos + 1)[0]
+        frame = {'SN': record['SN'].decode('ascii'),
+                 'index': int(record['index']),
+                 'sendTimestamp': float(record['sendTimestamp']),
+                 'recvTimestamp': float(record['recvTimestamp']),
+                 }
+        for name in self.fields:
+            frame[name] = record[name]
+        for name in self._scalars:
+            frame[name] = record[name].item()
+        return frame
+
+    def close(self):
+        self._records = None
+        self._cachedChunk = (-1, None)
+        self.index = None
+        try:
+            self._mm.close()
+        except BufferError:
+            # 仍有视图引用文件映射，由垃圾回收在其释放后关闭
+            pass
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self.close()
+
+    def _view(self, dtype, offset, count):
+        if count == 0:
+            return np.empty(0, dtype=dtype)
+        return np.ndarray(count, dtype=dtype, buffer=self._mm, offset=offset)
+
+    def _scanChunks(self, dataEnd):
+        # 依次读取各数据块的块头，不完整的数据块（文件未正常关闭）被忽略
+        offsets = []
+        counts = [0]
+        offset = self._dataStart
+        while offset + _CHUNK_HEAD.size <= dataEnd:
+            magic, count, length = _CHUNK_HEAD.unpack_from(self._mm, offset)
+            if magic != _CHUNK_MAGIC or offset + _CHUNK_HEAD.size + length > dataEnd:
+                break
+            offsets.append(offset)
+            counts.append(count)
+            offset += _CHUNK_HEAD.size + length
+        self._chunkOffsets = offsets
+        self._chunkStarts = np.cumsum(counts)
+
+    def _loadChunk(self, chunk):
+        if self._cachedChunk[0] != chunk:
+            offset = self._chunkOffsets[chunk]
+            count, length = _CHUNK_HEAD.unpack_from(self._mm, offset)[1:]
+            start = offset + _CHUNK_HEAD.size
+            data = zlib.decompress(self._mm[start:start+length])
+            records = np.frombuffer(data, dtype=self._recordDtype, count=count)
+            self._cachedChunk = (chunk, records)
+        return self._cachedChunk[1]
+
+    def _decompress(self, start, stop):
+        if start >= stop:
+            return np.empty(0, dtype=self._recordDtype)
+        first = int(np.searchsorted(self._chunkStarts, start, side='right')) - 1
+        last = int(np.searchsorted(self._chunkStarts, stop - 1, side='right')) - 1
+        parts = []
+        for chunk in range(first, last + 1):
+            chunkStart = self._chunkStarts[chunk]
+            parts.append(self._loadChunk(chunk)[max(start - chunkStart, 0):stop - chunkStart])
+        return parts[0] if len(parts) == 1 else np.concatenate(parts)
+
+    def _rebuildIndex(self):
+        # 文件未正常关闭，缺少索引：根据各帧记录重建
+        self.index = np.empty(self._count, dtype=_INDEX_DTYPE)
+        if self._records is None:
+            for chunk in range(len(self._chunkOffsets)):
+                part = self.index[self._chunkStarts[chunk]:self._chunkStarts[chunk+1]]
+                records = self._loadChunk(chunk)
+                for name in ('SN', 'index', 'sendTimestamp'):
+                    part[name] = records[name]
+                part['offset'] = self._chunkOffsets[chunk]
+            return
+        for name in ('SN', 'index', 'sendTimestamp'):
+            self.index[name] = self._records[name]
+        self.index['offset'] = self._dataStart + np.arange(self._count, dtype=np.uint64) * self._recordDtype.itemsize
+
+class ReplaySensor(PyTac3D.Sensor):
+    '''
+    将记录文件中的数据帧按记录时的节奏重新交付，接口与PyTac3D.Sensor相同
+    （recvCallback、getFrame、getLatest、registerCallback、stats等），
+    可在没有传感器的情况下运行和调试数据处理程序。
+    '''
+
+    def __init__(self, path, recvCallback = None, maxQSize = 5, callbackParam = None, speed = 1.0, loop = False, SN = None):
+        '''
+        Parameters
+        ----------
+        path: 字符串
+            Recorder记录的文件路径
+        recvCallback, maxQSize, callbackParam:
+            同PyTac3D.Sensor
+        speed: 浮点数
+            回放速度倍率，按记录时的recvTimestamp间隔交付数据帧。为None
+            或0时不等待，尽快交付全部数据帧
+        loop: 布尔型
+            为True时回放结束后从头重新开始
+        SN: 字符串
+            只回放指定传感器的数据帧，为None时回放全部数据帧
+        '''
+        self._initFrameQueues(recvCallback, maxQSize, callbackParam)
+        self._reader = RecordReader(path)
+        self._positions = np.arange(len(self._reader)) if SN is None else self._reader.findSN(SN)
+        self._speed = speed
+        self._loop = loop
+        self._startTime = time.time()
+        self._stopEvent = threading.Event()
+        self.finished = False
+
+        self._running = True
+        self._thread = threading.Thread(target = self._replayThread, args=())
+        self._thread.setDaemon(True)
+        self._thread.start()
+
+    def waitForFinish(self, timeout = None):
+        '''
+        阻塞等待回放结束（loop为True时只会因release()而结束）。
+        Return
+        ----------
+        finished: 布尔型
+            回放是否已经结束
+        '''
+        self._thread.join(timeout)
+        return self.finished
+
+    def releaseFrame(self, frame, copy = False):
+        pass
+
+    def release(self):
+        self._running = False
+        self._stopEvent.set()
+        if threading.current_thread() is not self._thread:
+            self._thread.join()
+        self._reader.close()
+
+    def _replayThread(self):
+        while self._running:
+            startTime = time.monotonic()
+            firstTimestamp = None
+            for pos in self._positions:
+                if not self._running:
+                    break
+                frame = self._reader.getFrame(pos)
+                if firstTimestamp is None:
+                    firstTimestamp = frame['recvTimestamp']
+                if self._speed:
+                    delay = startTime + (frame['recvTimestamp'] - firstTimestamp) / self._speed - time.monotonic()
+                    if delay > 0 and self._stopEvent.wait(delay):
+                        break
+                frame['recvTimestamp'] = time.time() - self._startTime
+                self._getStats(frame['SN'])['completed'] += 1
+                self._deliverFrame(frame, frame['SN'], None)
+            if not self._loop or len(self._positions) == 0:
+                break
+        self.finished = True
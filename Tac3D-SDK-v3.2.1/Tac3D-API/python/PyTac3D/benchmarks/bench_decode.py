@@ -0,0 +1,36 @@
+'''
+比较带帧头布局缓存的解码路径与逐帧完整YAML解析路径的解码速度（frames/s）。
+无需连接传感器或运行Tac3D-Desktop。
+
+用法: python bench_decode.py [帧数]
+'''
+import os
+import sys
+import time
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import PyTac3D
+from tac3d_packets import BuildFrame
+
+
+def Run(sensor, frames):
+    startTime = time.perf_counter()
+    for headBytes, dataBytes in frames:
+        sensor._decodeFrame(headBytes, dataBytes)
+    return len(frames) / (time.perf_counter() - startTime)
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) == 2 else 2000
+    frames = [BuildFrame(i, timestamp=i/30.0) for i in range(count)]
+    sensor = PyTac3D.Sensor(port=0)
+
+    sensor._headCodec = PyTac3D._HeadCodec(maxCacheSize=0)
+    fpsYAML = Run(sensor, frames)
+    sensor._headCodec = PyTac3D._HeadCodec()
+    fpsCached = Run(sensor, frames)
+    sensor.release()
+
+    print('full YAML parse : %10.1f frames/s' % fpsYAML)
+    print('cached layout   : %10.1f frames/s  (x%.1f, %d hits / %d misses)' % (
+        fpsCached, fpsCached / fpsYAML, sensor._headCodec.hits, sensor._headCodec.misses))
@@ -0,0 +1,67 @@
+'''
+在本机回环地址上测量UDP_Manager各接收方式从数据包发出到调用callback的延迟、
+每组最后一个数据包的延迟（即一帧数据帧完成重组的延迟）、接收线程每个数据包
+消耗的CPU时间，以及close()的耗时和接收线程是否退出：
+- recvInto：Sensor使用的方式，阻塞在带超时的recvfrom_into上，数据包读入
+  重复使用的预分配缓冲区
+- blocking：阻塞在带超时的recvfrom上，每个数据包分配一个bytes
+- polling：按frequency轮询的旧接收方式（原始版本的receive）
+数据包以突发的形式发送（每组burst个，与一帧Tac3D数据帧的数据包数相当）。
+
+用法: python bench_latency.py [数据包组数]
+'''
+import os
+import sys
+import time
+import socket
+import struct
+import threading
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import PyTac3D
+
+
+MODES = [
+    ('recvInto', {'recvInto': True}),
+    ('blocking', {'blocking': True}),
+    ('polling', {'blocking': False}),
+]
+
+def Measure(options, bursts, burst = 20, gap = 0.01):
+    count = bursts * burst
+    latencies = []
+    done = threading.Event()
+    cpu = [0.0]
+    def callback(data, addr):
+        latencies.append(time.perf_counter() - struct.unpack_from('d', data)[0])
+        if len(latencies) == count:
+            cpu[0] = time.thread_time()
+            done.set()
+
+    udp = PyTac3D.UDP_Manager(callback, isServer = True, ip = '127.0.0.1', port = 0, **options)
+    udp.start()
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    time.sleep(0.1)
+    payload = bytes(1392)
+    for i in range(bursts):
+        for j in range(burst):
+            sock.sendto(struct.pack('d', time.perf_counter()) + payload, udp.addr)
+        time.sleep(gap)
+    done.wait(5.0)
+    startTime = time.perf_counter()
+    udp.close()
+    closeTime = time.perf_counter() - startTime
+    sock.close()
+    latencies = np.array(latencies) * 1e6
+    return latencies, latencies[burst-1::burst], cpu[0] / max(1, len(latencies)) * 1e6, closeTime, udp.thread.is_alive()
+
+if __name__ == '__main__':
+    bursts = int(sys.argv[1]) if len(sys.argv) == 2 else 200
+    for name, options in MODES:
+        latencies, lastLatencies, cpu, closeTime, alive = Measure(options, bursts)
+        print('%-9s received %d/%d  packet p50 %7.1f us  p99 %7.1f us  burst end p50 %7.1f us  p99 %7.1f us  '
+              'CPU %5.1f us/packet  close() %.3f s%s' % (
+            name, len(latencies), bursts * 20, np.percentile(latencies, 50), np.percentile(latencies, 99),
+            np.percentile(lastLatencies, 50), np.percentile(lastLatencies, 99),
+            cpu, closeTime, '  (receive thread still alive)' if alive else ''))
@@ -0,0 +1,77 @@
+'''
+用合成数据包驱动PyTac3D.Sensor，测量完整接收路径（重组、解码、回调）的性能：
+帧率（frames/s）、从最后一个数据包发出到recvCallback被调用的延迟（p50/p99）、
+丢帧数以及接收进程每帧消耗的CPU时间。数据包发生器（tac3d_packets.py）运行在
+独立的进程中，不与Sensor争用GIL。无需连接传感器或运行Tac3D-Desktop。
+
+用法: python bench_sensor.py [每项测试的时长（秒）]
+'''
+import os
+import sys
+import time
+import multiprocessing
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import PyTac3D
+from tac3d_packets import FIELDS, PacketGenerator
+
+
+# (传感器数, 每个传感器的帧率, 数据字段, Sensor参数)
+CASES = [
+    (1, 30, FIELDS, {}),
+    (1, 100, FIELDS, {}),
+    (2, 100, FIELDS, {}),
+    (4, 100, FIELDS, {}),
+    (4, 200, FIELDS, {}),
+    (4, 200, ['3D_Positions', '3D_ResultantForce'], {}),
+    (4, 200, FIELDS, {'pooledFrames': True}),
+]
+
+def Generate(port, SNs, rate, fields, duration, result):
+    generator = PacketGenerator(('127.0.0.1', port), SNs, rate, fields)
+    sendTimes = generator.run(duration)
+    generator.close()
+    result.put(sendTimes)
+
+def Run(count, rate, fields, options, duration):
+    SNs = ['HDL1-%04d' % (i + 1) for i in range(count)]
+    recvTimes = {}
+    def callback(frame, param):
+        recvTimes[(frame['SN'], frame['index'])] = time.perf_counter()
+        sensor.releaseFrame(frame)
+
+    sensor = PyTac3D.Sensor(recvCallback = callback, port = 0, **options)
+    port = sensor._UDP.addr[1]
+    result = multiprocessing.Queue()
+    process = multiprocessing.Process(target = Generate, args = (port, SNs, rate, fields, duration, result))
+    cpuStart = time.process_time()
+    process.start()
+    sendTimes = result.get()
+    process.join()
+    time.sleep(0.2)  # 等待最后几帧完成解码
+    cpuTime = time.process_time() - cpuStart
+    stats = sensor.stats()
+    sensor.release()
+
+    latencies = np.array([recvTimes[key] - sendTimes[key] for key in sendTimes if key in recvTimes]) * 1e6
+    received = len(latencies)
+    dropped = sum(item['dropped'] for item in stats.values())
+    return {'frames': received / duration,
+            'sent': len(sendTimes),
+            'received': received,
+            'lost': len(sendTimes) - received,
+            'dropped': dropped,
+            'p50': np.percentile(latencies, 50) if received else float('nan'),
+            'p99': np.percentile(latencies, 99) if received else float('nan'),
+            'cpu': cpuTime / received * 1e6 if received else float('nan'),
+            }
+
+if __name__ == '__main__':
+    duration = float(sys.argv[1]) if len(sys.argv) == 2 else 3.0
+    print('%-44s %9s %9s %8s %8s %10s %10s %10s' % ('case', 'frames/s', 'sent', 'lost', 'dropped', 'p50 (us)', 'p99 (us)', 'CPU (us)'))
+    for count, rate, fields, options in CASES:
+        name = '%d x %d Hz, %d fields%s' % (count, rate, len(fields), ''.join(', %s' % key for key in options))
+        result = Run(count, rate, fields, options, duration)
+        print('%-44s %9.1f %9d %8d %8d %10.1f %10.1f %10.1f' % (name, result['frames'], result['sent'], result['lost'],
+              result['dropped'], result['p50'], result['p99'], result['cpu']))
@@ -0,0 +1,97 @@
+'''
+合成的Tac3D数据包发生器，按Tac3D-Desktop的NetworkTransport_SDK格式发送数据帧：
+每个数据包以8字节的'=IHH'包头（帧序号、数据包数、包序号）开始，包序号为0的
+数据包携带YAML帧头，其余数据包按顺序携带数据区的各个片段。无需连接传感器或
+运行Tac3D-Desktop。
+'''
+import os
+import sys
+import socket
+import time
+import numpy as np
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import PyTac3D
+
+
+FIELDS = ['3D_Positions', '3D_Displacements', '3D_Forces', '3D_ResultantForce', '3D_ResultantMoment']
+
+def BuildFrame(index, SN='HDL1-0001', timestamp=0.0, fields=FIELDS, points=400, data=None):
+    '''
+    生成一帧数据帧的帧头和数据区。data为None时为各矩阵生成随机数据，
+    否则沿用给定的数据区（只更新帧头中的index和timestamp）。
+    '''
+    head = 'SN: %s\nindex: %d\ntimestamp: %r\ndata:\n' % (SN, index, timestamp)
+    mats = []
+    offset = 0
+    for name in fields:
+        height = 1 if name.startswith('3D_Resultant') else points
+        head += ('- name: %s\n  type: mat\n  dtype: f64\n  width: 3\n  height: %d\n'
+                 '  offset: %d\n  length: %d\n') % (name, height, offset, height * 24)
+        if data is None:
+            mats.append(np.random.rand(height, 3).tobytes())
+        offset += height * 24
+    head += '- name: InitializeProgress\n  type: f64\n  offset: %d\n  length: 8\n' % offset
+    if data is None:
+        mats.append(np.float64(100.0).tobytes())
+        data = b''.join(mats)
+    return head.encode('ascii'), data
+
+def Packetize(serialNum, head, data):
+    '''
+    将一帧数据帧拆分为数据包：包序号0为帧头，1~pktNum为数据区的各个片段。
+    '''
+    payloadSize = PyTac3D._PACKET_PAYLOAD_SIZE
+    pktNum = (len(data) + payloadSize - 1) // payloadSize
+    packets = [PyTac3D._PACKET_HEAD.pack(serialNum, pktNum, 0) + head]
+    for pktCount in range(1, pktNum + 1):
+        chunk = data[(pktCount - 1) * payloadSize:pktCount * payloadSize]
+        packets.append(PyTac3D._PACKET_HEAD.pack(serialNum, pktNum, pktCount) + chunk)
+    return packets
+
+class PacketGenerator:
+    '''
+    以固定帧率向addr发送各传感器的合成数据帧。sendTimes记录每帧最后一个
+    数据包发出的时刻（time.perf_counter()），以(SN, index)为键。
+    '''
+
+    def __init__(self, addr, SNs=('HDL1-0001',), rate=100.0, fields=FIELDS, points=400):
+        self.addr = addr
+        self.SNs = list(SNs)
+        self.interval = 1.0 / rate
+        self.fields = list(fields)
+        self.points = points
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF, 1 << 20)
+        # 每个传感器的数据区只生成一次，逐帧变化的只有帧头
+        self._data = {SN: BuildFrame(0, SN, 0.0, self.fields, points)[1] for SN in self.SNs}
+        self._serialNum = 0
+        self.sendTimes = {}
+        self.sent = 0
+
+    def sendFrame(self, SN, index, timestamp):
+        head, data = BuildFrame(index, SN, timestamp, self.fields, self.points, self._data[SN])
+        packets = Packetize(self._serialNum, head, data)
+        self._serialNum = (self._serialNum + 1) & 0xFFFFFFFF
+        for packet in packets:
+            self.sock.sendto(packet, self.addr)
+        self.sendTimes[(SN, index)] = time.perf_counter()
+        self.sent += 1
+
+    def run(self, duration):
+        '''
+        按帧率发送duration秒。发送时刻按绝对时间计算，不会因个别帧延迟而累积偏差。
+        '''
+        startTime = time.perf_counter()
+        frames = int(duration / self.interval)
+        for index in range(frames):
+            deadline = startTime + index * self.interval
+            delay = deadline - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            for SN in self.SNs:
+                self.sendFrame(SN, index, index * self.interval)
+        return self.sendTimes
+
+    def close(self):
+        self.sock.close()
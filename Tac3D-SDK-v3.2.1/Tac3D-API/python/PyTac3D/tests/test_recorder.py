@@ -0,0 +1,100 @@
+'''
+Recorder与RecordReader的往返测试：不压缩、zlib压缩以及缺少索引（文件未正常
+关闭）的记录文件均应读回与写入相同的数据。
+
+用法: python -m pytest tests
+'''
+import os
+import sys
+import numpy as np
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from PyTac3D_Recorder import Recorder, RecordReader, _FILE_HEAD, _INDEX_TAIL
+
+FIELDS = ['3D_Positions', '3D_Forces', 'InitializeProgress']
+
+
+def MakeFrames(count, SNs = ('HDL1-0001', 'HDL1-0002')):
+    rng = np.random.default_rng(0)
+    frames = []
+    for i in range(count):
+        frames.append({'SN': SNs[i % len(SNs)],
+                       'index': i // len(SNs),
+                       'sendTimestamp': i / 30.0,
+                       'recvTimestamp': i / 30.0 + 0.001,
+                       '3D_Positions': rng.random((400, 3)),
+                       '3D_Forces': rng.random((400, 3)),
+                       'InitializeProgress': 100,
+                       })
+    return frames
+
+
+def Record(path, frames, **kwargs):
+    with Recorder(str(path), fields=FIELDS, **kwargs) as recorder:
+        for frame in frames:
+            recorder.write(frame)
+    return path
+
+
+def CheckFrames(reader, frames):
+    assert len(reader) == len(frames)
+    assert reader.fields == FIELDS
+    for pos, frame in enumerate(frames):
+        recorded = reader.getFrame(pos)
+        for name in ('SN', 'index', 'sendTimestamp', 'recvTimestamp', 'InitializeProgress'):
+            assert recorded[name] == frame[name]
+        for name in ('3D_Positions', '3D_Forces'):
+            np.testing.assert_array_equal(recorded[name], frame[name])
+    np.testing.assert_array_equal(reader.getField('3D_Forces'), np.stack([frame['3D_Forces'] for frame in frames]))
+    assert reader.getSNs() == sorted(set(frame['SN'] for frame in frames))
+    np.testing.assert_array_equal(reader.findSN(frames[0]['SN']), np.arange(0, len(frames), 2))
+
+
+@pytest.mark.parametrize('compression', [None, 'zlib'])
+def test_roundtrip(tmp_path, compression):
+    frames = MakeFrames(150)
+    path = Record(tmp_path / 'record.tac3d', frames, chunkSize=32, compression=compression)
+    with RecordReader(str(path)) as reader:
+        assert reader.complete
+        assert reader.compression == compression
+        CheckFrames(reader, frames)
+        np.testing.assert_array_equal(reader.getRecords(40, 70)['index'], [frame['index'] for frame in frames[40:70]])
+
+
+@pytest.mark.parametrize('compression', [None, 'zlib'])
+def test_truncated_without_index(tmp_path, compression):
+    # 去掉索引及最后一帧的一部分，模拟写入过程中程序退出
+    frames = MakeFrames(150)
+    path = Record(tmp_path / 'record.tac3d', frames, chunkSize=32, compression=compression)
+    data = path.read_bytes()
+    indexOffset = _INDEX_TAIL.unpack_from(data, len(data) - _INDEX_TAIL.size)[0]
+    path.write_bytes(data[:indexOffset - 100])
+    with RecordReader(str(path)) as reader:
+        assert not reader.complete
+        # 不压缩时只丢弃不完整的最后一帧，压缩时整个不完整的数据块被忽略
+        kept = 149 if compression is None else 128
+        CheckFrames(reader, frames[:kept])
+
+
+def test_empty_recording(tmp_path):
+    path = Record(tmp_path / 'record.tac3d', [])
+    with RecordReader(str(path)) as reader:
+        assert reader.complete
+        assert len(reader) == 0
+        assert reader.getSNs() == []
+
+
+@pytest.mark.parametrize('size', [0, 10, _FILE_HEAD.size, _FILE_HEAD.size + 20])
+def test_short_file_raises_value_error(tmp_path, size):
+    path = Record(tmp_path / 'record.tac3d', MakeFrames(4))
+    path.write_bytes(path.read_bytes()[:size])
+    with pytest.raises(ValueError):
+        RecordReader(str(path))
+
+
+def test_not_a_record_file(tmp_path):
+    path = tmp_path / 'other.bin'
+    path.write_bytes(b'not a Tac3D record file at all')
+    with pytest.raises(ValueError):
+        RecordReader(str(path))